@@ -1,26 +1,163 @@
 import uasyncio
 import time
+import ujson
+import micropython
+from array import array
 from machine import Pin, Timer
+from micropython import const
 from Settings import Settings
 from LED_8SEG import LED_8SEG
-from queue import Queue
+from eventring import EventRing
+from deadlines import DeadlineScheduler
+from Mappings import MappingTable, BEHAVIORS, MAX_DURATION_MS, OP_ON_WHILE_ACTIVATED
+from RelayRegister import RelayRegister
+from Scenes import SceneTable, SceneSwitcher
+from Rules import RuleTable, RuleEngine, PRESS, RELEASE
+from Schedule import ScheduleTable, Scheduler
+import log
+import metrics
+
+micropython.alloc_emergency_exception_buf(100)
+
+EDGE_RELEASE = const(0)
+EDGE_PRESS = const(1)
+# Longest pulse (about 37 h): deadlines are int32 ms, and IOEngine packs
+# a pulse into a mailbox word as slot | ms << 3.
+MAX_PULSE_MS = const((1 << 27) - 1)
+
+def commands_from_json(data):
+    # Accepts [["set", 1], ["pulse", 2, 500]] or the same as objects:
+    # [{"op": "set", "relay": 1}, {"op": "pulse", "relay": 2, "ms": 500}].
+    if isinstance(data, dict):
+        data = data.get('ops', ())
+    commands = []
+    for item in data:
+        if isinstance(item, dict):
+            commands.append((item.get('op'), int(item.get('relay', 0)), int(item.get('ms', 0))))
+        else:
+            commands.append((item[0], int(item[1]), int(item[2]) if len(item) > 2 else 0))
+    return commands
+
+def compile_commands(commands):
+    # Validate a command batch and reduce it to bitmasks relative to the
+    # relay state it will be applied to: ((touched, set, clear, toggle),
+    # [(slot, ms), ...] pulses).  Raises ValueError on an invalid command.
+    touched = set_mask = clear_mask = toggle_mask = 0
+    pulses = {}
+    for command in commands:
+        op, relay_id = command[0], command[1]
+        if not 1 <= relay_id <= 8:
+            raise ValueError(f"Invalid relay ID: {relay_id}")
+        bit = 1 << (relay_id - 1)
+        pulses.pop(relay_id - 1, None)
+        if op == 'set' or op == 'pulse':
+            if op == 'pulse':
+                ms = command[2] if len(command) > 2 else 0
+                if not 0 < ms <= MAX_PULSE_MS:
+                    raise ValueError(f"Pulse on relay {relay_id} needs a duration of 1 to {MAX_PULSE_MS} ms")
+                pulses[relay_id - 1] = ms
+            set_mask |= bit
+            clear_mask &= ~bit
+            toggle_mask &= ~bit
+        elif op == 'clear':
+            clear_mask |= bit
+            set_mask &= ~bit
+            toggle_mask &= ~bit
+        elif op == 'toggle':
+            if set_mask & bit:
+                set_mask &= ~bit
+                clear_mask |= bit
+            elif clear_mask & bit:
+                clear_mask &= ~bit
+                set_mask |= bit
+            else:
+                toggle_mask ^= bit
+        else:
+            raise ValueError(f"Unknown relay command: {op}")
+        touched |= bit
+    return (touched, set_mask, clear_mask, toggle_mask), list(pulses.items())
+
+def rename_relay(config, old, new):
+    # A copy of config (as from Settings.read_mappings()) with every
+    # reference to relay name `old` changed to `new`.
+    def ref(name):
+        return new if name == old else name
+
+    def actions(do):
+        return [list(a) if a[0] == 'scene' else [a[0], ref(a[1])] + list(a[2:]) for a in do]
+
+    inputs = {}
+    for input_id, (names, duration, behavior) in config['inputs'].items():
+        inputs[input_id] = [ref(names) if isinstance(names, str) else [ref(n) for n in names], duration, behavior]
+    scenes = {}
+    for name, scene in config['scenes'].items():
+        scene = dict(scene)
+        scene['relays'] = {ref(r): state for r, state in scene['relays'].items()}
+        scenes[name] = scene
+    rules = []
+    for rule in config['rules']:
+        rule = dict(rule)
+        if 'relay' in rule:
+            rule['relay'] = ref(rule['relay'])
+        if 'if' in rule:
+            rule['if'] = {key: [ref(r) for r in refs] for key, refs in rule['if'].items()}
+        rule['do'] = actions(rule['do'])
+        rules.append(rule)
+    schedule = []
+    for entry in config['schedule']:
+        entry = dict(entry)
+        entry['do'] = actions(entry['do'])
+        schedule.append(entry)
+    return {'relays': config['relays'], 'inputs': inputs, 'scenes': scenes, 'rules': rules,
+            'interlocks': [[ref(r) for r in group] for group in config['interlocks']], 'schedule': schedule}
 
 class DN33C08:
+    RELAY_PINS = (13, 12, 28, 27, 26, 19, 17, 16)
+    INPUT_PINS = (3, 4, 5, 6, 7, 8, 14, 15)
+
     def __init__(self):
         self.led_display = LED_8SEG()
         self.display_task = None
         self.debounce = 300
         self.update_settings()
-        self.last_press_time = {}
-        self.last_release_time = {}
-        self.input_queue = Queue(maxsize=20)
+        # Start outside the debounce window so edges right after boot count.
+        start = time.ticks_add(time.ticks_ms(), -self.debounce - 1)
+        self.last_press_time = array('i', [start] * 9)
+        self.last_release_time = array('i', [start] * 9)
+        self.debounced_edges = 0
+        # ticks_ms (time since power-up) when inputs went live and when the
+        # first input was acted on; -1 until then.
+        self.boot_ready_ms = -1
+        self.first_response_ms = -1
+        self.reloads = 0
+        self.reload_us = -1  # last reload, from request to new mappings live
+        self.input_events = EventRing(32)
+        self.trace = None  # optional inputtrace.TraceRecorder, fed every raw edge
+        self.engine = None  # IOEngine running the real-time work on core 1, if any
+        self._reported_overflows = 0
         self.inputs = self._init_inputs()
         self.relays = self._init_relays()
         self.buttons = self._init_buttons()
-        self.timers = {}
-        self.input_output_mappings = {}
-        self._setup_mappings()
-        self.input_callbacks = {i: [] for i in range(1, 9)}
+        self.relay_register = RelayRegister(tuple(self.relays[relay_id] for relay_id in range(1, 9)), self.RELAY_PINS)
+        self._json = None
+        self._json_version = -1
+        # Deadline slots 0..7 belong to relays 1..8.
+        self.deadlines = DeadlineScheduler()
+        callback = self._timer_callback
+        for relay_id in self.relays:
+            self.deadlines.allocate(callback)
+        self._press_ops = (None, self._op_toggle, self._op_timed, self._op_timer_resets, self._op_on_while_activated)
+        self.mappings, scene_table, rule_table, schedule_table = self._setup_mappings()
+        self.scenes = SceneSwitcher(self, scene_table, Settings.scene_max_switches, Settings.scene_window_ms)
+        self.rules = RuleEngine(self, rule_table)
+        self.relay_register.interlocks = rule_table.interlocks
+        self.relay_register.gap_ms = Settings.interlock_gap_ms
+        self.relay_register.on_change = self.rules.relay_changed
+        self.relay_register.on_interlock = self._interlocked
+        self._gap_slot = self.deadlines.allocate(self._gap_done)
+        self.schedule = Scheduler(self, schedule_table)
+        self.input_callbacks = [None] * 9  # lists created on first registration
+        self._register_metrics()
         self.button_callbacks = {i: [] for i in range(4)}
         self.external_LED = Pin(25, Pin.OUT)
         self.timer_LED = Timer()
@@ -45,128 +182,224 @@ class DN33C08:
         self.input_config = Settings.inputs
 
     def _init_relays(self):
-        relay_pins = [13, 12, 28, 27, 26, 19, 17, 16]
-        return {i+1: Pin(pin, Pin.OUT) for i, pin in enumerate(relay_pins)}
+        return {i+1: Pin(pin, Pin.OUT) for i, pin in enumerate(self.RELAY_PINS)}
 
     def _init_inputs(self):
-        input_pins = [3, 4, 5, 6, 7, 8, 14, 15]
-        inputs = {}
-        for i, pin in enumerate(input_pins):
-            input_id = i + 1
-            input_pin = Pin(pin, Pin.IN, Pin.PULL_UP)
-            input_pin.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=lambda p, id=input_id: self.handle_interrupt(p, id))
-            inputs[input_id] = input_pin
-            self.last_press_time[input_id] = 0
-            self.last_release_time[input_id] = 0        
+        inputs = {i + 1: Pin(pin, Pin.IN, Pin.PULL_UP) for i, pin in enumerate(self.INPUT_PINS)}
+        self._input_pins = tuple(inputs[input_id] for input_id in range(1, 9))
+        self.scanner = None
+        if Settings.input_mode == 'scan':
+            try:
+                self.start_scanner(Settings.scan_period_ms, Settings.scan_press_ms, Settings.scan_release_ms)
+            except (ValueError, TypeError) as e:
+                log.error('%s, scanning inputs with the defaults', e)
+                self.start_scanner()
+        else:
+            self.attach_input_irqs()
         return inputs
 
+    def start_scanner(self, period_ms=2, press_ms=20, release_ms=40):
+        # Sample all inputs from the GPIO register every period_ms instead
+        # of taking an IRQ per edge; see lib/inputscan.py.
+        from inputscan import InputScanner
+        for input_pin in self._input_pins:
+            input_pin.irq(handler=None)
+        scanner = InputScanner(self._input_pins, self.INPUT_PINS, self._scanned_edge, period_ms, press_ms, release_ms)
+        self.scanner = scanner
+        if self.engine is None:
+            scanner.start()
+        metrics.counter('dn33c08_input_scans_total', 'Input register samples taken', lambda: scanner.samples)
+        metrics.counter('dn33c08_input_glitches_total', 'Input glitches absorbed by the scan debounce',
+                        lambda: scanner.rejected)
+        return scanner
+
+    # Called by the scanner with a debounced edge; same context rules as
+    # handle_interrupt().
+    def _scanned_edge(self, input_id, pressed):
+        now = time.ticks_us()
+        trace = self.trace
+        if trace is not None:
+            trace.edge(input_id, 0 if pressed else 1, now)
+        self.input_events.put(input_id, EDGE_PRESS if pressed else EDGE_RELEASE, now)
+
+    def attach_input_irqs(self, hard=False):
+        # IRQs are delivered on the core that attaches them; IOEngine calls
+        # this again from core 1 with hard=True.
+        # One bound handler shared by all pins instead of a closure per pin.
+        handler = self._input_irq
+        for input_pin in self._input_pins:
+            input_pin.irq(trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING, handler=handler, hard=hard)
+
+    def _input_irq(self, pin):
+        pins = self._input_pins
+        for i in range(8):
+            if pins[i] is pin:
+                self.handle_interrupt(pin, i + 1)
+                return
+
+    # IRQ context: no printing and no allocation, just debounce and record.
+    # Events carry ticks_us so the consumer can time the queueing delay.
     def handle_interrupt(self, pin, input_id):
-        print(f"Interrupt triggered for input {input_id}")
-        if pin.value() == 0:  # Falling edge (button pressed)
-            self.handle_pressed_interrupt(pin, input_id)
+        now = time.ticks_ms()
+        level = pin.value()
+        trace = self.trace
+        if trace is not None:
+            trace.edge(input_id, level, time.ticks_us())
+        if level == 0:  # Falling edge (button pressed)
+            last = self.last_press_time
+            edge = EDGE_PRESS
         else:  # Rising edge (button released)
-            self.handle_released_interrupt(pin, input_id)
-
-    def handle_pressed_interrupt(self, pin, input_id):
-        current_time = time.ticks_ms()
-        print(current_time - self.last_press_time[input_id], self.debounce, (current_time - self.last_press_time[input_id]) > self.debounce)
-        if (current_time - self.last_press_time[input_id]) > self.debounce:
-            self.last_press_time[input_id] = current_time
-            print(f'putting activate on the queue for {input_id}')
-            uasyncio.create_task(self.input_queue.put(('activate', input_id)))
-
-    def handle_released_interrupt(self, pin, input_id):
-        current_time = time.ticks_ms()
-        if (current_time - self.last_release_time[input_id]) > self.debounce:
-            self.last_release_time[input_id] = current_time
-            uasyncio.create_task(self.input_queue.put(('deactivate', input_id)))
+            last = self.last_release_time
+            edge = EDGE_RELEASE
+        if time.ticks_diff(now, last[input_id]) > self.debounce:
+            last[input_id] = now
+            self.input_events.put(input_id, edge, time.ticks_us())
+        else:
+            self.debounced_edges += 1
 
     async def process_input_queue(self):
-        print('starting processing input queue')
-        while True:
-            try:
-                print('in process input queue')
-                item = await self.input_queue.get()
-                if item is None:
-                    continue
-                if not isinstance(item, tuple) or len(item) != 2:
-                    continue
-                action, input_id = item
-                if action == 'activate':
-                    await self.handle_input_activation(input_id)
-                elif action == 'deactivate':
-                    await self.handle_input_deactivation(input_id)
-                else:
-                    print(f"Unknown action: {action}")
-            except Exception as e:
-                print(f"Error in process_input_queue: {e}")
-                print(f"Error occurred while processing item: {item}")
-                await uasyncio.sleep_ms(200)
-
+        self.boot_ready_ms = time.ticks_ms()
+        log.info('Input processing started %d ms after boot', self.boot_ready_ms)
+        # Relay timeouts are served by one task that lives as long as input processing.
+        deadline_task = uasyncio.create_task(self.deadlines.run())
+        events = self.input_events
+        try:
+            while True:
+                await events.wait()
+                while events.drain(self._dispatch_input_event, 16):
+                    await uasyncio.sleep_ms(0)
+                if events.overflows != self._reported_overflows:
+                    log.warning('Input events lost to ring overflow: %d', events.overflows - self._reported_overflows)
+                    self._reported_overflows = events.overflows
+        finally:
+            deadline_task.cancel()
+
+    def _dispatch_input_event(self, input_id, edge, ticks):
+        dequeued = time.ticks_us()
+        self.isr_latency.observe(time.ticks_diff(dequeued, ticks))
+        try:
+            if edge == EDGE_PRESS:
+                self._activate_input(input_id)
+            else:
+                self._deactivate_input(input_id)
+        except Exception as e:
+            log.error('Error processing input %d edge %d: %s', input_id, edge, e)
+        self.dispatch_latency.observe(time.ticks_diff(time.ticks_us(), dequeued))
+        if self.first_response_ms < 0:
+            self.first_response_ms = time.ticks_ms()
+            log.info('First input handled %d ms after boot', self.first_response_ms)
 
     async def handle_input_activation(self, input_id):
-        if input_id in self.input_output_mappings:
-            mapping = self.input_output_mappings[input_id]
-            output_id = mapping['output']
-            behavior = mapping['behavior']
-            duration = mapping['duration']
-
-            if behavior == 'Toggle':
-                current_state = self.relays[output_id].value()
-                self.relays[output_id].value(not current_state)
-                if output_id in self.timers:
-                    self.timers[output_id].deinit()
-                    self.timers.pop(output_id)
-            
-            elif behavior == 'Timed':
-                if not mapping['active']:
-                    # If not active, turn on and start timer
-                    self.relays[output_id].value(1)
-                    if output_id in self.timers:
-                        self.timers[output_id].deinit()
-                    self.timers[output_id] = Timer(mode=Timer.ONE_SHOT, period=duration, callback=lambda t: self._timer_callback(output_id))
-                    mapping['active'] = True
-                else:
-                    # If already active, turn off and cancel timer
-                    self.relays[output_id].value(0)
-                    if output_id in self.timers:
-                        self.timers[output_id].deinit()
-                        self.timers.pop(output_id)
-                    mapping['active'] = False
-            
-            elif behavior == 'Timer_resets':
-                self.relays[output_id].value(1)  # Turn on the relay
-                if output_id in self.timers:
-                    self.timers[output_id].deinit()
-                self.timers[output_id] = Timer(mode=Timer.ONE_SHOT, period=duration, callback=lambda t: self._timer_callback(output_id))
-                mapping['active'] = True
-            
-            elif behavior == 'On_while_activated':
-                self.relays[output_id].value(1)  # Turn on the relay
-                mapping['active'] = True
-
-            if self.input_callbacks.get(input_id, []):
-                for callback in self.input_callbacks.get(input_id, []):
-                    try:
-                        callback(input_id)
-                    except Exception as e:
-                        print(f"Error in activation callback for input {input_id}: {e}")
-
+        if self.engine is not None:
+            self.engine.post_input(input_id)
+        else:
+            self._activate_input(input_id)
 
     async def handle_input_deactivation(self, input_id):
-        if input_id in self.input_output_mappings:
-            mapping = self.input_output_mappings[input_id]
-            if mapping['behavior'] == 'On_while_activated':
-                output_id = mapping['output']
-                self.relays[output_id].value(0)
-                mapping['active'] = False
-
-        if self.input_callbacks.get(input_id, []):
-            for callback in self.input_callbacks.get(input_id, []):
+        self._deactivate_input(input_id)
+
+    def _activate_input(self, input_id):
+        self.rules.input_event(input_id, PRESS)
+        mappings = self.mappings
+        op = mappings.op[input_id]
+        if op:
+            self._press_ops[op](input_id, mappings.relay_mask[input_id], mappings.duration[input_id])
+        scenes = self.scenes
+        scene_id = scenes.table.input_scene[input_id]
+        if scene_id:
+            scenes.activate(scene_id)
+
+        callbacks = self.input_callbacks[input_id]
+        if callbacks:
+            for callback in callbacks:
+                try:
+                    callback(input_id)
+                except Exception as e:
+                    log.error('Error in activation callback for input %d: %s', input_id, e)
+
+    def _deactivate_input(self, input_id):
+        self.rules.input_event(input_id, RELEASE)
+        mappings = self.mappings
+        if mappings.op[input_id] == OP_ON_WHILE_ACTIVATED:
+            self._write_relays(mappings.relay_mask[input_id], 0)
+            self._set_active(input_id, 0)
+
+        callbacks = self.input_callbacks[input_id]
+        if callbacks:
+            for callback in callbacks:
                 try:
                     callback(input_id)
                 except Exception as e:
-                    print(f"Error in deactivation callback for input {input_id}: {e}")
+                    log.error('Error in deactivation callback for input %d: %s', input_id, e)
+
+    # Press handlers, indexed by behavior opcode through self._press_ops.
+    def _op_toggle(self, input_id, mask, duration):
+        self.relay_register.toggle(mask)
+        self._arm_relays(mask, 0)
+
+    def _op_timed(self, input_id, mask, duration):
+        if not self.mappings.active[input_id]:
+            # If not active, turn on and start timers
+            self._write_relays(mask, 1, duration)
+            self._set_active(input_id, 1)
+        else:
+            # If already active, turn off and cancel timers
+            self._write_relays(mask, 0)
+            self._set_active(input_id, 0)
+
+    def _op_timer_resets(self, input_id, mask, duration):
+        self._write_relays(mask, 1, duration)
+        self._set_active(input_id, 1)
+
+    def _op_on_while_activated(self, input_id, mask, duration):
+        self._write_relays(mask, 1, -1)
+        self._set_active(input_id, 1)
+
+    def _write_relays(self, mask, value, duration=0):
+        self.relay_register.write(mask, value)
+        self._arm_relays(mask, duration)
+
+    def _arm_relays(self, mask, duration):
+        # duration > 0 (re)arms each relay's timeout, 0 cancels it, < 0 leaves it alone.
+        if duration < 0:
+            return
+        deadlines = self.deadlines
+        if duration:
+            # A restarted timer is a visible change even if nothing switched.
+            self.relay_register.touch(mask)
+        r = 0
+        while mask:
+            if mask & 1:
+                if duration:
+                    deadlines.arm(r, duration)
+                else:
+                    deadlines.cancel(r)
+            mask >>= 1
+            r += 1
+
+    def _set_active(self, input_id, value):
+        mappings = self.mappings
+        if mappings.active[input_id] != value:
+            mappings.active[input_id] = value
+            self.relay_register.touch(mappings.relay_mask[input_id])
+
+    def _register_metrics(self):
+        self.isr_latency = metrics.histogram('dn33c08_isr_to_dequeue_us', 'Input IRQ to event dequeue')
+        self.dispatch_latency = metrics.histogram('dn33c08_dequeue_to_relay_us', 'Event dequeue to relay write')
+        events = self.input_events
+        register = self.relay_register
+        metrics.gauge('dn33c08_input_queue_high_water', 'Most input events queued at once', lambda: events.high_water)
+        metrics.counter('dn33c08_input_overflows_total', 'Input events dropped on a full queue', lambda: events.overflows)
+        metrics.counter('dn33c08_input_debounced_total', 'Input edges ignored by debouncing', lambda: self.debounced_edges)
+        metrics.counter('dn33c08_relay_switches_total', 'Relay state changes',
+                        lambda: [('relay="%d"' % (r + 1), n) for r, n in enumerate(register.switches)])
+        metrics.gauge('dn33c08_boot_inputs_ready_ms', 'Time from power-up to input processing', lambda: self.boot_ready_ms)
+        metrics.gauge('dn33c08_boot_first_response_ms', 'Time from power-up to the first input handled',
+                      lambda: self.first_response_ms)
+        metrics.gauge('dn33c08_relay_timers_armed', 'Relay timeouts running',
+                      lambda: sum(self.deadlines.armed(r) for r in range(8)))
+        self.reload_latency = metrics.histogram('dn33c08_reload_us', 'Config reload request to new mappings live')
+        metrics.counter('dn33c08_reloads_total', 'Config reloads applied', lambda: self.reloads)
 
     def _init_buttons(self):
         button_pins = [18, 20, 21, 22]
@@ -180,114 +413,324 @@ class DN33C08:
     def _button_handler(self, pin):
         for i, button in enumerate(self.buttons):
             if button is pin:
+                scene_id = self.scenes.table.button_scene[i + 1]
+                if scene_id:
+                    self.scenes.request(scene_id)
                 for callback in self.button_callbacks[i]:
                     callback(i + 1)  # Pass button_id (1-indexed) to callback
                 break
 
     def _setup_mappings(self):
-        for input_id, config in self.input_config.items():
-            relay_name, duration, behavior = config
-            try:
-                relay_id = self._get_relay_id_by_name(relay_name)
-            except ValueError:
-                print(f"Warning: No relay found for input {input_id}")
-                continue
-            self.register_input_output_mapping(input_id, relay_id, behavior, duration)
+        # The mapping, scene, rule and schedule tables for the loaded
+        # settings.  A settings.json that does not compile must not stop the
+        # board from booting: the relays and inputs of config.py are used
+        # instead, without scenes, rules or schedule, and the file is left
+        # alone for repair.
+        try:
+            return self._compile_settings()
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+            log.error('Invalid %s, using the defaults from config.py: %s', Settings.path, e)
+        Settings.reset_mappings()
+        self.relay_config = Settings.relays
+        self.input_config = Settings.inputs
+        return self._compile_settings()
+
+    def _compile_settings(self):
+        scene_table = SceneTable.compile(self.relay_config, Settings.scenes)
+        return (MappingTable.compile(self.relay_config, self.input_config), scene_table,
+                RuleTable.compile(self.relay_config, scene_table.ids, Settings.rules, Settings.interlocks),
+                ScheduleTable.compile(self.relay_config, scene_table.ids, Settings.schedule, Settings.latitude,
+                                      Settings.longitude, Settings.utc_offset_min))
 
     def _get_relay_id_by_name(self, name):
-        for relay_id, relay_name in self.relay_config.items():
-            if relay_name == name:
-                return relay_id
-        raise ValueError(f"No relay found with name: {name}")
-
-    def register_input_output_mapping(self, input_id, output_id, behavior, duration=None):
-        self.input_output_mappings[input_id] = {
-            'output': output_id,
-            'behavior': behavior,
-            'duration': duration,
-            'active': False,
-            'timer_task': None
-        }
+        relay_id = self.mappings.relay_ids.get(name)
+        if relay_id is None:
+            raise ValueError(f"No relay found with name: {name}")
+        return relay_id
+
+    def register_input_output_mapping(self, input_id, output_ids, behavior, duration=None):
+        # output_ids is a relay id or an iterable of relay ids.
+        if behavior not in BEHAVIORS[1:]:
+            raise ValueError(f"Unknown behavior: {behavior}")
+        if behavior in ('Timed', 'Timer_resets') and (not isinstance(duration, int)
+                                                     or not 0 < duration <= MAX_DURATION_MS):
+            raise ValueError(f"{behavior} needs a duration of 1 to {MAX_DURATION_MS} ms")
+        if isinstance(output_ids, int):
+            output_ids = (output_ids,)
+        mask = 0
+        for output_id in output_ids:
+            mask |= 1 << (output_id - 1)
+        self.mappings.bind(input_id, mask, BEHAVIORS.index(behavior), duration or 0)
+
+    def reload_settings(self, data=None):
+        # Apply new relay names, input mappings, scenes, rules and the
+        # schedule without a reboot: patched with data ({"relays": {id:
+        # name}, "inputs": {id: mapping or null}, "scenes": {name: scene or
+        # null}, "rules": [...], "interlocks": [...], "schedule": [...]},
+        # see Settings.read_mappings()), or re-read from settings.json when
+        # data is None.  The new tables are compiled and diffed here and
+        # swapped in whole between input events, so an invalid config
+        # raises ValueError and changes nothing.  Relay outputs and timers
+        # are never touched; inputs whose mapping did not change keep their
+        # `active` state, changed ones start inactive.
+        # Returns the changed input ids, renamed relay ids, changed scene
+        # names and whether the rules and the schedule changed.
+        started = time.ticks_us()
+        config = Settings.read_mappings(data)
+        relays, inputs, scenes = config['relays'], config['inputs'], config['scenes']
+        table = MappingTable.compile(relays, inputs)
+        scene_table = SceneTable.compile(relays, scenes)
+        rule_table = RuleTable.compile(relays, scene_table.ids, config['rules'], config['interlocks'])
+        # The schedule's heap is only rebuilt when something it uses changed.
+        schedule_changed = config['schedule'] != Settings.schedule
+        schedule_table = None
+        if schedule_changed or relays != self.relay_config or scenes != Settings.scenes:
+            schedule_table = ScheduleTable.compile(relays, scene_table.ids, config['schedule'], Settings.latitude,
+                                                   Settings.longitude, Settings.utc_offset_min)
+        tables = (table, scene_table, rule_table, schedule_table)
+        old = self.mappings
+        changed = 0
+        touched = 0
+        for input_id in range(1, len(table.op)):
+            if (table.op[input_id] != old.op[input_id] or table.relay_mask[input_id] != old.relay_mask[input_id]
+                    or table.duration[input_id] != old.duration[input_id]):
+                changed |= 1 << (input_id - 1)
+                touched |= table.relay_mask[input_id] | old.relay_mask[input_id]
+        renamed = 0
+        for relay_id in range(1, 9):
+            if relays.get(relay_id) != self.relay_config.get(relay_id):
+                renamed |= 1 << (relay_id - 1)
+        if self.engine is not None:
+            self.engine.post_call(lambda: self._swap_mappings(tables, changed, touched | renamed, started))
+        else:
+            self._swap_mappings(tables, changed, touched | renamed, started)
+        old_scenes = Settings.scenes
+        rules_changed = config['rules'] != Settings.rules or config['interlocks'] != Settings.interlocks
+        Settings.relays = self.relay_config = relays
+        Settings.inputs = self.input_config = inputs
+        Settings.scenes = scenes
+        Settings.rules = config['rules']
+        Settings.interlocks = config['interlocks']
+        Settings.schedule = config['schedule']
+        if data is not None:
+            Settings.save_later()
+        result = {'inputs': [i + 1 for i in range(8) if changed & (1 << i)],
+                  'relays': [r + 1 for r in range(8) if renamed & (1 << r)],
+                  'scenes': sorted(name for name in set(scenes) | set(old_scenes)
+                                   if scenes.get(name) != old_scenes.get(name)),
+                  'rules': rules_changed, 'schedule': schedule_changed}
+        log.info('Config reloaded: inputs changed %s, relays renamed %s, scenes changed %s, rules changed %s, '
+                 'schedule changed %s', result['inputs'], result['relays'], result['scenes'], rules_changed,
+                 schedule_changed)
+        return result
+
+    # Runs wherever inputs are dispatched (core 1 under IOEngine).
+    def _swap_mappings(self, tables, changed, touched, started):
+        table, scene_table, rule_table, schedule_table = tables
+        old = self.mappings
+        for input_id in range(1, len(table.active)):
+            if not changed & (1 << (input_id - 1)) and input_id < len(old.active):
+                table.active[input_id] = old.active[input_id]
+        self.mappings = table
+        self.scenes.table = scene_table
+        self.rules.table = rule_table
+        self.relay_register.interlocks = rule_table.interlocks
+        if schedule_table is not None:
+            self.schedule.set_table(schedule_table)
+        if touched:
+            self.relay_register.touch(touched)
+        self.reloads += 1
+        self.reload_us = time.ticks_diff(time.ticks_us(), started)
+        self.reload_latency.observe(self.reload_us)
 
     def switch_relay(self, relay_num, delay):
-        # Implement relay switching logic here, including delay handling
-        self.relay_states[relay_num] = 1 - self.relay_states[relay_num]
-        print(f'Relay {relay_num+1} switched to {"ON" if self.relay_states[relay_num] else "OFF"}')
+        # Implement delay handling here
+        self.relay_register.toggle(1 << relay_num)
+        log.info('Relay %d switched to %s', relay_num + 1, 'ON' if self.relay_register.get(relay_num + 1) else 'OFF')
 
     def set_relay_name(self, relay_num, name):
-        self.relay_names[relay_num] = name
-        
+        # Renames the relay in the input mappings, scenes, rules, interlocks
+        # and schedule as well, in one reload_settings(), so the saved
+        # settings keep compiling.  Raises ValueError for an empty name or
+        # one that another relay has.
+        old = self.relay_config.get(relay_num)
+        if not isinstance(name, str) or not name:
+            raise ValueError("Missing name")
+        if name == old:
+            return
+        if name in self.relay_config.values():
+            raise ValueError(f"Relay name already in use: {name}")
+        config = Settings.read_mappings({})
+        config['relays'][relay_num] = name
+        self.reload_settings(rename_relay(config, old, name))
+
     @property
     def relay_states(self):
-        print("Accessing relay_states property")
-        return [relay.value() for relay in self.relays.values()]
+        return self.relay_register.states()
 
     @property
     def _relay_names(self):
-        _relay_names = []
-        for relay_id, relay_name in self.relay_config.items():
-            _relay_names.append(relay_name)
-        return _relay_names
+        relay_config = self.relay_config
+        return [relay_config[relay_id] for relay_id in range(1, 9)]
 
     @property
     def relay_names(self):
         return self._relay_names
 
     def get_relay_state(self, relay_num):
-        print(f"Getting state for relay {relay_num}")
-        return self.relays[relay_num].value()
+        return self.relay_register.get(relay_num)
 
     def get_input_info(self, input_id):
-        if input_id in self.input_output_mappings:
-            mapping = self.input_output_mappings[input_id]
-            output_id = mapping['output']
+        mappings = self.mappings
+        if mappings.op[input_id]:
+            names = self.relay_names
             return {
-                'relay_name': self.relay_names[output_id - 1],
-                'behavior': mapping['behavior'],
-                'duration': mapping['duration'],
-                'active': mapping['active']
+                'relay_name': ', '.join(names[r - 1] for r in mappings.relays_of(input_id)),
+                'behavior': mappings.behavior(input_id),
+                'duration': mappings.duration[input_id],
+                'active': bool(mappings.active[input_id])
             }
         return None
 
-    def generate_relay_json(self):
-        print("Entering generate_relay_json")
-        result = {}
+    def generate_relay_json(self, relay_mask=0xFF):
+        result = {'version': self.relay_register.version}
+        names = self.relay_names
         for i in range(1, 9):
-            print(f"Processing relay {i}")
+            if not relay_mask & (1 << (i - 1)):
+                continue
             relay_info = {
-                'name': self.relay_names[i-1],
+                'name': names[i-1],
                 'state': self.get_relay_state(i),
                 'inputs': []
             }
-            for input_id, mapping in self.input_output_mappings.items():
-                if mapping['output'] == i:
-                    input_info = self.get_input_info(input_id)
-                    if input_info:
-                        relay_info['inputs'].append({
-                            'input_id': input_id,
-                            'behavior': input_info['behavior'],
-                            'duration': input_info['duration'],
-                            'active': input_info['active']
-                        })
+            for input_id in self.mappings.inputs_of(i):
+                input_info = self.get_input_info(input_id)
+                if input_info:
+                    relay_info['inputs'].append({
+                        'input_id': input_id,
+                        'behavior': input_info['behavior'],
+                        'duration': input_info['duration'],
+                        'active': input_info['active']
+                    })
             result[f'relay{i}'] = relay_info
         return result
 
-    def _timer_callback(self, output_id):
-        self.relays[output_id].value(0)  # Turn off the relay
-        if output_id in self.timers:
-            self.timers[output_id].deinit()
-            self.timers.pop(output_id)
-        for mapping in self.input_output_mappings.values():
-            if mapping['output'] == output_id:
-                mapping['active'] = False
+    def relay_json(self, since=-1):
+        # Serialized relay state, rebuilt only when the register version moves.
+        # With `since`, only relays changed after that version are included.
+        register = self.relay_register
+        if since >= 0:
+            changed = register.changed_since(since)
+            if changed is not None and changed != 0xFF:
+                return ujson.dumps(self.generate_relay_json(changed)).encode()
+        version = register.version
+        if self._json_version != version:
+            self._json = ujson.dumps(self.generate_relay_json()).encode()
+            self._json_version = version
+        return self._json
+
+    # Runs in the deadline scheduler task, not in IRQ context.
+    def _timer_callback(self, slot):
+        self.relay_register.write(1 << slot, 0)  # Turn off the relay
+        self._release_inputs(1 << slot)
+
+    # Called by the relay register whenever an interlock intervened.
+    def _interlocked(self, forced, held):
+        # Relays switched off by an interlock lose their timers and the
+        # inputs that turned them on, as if switched off directly.
+        if forced:
+            self._arm_relays(forced, 0)
+            self._release_inputs(forced)
+        if held:
+            self.deadlines.arm(self._gap_slot, self.relay_register.gap_ms)
+
+    def _gap_done(self, slot):
+        self.relay_register.release_held()
+
+    def _release_inputs(self, relay_mask):
+        # Clear `active` on every input driving one of the relays in relay_mask.
+        relay_inputs = self.mappings.relay_inputs
+        r = 1
+        while relay_mask:
+            if relay_mask & 1:
+                inputs = relay_inputs[r]
+                i = 1
+                while inputs:
+                    if inputs & 1:
+                        self._set_active(i, 0)
+                    inputs >>= 1
+                    i += 1
+            relay_mask >>= 1
+            r += 1
+
+    def apply_commands(self, commands):
+        # Apply a batch of (op, relay_id) or ('pulse', relay_id, ms) commands
+        # in one relay write.  Ops are 'set', 'clear', 'toggle' and 'pulse';
+        # later commands for a relay see the result of earlier ones.  The
+        # whole batch is validated first and rejected with ValueError if any
+        # command is invalid.  Returns the resulting relay bitmask, or None
+        # when an IOEngine applies it on the other core (see sync()).
+        return self.apply_compiled(*compile_commands(commands))
+
+    def apply_compiled(self, masks, pulses):
+        # Same as apply_commands() for an already compiled batch.
+        if self.engine is not None:
+            self.engine.post_commands(masks, pulses)
+            return None
+        return self.apply_masks(masks, pulses)
+
+    def apply_masks(self, masks, pulses):
+        # masks is (touched, set, clear, toggle) from compile_commands().
+        touched, set_mask, clear_mask, toggle_mask = masks
+        register = self.relay_register
+        # Timers first: a relay is never left switched on without its pulse.
+        pulsed = 0
+        for slot, ms in pulses:
+            self.deadlines.arm(slot, ms)
+            pulsed |= 1 << slot
+        self._arm_relays(touched & ~pulsed, 0)
+        new = ((register.state | set_mask) & ~clear_mask) ^ toggle_mask
+        register.update(set_mask=new & touched, clear_mask=~new & touched)
+        self._release_inputs(~new & touched)
+        return register.state
+
+    async def sync(self):
+        # Wait until everything posted to the IOEngine has been applied.
+        if self.engine is not None:
+            await self.engine.settled()
+
+    def activate_scene(self, name):
+        # Switch to a scene from Settings.scenes; staggered steps, if any,
+        # follow on their own.  Raises ValueError for an unknown scene.
+        scene_id = self.scenes.table.ids.get(name)
+        if scene_id is None:
+            raise ValueError(f"No scene named: {name}")
+        self.run_scene(scene_id)
+        log.info('Scene %s activated', name)
+
+    def run_scene(self, scene_id):
+        if self.engine is not None:
+            self.engine.post_scene(scene_id)
+        else:
+            self.scenes.activate(scene_id)
+
+    def clock_changed(self):
+        # The RTC was set; the schedule re-plans from the new time.
+        if self.engine is not None:
+            try:
+                self.engine.post_call(self.schedule.clock_changed)
+            except OSError:
+                pass  # the schedule notices within its max_sleep_ms
+        else:
+            self.schedule.clock_changed()
 
     def get_timer_remaining(self, relay_id):
-        if relay_id in self.timers:
-            return self.timers[relay_id].time()  # Returns remaining time in milliseconds
-        return 0
+        return self.deadlines.remaining(relay_id - 1)  # Remaining time in milliseconds
 
     def register_input_callback(self, input_id, callback):
         if 1 <= input_id <= 8:
+            if self.input_callbacks[input_id] is None:
+                self.input_callbacks[input_id] = []
             self.input_callbacks[input_id].append(callback)
         else:
             raise ValueError("Invalid input ID. Must be between 1 and 8.")
@@ -308,6 +751,95 @@ class DN33C08:
     def clear_display(self):
         self.led_display.clear_and_stop()
 
+    def register_routes(self, server):
+        # Relay endpoints used by relays_overview.html and HTTP clients.
+        server.route('GET', '/relay_states', self._http_relay_states)
+        server.route('POST', '/relays', self._http_relays)
+        server.route('GET', '/toggle_relay{relay}', self._http_toggle_relay)
+        server.route('GET', '/update_name{relay}', self._http_update_name)
+        server.route('POST', '/reload', self._http_reload)
+        server.route('GET', '/scenes', self._http_scenes)
+        server.route('POST', '/scenes/{name}', self._http_activate_scene)
+        server.route('GET', '/schedule', self._http_schedule)
+
+    def _http_relay_id(self, req):
+        relay_num = int(req.params['relay'])
+        if not 1 <= relay_num <= 8:
+            raise ValueError(f"Invalid relay ID: {relay_num}")
+        return relay_num
+
+    async def _http_relay_states(self, req):
+        req.send('200 OK', self.relay_json(int(req.query.get('since', -1))), 'application/json')
+
+    async def _http_relays(self, req):
+        body = await req.read_body()
+        try:
+            commands = commands_from_json(ujson.loads(body))
+        except (TypeError, IndexError, KeyError) as e:
+            raise ValueError(str(e))
+        self.apply_commands(commands)
+        await self.sync()
+        req.send('200 OK', self.relay_json(), 'application/json')
+
+    async def _http_toggle_relay(self, req):
+        relay_num = self._http_relay_id(req)
+        # Toggle through an input driving this relay, so its behavior applies
+        for input_id in self.mappings.inputs_of(relay_num):
+            await self.handle_input_activation(input_id)
+            log.info('Relay %d toggled via input %d', relay_num, input_id)
+            break
+        else:
+            # No input drives this relay: switch it directly
+            self.apply_commands((('toggle', relay_num),))
+            log.info('Relay %d toggled directly', relay_num)
+        await self.sync()
+        req.send('200 OK')
+
+    async def _http_reload(self, req):
+        # Empty body: re-read settings.json; otherwise a patch such as
+        # {"inputs": {"3": ["Kitchen", 60000, "Timed"], "7": null}}.
+        body = await req.read_body()
+        try:
+            result = self.reload_settings(ujson.loads(body) if body else None)
+        except TypeError as e:
+            raise ValueError(str(e))
+        await self.sync()
+        result['apply_us'] = self.reload_us
+        req.send('200 OK', ujson.dumps(result), 'application/json')
+
+    async def _http_scenes(self, req):
+        scenes = self.scenes
+        table = scenes.table
+        result = {'max_switches': scenes.max_switches, 'window_ms': scenes.window_ms,
+                  'pending': [r + 1 for r in range(8) if scenes.pending & (1 << r)], 'scenes': {}}
+        for scene_id in range(1, len(table.names)):
+            on, off = table.relays(scene_id)
+            result['scenes'][table.names[scene_id]] = {'on': on, 'off': off}
+        req.send('200 OK', ujson.dumps(result), 'application/json')
+
+    async def _http_activate_scene(self, req):
+        # Answers once the first step is applied, with the relay states then.
+        self.activate_scene(req.params['name'])
+        await self.sync()
+        req.send('200 OK', self.relay_json(), 'application/json')
+
+    async def _http_schedule(self, req):
+        # Next fire of every entry, in seconds since 1970 UTC, null for never
+        # (or before the clock is set).
+        schedule = self.schedule
+        result = {'time': time.time(), 'utc_offset_min': schedule.table.utc_offset, 'fired': schedule.fired,
+                  'missed': schedule.missed, 'next': [schedule.next_fire(n) for n in range(len(schedule.table.cron))]}
+        req.send('200 OK', ujson.dumps(result), 'application/json')
+
+    async def _http_update_name(self, req):
+        relay_num = self._http_relay_id(req)
+        name = req.query.get('name', '')
+        if not name:
+            raise ValueError("Missing name")
+        self.set_relay_name(relay_num, name)
+        log.info('Relay %d name updated to %s', relay_num, name)
+        req.send('200 OK')
+
 async def main():
     dn33c08 = DN33C08()
     io_task = uasyncio.create_task(dn33c08.process_input_queue())
@@ -335,13 +867,14 @@ async def main():
         print(dn33c08.relay_states)
         print(dn33c08.relay_names)
         print(dn33c08.get_relay_state(3))
-        print(dn33c08.generate_relay_json)
+        print(dn33c08.relay_json())
         print(dn33c08.get_timer_remaining(1))
         dn33c08.set_display('ABC1', '   .', 10000)
 
     async def queue_status():
         while True:
-            print(f"Queue size: {dn33c08.input_queue.qsize()}")
+            events = dn33c08.input_events
+            print(f"Input events pending: {events.count()}, high water: {events.high_water}, overflows: {events.overflows}")
             await uasyncio.sleep(5)
     queue_status_task = uasyncio.create_task(queue_status())
     try:
@@ -0,0 +1,83 @@
+import uasyncio
+
+
+class EventStream:
+    # Server-Sent Events fan-out for /events.  Each subscriber first gets
+    # the full relay state, then one `data:` event per change carrying only
+    # the relays that changed (the same shape as /relay_states?since=N).
+    # One task serializes each change once and writes it to every
+    # subscriber; a subscriber that cannot take a write within
+    # write_timeout_ms is dropped so it cannot stall the others.
+    def __init__(self, dn33c08, max_subscribers=4, keepalive_ms=20000, write_timeout_ms=2000):
+        self.dn33c08 = dn33c08
+        self.max_subscribers = max_subscribers
+        self.keepalive_ms = keepalive_ms
+        self.write_timeout_ms = write_timeout_ms
+        self._subscribers = []
+        self._joining = 0
+        self._flag = dn33c08.relay_register.subscribe()
+        self._version = dn33c08.relay_register.version
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def register_routes(self, server):
+        server.route('GET', '/events', self._http_events, stream=True)
+
+    async def _http_events(self, req):
+        await self.serve(req.reader, req.writer)
+
+    async def serve(self, reader, writer):
+        # Connections still being sent the state hold a slot too.
+        if len(self._subscribers) + self._joining >= self.max_subscribers:
+            writer.write(b'HTTP/1.0 503 Service Unavailable\r\nRetry-After: 30\r\n\r\n')
+            return
+        self._joining += 1
+        try:
+            writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n')
+            writer.write(b'retry: 5000\n')
+            # Changes made while the state is being sent reach no subscriber
+            # yet, so the full state goes out again until it is current.
+            register = self.dn33c08.relay_register
+            sent = -1
+            while sent != register.version:
+                sent = register.version
+                writer.write(b'data: ')
+                writer.write(self.dn33c08.relay_json())
+                writer.write(b'\n\n')
+                await writer.drain()
+        finally:
+            self._joining -= 1
+        self._subscribers.append(writer)
+        try:
+            # Browsers never send anything on an event stream; EOF means gone.
+            while await reader.read(64):
+                pass
+        except OSError:
+            pass
+        finally:
+            if writer in self._subscribers:
+                self._subscribers.remove(writer)
+
+    async def _send(self, payload):
+        for writer in list(self._subscribers):
+            try:
+                writer.write(payload)
+                await uasyncio.wait_for_ms(writer.drain(), self.write_timeout_ms)
+            except Exception:
+                if writer in self._subscribers:
+                    self._subscribers.remove(writer)
+
+    async def run(self):
+        register = self.dn33c08.relay_register
+        while True:
+            try:
+                await uasyncio.wait_for_ms(self._flag.wait(), self.keepalive_ms)
+            except uasyncio.TimeoutError:
+                if self._subscribers:
+                    await self._send(b': keepalive\n\n')
+                continue
+            since = self._version
+            self._version = register.version
+            if self._subscribers and since != self._version:
+                await self._send(b'data: ' + self.dn33c08.relay_json(since) + b'\n\n')
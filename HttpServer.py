@@ -0,0 +1,265 @@
+import time
+import uasyncio
+import log
+import metrics
+
+
+def unquote(s):
+    # Decode %XX escapes and '+' in a URL component (UTF-8).
+    if '%' not in s and '+' not in s:
+        return s
+    s = s.replace('+', ' ')
+    parts = s.split('%')
+    out = bytearray(parts[0].encode())
+    for part in parts[1:]:
+        try:
+            out.append(int(part[:2], 16))
+            out.extend(part[2:].encode())
+        except ValueError:
+            out.extend(b'%' + part.encode())
+    return out.decode()
+
+
+def parse_query(qs):
+    query = {}
+    for pair in qs.split('&'):
+        if pair:
+            key, _, value = pair.partition('=')
+            query[unquote(key)] = unquote(value)
+    return query
+
+
+class Request:
+    def __init__(self, server, reader, writer, method, path, query_string, headers, rest=b''):
+        self.server = server
+        self.reader = reader
+        self.rest = rest  # bytes read past the headers, the start of the body
+        self.writer = writer
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.headers = headers
+        self.params = {}
+        self._query = None
+
+    @property
+    def query(self):
+        if self._query is None:
+            self._query = parse_query(self.query_string)
+        return self._query
+
+    def header(self, name, default=''):
+        return self.headers.get(name, default)
+
+    async def read_body(self):
+        return await self.server.read_body(self)
+
+    def send(self, status, body=b'', content_type='text/plain'):
+        if isinstance(body, str):
+            body = body.encode()
+        if body:
+            self.writer.write(('HTTP/1.0 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\n\r\n'
+                               % (status, content_type, len(body))).encode())
+            self.writer.write(body)
+        else:
+            self.writer.write(('HTTP/1.0 %s\r\n\r\n' % status).encode())
+
+
+class HttpError(Exception):
+    def __init__(self, status, message=''):
+        super().__init__(message)
+        self.status = status
+
+
+class _Node:
+    # One path segment of the route table: literal children by name, then
+    # parameter children as (prefix, name, node), e.g. 'toggle_relay{relay}'.
+    def __init__(self):
+        self.children = {}
+        self.params = []
+        self.handlers = {}
+
+
+class HttpServer:
+    # HTTP/1.0 server with a route table compiled into a segment trie.
+    # Subsystems register their own routes:
+    #
+    #     server.route('GET', '/relay_states', handler)
+    #     server.route('GET', '/toggle_relay{relay}', handler)   # req.params['relay']
+    #
+    # Handlers are coroutines taking a Request; raising ValueError answers
+    # 400 with the message.  Routes registered with stream=True (event
+    # streams) stop counting against max_connections once routed.
+    #
+    # Every connection must deliver its request line and headers within
+    # header_timeout_ms and in at most max_header_bytes, and any body within
+    # body_timeout_ms.  Past max_connections, new connections get an
+    # immediate 503 without their request being read.
+    def __init__(self, max_connections=4, header_timeout_ms=5000, body_timeout_ms=5000,
+                 max_header_bytes=2048, max_body=1024):
+        self.max_connections = max_connections
+        self.header_timeout_ms = header_timeout_ms
+        self.body_timeout_ms = body_timeout_ms
+        self.max_header_bytes = max_header_bytes
+        self.max_body = max_body
+        self._root = _Node()
+        self._active = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.latency = metrics.histogram('http_request_us', 'HTTP request handling, including the response write')
+        metrics.gauge('http_connections', 'Open HTTP connections being served', lambda: self._active)
+        metrics.counter('http_rejected_total', 'Connections refused with 503', lambda: self.rejected)
+        metrics.counter('http_timeouts_total', 'Requests dropped for missing a read deadline', lambda: self.timeouts)
+
+    def route(self, method, pattern, handler, stream=False):
+        node = self._root
+        for segment in pattern.strip('/').split('/'):
+            if not segment:
+                continue
+            brace = segment.find('{')
+            if brace < 0:
+                node = node.children.setdefault(segment, _Node())
+                continue
+            prefix, name = segment[:brace], segment[brace + 1:-1]
+            for p, n, child in node.params:
+                if p == prefix and n == name:
+                    node = child
+                    break
+            else:
+                child = _Node()
+                node.params.append((prefix, name, child))
+                # Longer prefixes first, so the most specific match wins.
+                node.params.sort(key=lambda entry: -len(entry[0]))
+                node = child
+        node.handlers[method] = (handler, stream)
+
+    def match(self, path, params):
+        return self._match(self._root, path.strip('/').split('/') if path.strip('/') else [], 0, params)
+
+    def _match(self, node, segments, i, params):
+        if i == len(segments):
+            return node.handlers
+        segment = segments[i]
+        child = node.children.get(segment)
+        if child is not None:
+            found = self._match(child, segments, i + 1, params)
+            if found:
+                return found
+        for prefix, name, child in node.params:
+            if len(segment) > len(prefix) and segment.startswith(prefix):
+                found = self._match(child, segments, i + 1, params)
+                if found:
+                    params[name] = unquote(segment[len(prefix):])
+                    return found
+        return None
+
+    async def _read_head(self, reader):
+        # Reads in chunks until the blank line, so nothing grows past
+        # max_header_bytes, however long a single line is.  Returns the
+        # method, target, headers and whatever was read past the head.
+        limit = self.max_header_bytes
+        buf = bytearray()
+        while True:
+            end = buf.find(b'\r\n\r\n')
+            if end >= 0:
+                rest = bytes(buf[end + 4:])
+                break
+            if len(buf) >= limit:
+                raise HttpError('431 Request Header Fields Too Large')
+            chunk = await reader.read(min(256, limit + 4 - len(buf)))
+            if not chunk:
+                end = len(buf)
+                rest = b''
+                break
+            buf.extend(chunk)
+        if end > limit:
+            raise HttpError('431 Request Header Fields Too Large')
+        lines = bytes(buf[:end]).decode().split('\r\n')
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        parts = lines[0].split()
+        if len(parts) < 2:
+            raise HttpError('400 Bad Request')
+        return parts[0], parts[1], headers, rest
+
+    async def read_body(self, req):
+        length = int(req.header('content-length', '0') or 0)
+        if length > self.max_body:
+            raise HttpError('413 Payload Too Large')
+        if not length:
+            return b''
+        rest = req.rest
+        if len(rest) >= length:
+            return rest[:length]
+        return rest + await uasyncio.wait_for_ms(req.reader.readexactly(length - len(rest)), self.body_timeout_ms)
+
+    async def handle(self, reader, writer):
+        if self._active >= self.max_connections:
+            self.rejected += 1
+            writer.write(b'HTTP/1.0 503 Service Unavailable\r\nRetry-After: 1\r\n\r\n')
+            try:
+                await writer.drain()
+                # Take what the client already sent, or closing with unread
+                # data resets the connection and the 503 is lost.
+                await uasyncio.wait_for_ms(reader.read(512), 20)
+            except Exception:
+                pass
+            await writer.wait_closed()
+            return
+        self._active += 1
+        counted = True
+        started = None
+        try:
+            try:
+                method, target, headers, rest = await uasyncio.wait_for_ms(self._read_head(reader),
+                                                                           self.header_timeout_ms)
+            except uasyncio.TimeoutError:
+                self.timeouts += 1
+                return
+            started = time.ticks_us()
+            path, _, query_string = target.partition('?')
+            log.debug('Request: %s %s', method, target)
+            req = Request(self, reader, writer, method, path, query_string, headers, rest)
+            handlers = self.match(path, req.params)
+            if not handlers:
+                req.send('404 Not Found')
+                return
+            entry = handlers.get(method) or (handlers.get('GET') if method == 'HEAD' else None)
+            if entry is None:
+                req.send('405 Method Not Allowed')
+                return
+            handler, stream = entry
+            if stream:
+                self._active -= 1
+                counted = False
+                started = None
+            await handler(req)
+        except HttpError as e:
+            writer.write(('HTTP/1.0 %s\r\nContent-Type: text/plain\r\n\r\n%s' % (e.status, e)).encode())
+        except uasyncio.TimeoutError:
+            self.timeouts += 1
+        except ValueError as e:
+            writer.write(('HTTP/1.0 400 Bad Request\r\nContent-Type: text/plain\r\n\r\n%s' % e).encode())
+        except Exception as e:
+            log.error('Error handling request: %s', e)
+            writer.write(b'HTTP/1.0 500 Internal Server Error\r\n\r\n')
+        finally:
+            if counted:
+                self._active -= 1
+            try:
+                await writer.drain()
+            except OSError:
+                pass
+            if started is not None:
+                self.latency.observe(time.ticks_diff(time.ticks_us(), started))
+            await writer.wait_closed()
+            log.debug('Client disconnected')
+
+    async def start(self, host='0.0.0.0', port=80):
+        return await uasyncio.start_server(self.handle, host, port)
+
+    async def serve(self, host='0.0.0.0', port=80):
+        server = await self.start(host, port)
+        await server.wait_closed()
@@ -0,0 +1,219 @@
+import _thread
+import time
+import uasyncio
+from mailbox import Mailbox
+import log
+import metrics
+
+# Message kinds, in the low 3 bits of a message's first word; the rest of
+# the word is the sequence number.
+CMD_MASKS = 1  # w1 = set | clear << 8 | toggle << 16, w2 = touched | npulses << 8, then slot | ms << 3 per pulse
+CMD_INPUT = 2  # input_id: activate the input as if pressed
+CMD_CALL = 4  # no payload: run the callable left by post_call()
+CMD_SCENE = 5  # scene_id: activate the scene
+EVT_APPLIED = 1  # every command up to this sequence number has been applied
+EVT_LOST = 2  # input events lost to a full ring since the last report
+
+_SEQ_MASK = (1 << 26) - 1
+
+
+class IOEngine:
+    # Runs the real-time half of DN33C08 on the RP2040's second core: the
+    # input IRQs are attached there (hard IRQs, so a busy core 0 cannot
+    # delay them), or the input scanner is driven from there, and a tight
+    # loop drains the input ring, applies relay commands, fires relay
+    # deadlines and multiplexes the 8-segment display.
+    # Core 0 keeps the event loop with Wi-Fi, HTTP and MQTT.
+    #
+    # The cores talk through two lock-free Mailboxes.  Core 0 posts relay
+    # commands (DN33C08.apply_commands() and friends compile to bitmasks
+    # before posting) and gets back a sequence number; core 1 reports
+    # EVT_APPLIED with the latest sequence number it has applied, which
+    # settled() waits for, and EVT_LOST when the input ring overflowed.
+    # Acks are cumulative, so one that does not fit is simply sent later.
+    # RelayRegister subscribers are ThreadSafeFlags and are set directly
+    # from core 1.
+    #
+    # Everything that reacts to inputs, including input callbacks and relay
+    # deadline callbacks, runs on core 1 in this mode.
+    def __init__(self, dn33c08, poll_us=250, size=64):
+        self.dn33c08 = dn33c08
+        self.poll_us = poll_us
+        self.commands = Mailbox(size)  # core 0 -> core 1
+        self.events = Mailbox(size)  # core 1 -> core 0
+        self.flag = uasyncio.ThreadSafeFlag()
+        self._seq = 0  # last sequence number posted, core 0 only
+        self.acked = 0  # last sequence number reported applied, core 0 only
+        self._acked = uasyncio.Event()
+        self._applied = 0  # core 1 only
+        self._call = None  # set by post_call(), cleared by core 1
+        self.running = False
+        self.stopped = False
+        self.loops = 0
+        self.loop_max_us = 0
+        metrics.counter('ioengine_loops_total', 'Core 1 I/O loop iterations', lambda: self.loops)
+        metrics.gauge('ioengine_loop_max_us', 'Longest core 1 I/O loop iteration', lambda: self.loop_max_us)
+        metrics.counter('ioengine_mailbox_overflows_total', 'Messages that did not fit a core-to-core mailbox',
+                        lambda: [('direction="commands"', self.commands.overflows),
+                                 ('direction="events"', self.events.overflows)])
+
+    def start(self):
+        dn = self.dn33c08
+        dn.led_display.set_external_refresh()
+        dn.engine = self
+        self.running = True
+        _thread.start_new_thread(self._run, ())
+
+    def stop(self):
+        # Ends the core 1 loop; only used by the host benchmarks.
+        self.running = False
+        while not self.stopped:
+            time.sleep_ms(1)
+        self.dn33c08.engine = None
+
+    def _post(self, kind, *payload):
+        commands = self.commands
+        seq = (self._seq + 1) & _SEQ_MASK
+        if not commands.put(kind | seq << 3):
+            raise OSError("I/O engine mailbox full")
+        for word in payload:
+            if not commands.put(word):
+                commands.abort()
+                raise OSError("I/O engine mailbox full")
+        commands.commit()
+        self._seq = seq
+        return seq
+
+    def post_commands(self, masks, pulses):
+        touched, set_mask, clear_mask, toggle_mask = masks
+        words = [slot | ms << 3 for slot, ms in pulses]
+        return self._post(CMD_MASKS, set_mask | clear_mask << 8 | toggle_mask << 16,
+                          touched | len(words) << 8, *words)
+
+    def post_input(self, input_id):
+        return self._post(CMD_INPUT, input_id)
+
+    def post_scene(self, scene_id):
+        return self._post(CMD_SCENE, scene_id)
+
+    def post_call(self, fn):
+        # Run fn() on core 1 between input events.  One call at a time: the
+        # mailbox carries ints, so fn waits in a slot until core 1 takes it.
+        if self._call is not None:
+            raise OSError("I/O engine call pending")
+        self._call = fn
+        try:
+            return self._post(CMD_CALL)
+        except OSError:
+            self._call = None
+            raise
+
+    async def settled(self):
+        # Wait until core 1 has applied everything posted so far.
+        seq = self._seq
+        # Acks are cumulative and may skip numbers; compare modulo wrap.
+        while 0 < (seq - self.acked) & _SEQ_MASK < 1 << 25:
+            self._acked.clear()
+            await self._acked.wait()
+
+    async def pump(self):
+        # Core 0 side of the event mailbox.
+        events = self.events
+        while True:
+            await self.flag.wait()
+            while True:
+                word = events.get()
+                if word < 0:
+                    break
+                kind = word & 7
+                if kind == EVT_APPLIED:
+                    self.acked = word >> 3
+                    self._acked.set()
+                elif kind == EVT_LOST:
+                    log.warning('Input events lost to ring overflow: %d', word >> 3)
+
+    def _send(self, kind, value):
+        events = self.events
+        if not events.put(kind | value << 3):
+            return False
+        events.commit()
+        self.flag.set()
+        return True
+
+    def _take_commands(self):
+        commands = self.commands
+        dn = self.dn33c08
+        while True:
+            word = commands.get()
+            if word < 0:
+                return
+            kind = word & 7
+            try:
+                if kind == CMD_MASKS:
+                    w1 = commands.get()
+                    w2 = commands.get()
+                    pulses = []
+                    for _ in range(w2 >> 8):
+                        pulse = commands.get()
+                        pulses.append((pulse & 7, pulse >> 3))
+                    dn.apply_masks((w2 & 0xFF, w1 & 0xFF, (w1 >> 8) & 0xFF, (w1 >> 16) & 0xFF), pulses)
+                elif kind == CMD_INPUT:
+                    dn._activate_input(commands.get())
+                elif kind == CMD_SCENE:
+                    dn.scenes.activate(commands.get())
+                elif kind == CMD_CALL:
+                    fn = self._call
+                    self._call = None
+                    fn()
+            except Exception as e:
+                log.error('I/O engine command %d failed: %s', kind, e)
+            self._applied = word >> 3
+
+    # Core 1.
+    def _run(self):
+        dn = self.dn33c08
+        scanner = dn.scanner
+        if scanner is None:
+            dn.attach_input_irqs(hard=True)
+        else:
+            scanner.stop()
+        ring = dn.input_events
+        dispatch = dn._dispatch_input_event
+        deadlines = dn.deadlines
+        led = dn.led_display
+        tick_ms = led.tick_ms
+        poll_us = self.poll_us
+        commands = self.commands
+        acked = 0
+        lost = ring.overflows
+        dn.boot_ready_ms = time.ticks_ms()
+        next_refresh = next_scan = dn.boot_ready_ms
+        try:
+            while self.running:
+                started = time.ticks_us()
+                now = time.ticks_ms()
+                if scanner is not None and time.ticks_diff(now, next_scan) >= 0:
+                    scanner.scan()
+                    next_scan = time.ticks_add(now, scanner.period_ms)
+                ring.drain(dispatch)
+                if commands.count():
+                    self._take_commands()
+                deadlines.run_due()
+                if time.ticks_diff(now, next_refresh) >= 0:
+                    led.refresh_step()
+                    next_refresh = time.ticks_add(now, tick_ms)
+                if acked != self._applied and self._send(EVT_APPLIED, self._applied):
+                    acked = self._applied
+                if lost != ring.overflows and self._send(EVT_LOST, ring.overflows - lost):
+                    lost = ring.overflows
+                self.loops += 1
+                busy = time.ticks_diff(time.ticks_us(), started)
+                if busy > self.loop_max_us:
+                    self.loop_max_us = busy
+                time.sleep_us(poll_us)
+        finally:
+            if scanner is None:
+                dn.attach_input_irqs()
+            else:
+                scanner.start()
+            self.stopped = True
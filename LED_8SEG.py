@@ -1,38 +1,66 @@
+import time
+from array import array
 from machine import Pin, Timer
 
+# Segment patterns for ' ' (0x20) to 'z' (0x7A), indexed by ord(char) - 0x20.
+# A bytes constant stays in flash when the module is frozen or compiled to
+# .mpy, instead of every display building its own dict.
+_SEGMENTS = (
+    b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x80\x00\x00'  # ' ' to '/'
+    b'\x5f\x42\x9b\xd3\xc6\xd5\xdd\x43\xdf\xd7\x00\x00\x00\x00\x00\x00'  # '0' to '?'
+    b'\x00\xcf\xdc\x1d\xda\x9d\x8d\xdd\xce\x42\x52\xce\x1c\x4f\xc6\x5f'  # '@' to 'O'
+    b'\x8f\xd7\x86\xd5\x1e\x5e\x5e\x5e\xce\xd6\x9b\x00\x00\x00\x00\x00'  # 'P' to '_'
+    b'\x00\xdb\xdc\x98\xda\x9f\x8e\xd7\xcc\x40\x52\xce\x1c\x4f\xc4\xd8'  # '`' to 'o'
+    b'\x8f\xc7\x84\xd5\x1e\x58\x58\x58\xce\xd6\x9b'  # 'p' to 'z'
+)
+
 class LED_8SEG:
-    def __init__(self, latch=9, clock=10, data=11):
+    # Four multiplexed digits behind two 74HC595s: one 16-bit word per digit,
+    # digit select in the high byte, segments in the low byte.  set_buffer()
+    # precomputes the four words; the refresh timer shifts out one digit per
+    # tick and stops altogether while the display is blank.
+    #
+    # backend='spi' shifts the words out with hardware SPI1 (GP10 is SPI1
+    # SCK and GP11 SPI1 TX) instead of toggling the pins from Python.
+    #
+    # After set_external_refresh() the timer is not used: whoever owns the
+    # display (IOEngine on core 1) calls refresh_step() every tick_ms, and
+    # update_display() only asks it to push out all four words.
+    Dot = 0x20
+    BitsSelection = b'\xfe\xfd\xfb\xf7'
+
+    def __init__(self, latch=9, clock=10, data=11, backend='bitbang', tick_ms=3):
         self.latch = Pin(latch, Pin.OUT)
-        self.clock = Pin(clock, Pin.OUT)
-        self.data = Pin(data, Pin.OUT)
         self.latch(1)
-        self.clock(1)
-        self.data(1)
-        
-        self.Dot = 0x20
-        self.BitsSelection = [0xFE, 0xFD, 0xFB, 0xF7]
-        self.char_to_segments = {
-            '0': 0x5F, '1': 0x42, '2': 0x9B, '3': 0xD3, '4': 0xC6,
-            '5': 0xD5, '6': 0xDD, '7': 0x43, '8': 0xDF, '9': 0xD7,
-            'A': 0xCF, 'B': 0xDC, 'C': 0x1D, 'D': 0xDA, 'E': 0x9D,
-            'F': 0x8D, 'G': 0xDD, 'H': 0xCE, 'I': 0x42, 'J': 0x52,
-            'K': 0xCE, 'L': 0x1C, 'M': 0x4F, 'N': 0xC6, 'O': 0x5F,
-            'P': 0x8F, 'Q': 0xD7, 'R': 0x86, 'S': 0xD5, 'T': 0x1E,
-            'U': 0x5E, 'V': 0x5E, 'W': 0x5E, 'X': 0xCE, 'Y': 0xD6,
-            'Z': 0x9B,
-            'a': 0xDB, 'b': 0xDC, 'c': 0x98, 'd': 0xDA, 'e': 0x9F,
-            'f': 0x8E, 'g': 0xD7, 'h': 0xCC, 'i': 0x40, 'j': 0x52,
-            'k': 0xCE, 'l': 0x1C, 'm': 0x4F, 'n': 0xC4, 'o': 0xD8,
-            'p': 0x8F, 'q': 0xC7, 'r': 0x84, 's': 0xD5, 't': 0x1E,
-            'u': 0x58, 'v': 0x58, 'w': 0x58, 'x': 0xCE, 'y': 0xD6,
-            'z': 0x9B,
-            '-': 0x80, ' ': 0x00
-        }
-        self.buffer = [0] * 4
+        self.backend = backend
+        self.tick_ms = tick_ms
+        if backend == 'spi':
+            from machine import SPI
+            self.spi = SPI(1, baudrate=10000000, polarity=1, phase=1, sck=Pin(clock), mosi=Pin(data))
+            self._spi_words = [bytearray(2) for _ in range(4)]
+        elif backend == 'bitbang':
+            self.clock = Pin(clock, Pin.OUT)
+            self.data = Pin(data, Pin.OUT)
+            self.clock(1)
+            self.data(1)
+        else:
+            raise ValueError(f"Unknown display backend: {backend}")
+
+        self.buffer = bytearray(4)
+        self.frames = array('H', [0] * 4)
+        self._digit = 0
+        self._refresh_cb = self._refresh_tick
         self.refresh_timer = Timer(-1)
         self.clear_timer = Timer(-1)
+        self.refreshing = False
+        self.external_refresh = False
+        self._flush = 0  # words refresh_step() still has to send while blank
         self.current_content = ""
         self.current_dots = ""
+        # Refresh CPU accounting, only collected while profile is set.
+        self.profile = False
+        self.refresh_us = 0
+        self.refresh_ticks = 0
 
     def Send_Bytes(self, dat):
         for _ in range(8):
@@ -42,8 +70,25 @@ class LED_8SEG:
             self.clock(1)
 
     def write_cmd(self, Num, Seg):
-        self.Send_Bytes(Num)
-        self.Send_Bytes(Seg)
+        if self.backend == 'spi':
+            self.spi.write(bytes((Num, Seg)))
+        else:
+            self.Send_Bytes(Num)
+            self.Send_Bytes(Seg)
+        self.latch(0)
+        self.latch(1)
+
+    def _send_word(self, word, digit):
+        if self.backend == 'spi':
+            self.spi.write(self._spi_words[digit])
+        else:
+            data = self.data
+            clock = self.clock
+            for _ in range(16):
+                data(word & 0x8000)
+                word <<= 1
+                clock(0)
+                clock(1)
         self.latch(0)
         self.latch(1)
 
@@ -52,28 +97,68 @@ class LED_8SEG:
         self.current_dots = dots
         for i in range(4):
             if i < len(content):
-                char = content[i]
-                self.buffer[i] = self.char_to_segments.get(char, 0)
+                code = ord(content[i]) - 0x20
+                self.buffer[i] = _SEGMENTS[code] if 0 <= code < len(_SEGMENTS) else 0
             else:
                 self.buffer[i] = 0
 
             if i < len(dots) and dots[i] == '.':
                 self.buffer[i] |= self.Dot
+            word = (self.BitsSelection[i] << 8) | self.buffer[i]
+            self.frames[i] = word
+            if self.backend == 'spi':
+                self._spi_words[i][0] = word >> 8
+                self._spi_words[i][1] = word & 0xFF
+
+    def is_blank(self):
+        buffer = self.buffer
+        return not (buffer[0] or buffer[1] or buffer[2] or buffer[3])
 
     def start_refresh(self):
-        self.refresh_timer.init(period=12, mode=Timer.PERIODIC, callback=lambda t: self.update_display())
+        if self.is_blank():
+            self.stop_refresh()
+            self.update_display()
+            return
+        if not self.refreshing:
+            if not self.external_refresh:
+                self.refresh_timer.init(period=self.tick_ms, mode=Timer.PERIODIC, callback=self._refresh_cb)
+            self.refreshing = True
 
     def stop_refresh(self):
         self.refresh_timer.deinit()
+        self.refreshing = False
+
+    # Timer callback: light the next digit.
+    def _refresh_tick(self, timer):
+        if self.profile:
+            started = time.ticks_us()
+        digit = self._digit
+        self._send_word(self.frames[digit], digit)
+        self._digit = (digit + 1) & 3
+        if self.profile:
+            self.refresh_us += time.ticks_diff(time.ticks_us(), started)
+            self.refresh_ticks += 1
+
+    def set_external_refresh(self):
+        self.refresh_timer.deinit()
+        self.external_refresh = True
+        self._flush = 4
+
+    def refresh_step(self):
+        if self.refreshing or self._flush:
+            if self._flush:
+                self._flush -= 1
+            self._refresh_tick(None)
 
     def update_display(self):
+        if self.external_refresh:
+            self._flush = 4
+            return
         for i in range(4):
-            self.write_cmd(self.BitsSelection[i], self.buffer[i])
+            self._send_word(self.frames[i], i)
 
     def clear(self):
-        self.buffer = [0] * 4
-        self.current_content = ""
-        self.current_dots = ""
+        self.set_buffer("", "")
         self.update_display()
 
     def set_display(self, content, dots, duration_ms):
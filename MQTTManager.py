@@ -0,0 +1,254 @@
+import binascii
+import time
+import uasyncio
+import ujson
+import log
+import metrics
+from machine import unique_id
+from DN33C08 import commands_from_json
+
+_CONNECT = 0x10
+_CONNACK = 0x20
+_PUBLISH = 0x30
+_SUBSCRIBE = 0x82
+_PINGREQ = 0xC0
+_DISCONNECT = 0xE0
+
+
+def _length(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        out.append(byte | 0x80 if n else byte)
+        if not n:
+            return out
+
+
+def _string(s):
+    if isinstance(s, str):
+        s = s.encode()
+    return len(s).to_bytes(2, 'big') + s
+
+
+def _packet(header, body):
+    return bytes([header]) + _length(len(body)) + body
+
+
+class MQTTManager:
+    # MQTT 3.1.1 client (QoS 0) running as one uasyncio task.
+    #
+    # Each relay has a retained state topic, <prefix>/<n>/state = ON|OFF,
+    # published only when that relay switches; all changes seen in one
+    # wakeup go out with a single drain.  <prefix>/status is "online" while
+    # connected and the broker's will sets it to "offline" otherwise.
+    #
+    # Commands are read from <prefix>/<n>/set, where n is a relay number or
+    # name and the payload is ON, OFF, TOGGLE or a pulse length in ms, and
+    # from <prefix>/set with a JSON batch as accepted by POST /relays.
+    # Both go straight to DN33C08.apply_commands().  <prefix>/reload takes
+    # the same payload as POST /reload (empty to re-read settings.json), and
+    # <prefix>/scene a scene name to activate.
+    #
+    # Connection failures never block the loop: run() waits with an
+    # exponential backoff (1 s doubling to max_backoff_ms) and retries.
+    def __init__(self, dn33c08, broker, topic_prefix='pico/relay', port=1883, keepalive=60,
+                 user=None, password=None, client_id=None, max_backoff_ms=60000, timeout_ms=5000):
+        self.dn33c08 = dn33c08
+        self.broker = broker
+        self.port = port
+        self.prefix = topic_prefix
+        self.keepalive = keepalive
+        self.user = user
+        self.password = password
+        self.client_id = client_id or 'dn33c08-' + binascii.hexlify(unique_id()).decode()
+        self.max_backoff_ms = max_backoff_ms
+        self.timeout_ms = timeout_ms
+        self.connected = False
+        self.reconnects = 0
+        self.published = 0
+        self.received = 0
+        self._reader = None
+        self._writer = None
+        self._published_state = None
+        self._last_rx = 0
+        self._last_tx = 0
+        self._flag = dn33c08.relay_register.subscribe()
+        self.publish_latency = metrics.histogram('mqtt_publish_us', 'Publishing relay changes until written out')
+        metrics.counter('mqtt_publishes_total', 'Relay state messages published', lambda: self.published)
+        metrics.counter('mqtt_commands_total', 'Command messages received', lambda: self.received)
+        metrics.counter('mqtt_reconnects_total', 'Broker reconnect attempts', lambda: self.reconnects)
+        metrics.gauge('mqtt_connected', 'Connected to the broker', lambda: int(self.connected))
+
+    async def run(self):
+        backoff = 1000
+        while True:
+            try:
+                await self._connect()
+                backoff = 1000
+                await self._session()
+            except (OSError, EOFError, ValueError, uasyncio.TimeoutError) as e:
+                log.warning('MQTT connection lost: %s', e)
+            finally:
+                self._close()
+            self.reconnects += 1
+            log.info('MQTT reconnecting in %d ms', backoff)
+            await uasyncio.sleep_ms(backoff)
+            backoff = min(backoff * 2, self.max_backoff_ms)
+
+    async def _connect(self):
+        self._reader, self._writer = await uasyncio.wait_for_ms(
+            uasyncio.open_connection(self.broker, self.port), self.timeout_ms)
+        will = self.prefix + '/status'
+        flags = 0x02 | 0x04 | 0x20  # clean session, will, will retain
+        payload = _string(self.client_id) + _string(will) + _string('offline')
+        if self.user:
+            flags |= 0x80
+            payload += _string(self.user)
+            if self.password:
+                flags |= 0x40
+                payload += _string(self.password)
+        body = _string('MQTT') + bytes([4, flags]) + self.keepalive.to_bytes(2, 'big') + payload
+        self._writer.write(_packet(_CONNECT, body))
+        await self._writer.drain()
+        header, body = await uasyncio.wait_for_ms(self._read_packet(), self.timeout_ms)
+        if header != _CONNACK or body[1] != 0:
+            raise OSError(f"MQTT connect refused ({body[1] if len(body) > 1 else header})")
+        self.connected = True
+        self._last_rx = self._last_tx = time.ticks_ms()
+        self._send(_PUBLISH | 0x01, _string(will) + b'online')
+        topic = self.prefix + '/set'
+        self._send(_SUBSCRIBE, b'\x00\x01' + _string(topic) + b'\x00'
+                   + _string(self.prefix + '/+/set') + b'\x00'
+                   + _string(self.prefix + '/reload') + b'\x00'
+                   + _string(self.prefix + '/scene') + b'\x00')
+        self._published_state = None
+        log.info('MQTT connected to %s', self.broker)
+
+    async def _session(self):
+        reader = uasyncio.create_task(self._read_loop())
+        try:
+            interval = self.keepalive * 500
+            while True:
+                started = time.ticks_us()
+                if self._publish_changes():
+                    await self._writer.drain()
+                    self.publish_latency.observe(time.ticks_diff(time.ticks_us(), started))
+                else:
+                    await self._writer.drain()
+                try:
+                    await uasyncio.wait_for_ms(self._flag.wait(), interval)
+                except uasyncio.TimeoutError:
+                    pass
+                if reader.done():
+                    reader.result()
+                    raise EOFError('reader stopped')
+                now = time.ticks_ms()
+                if time.ticks_diff(now, self._last_rx) > self.keepalive * 1500:
+                    raise OSError('keepalive timeout')
+                if (time.ticks_diff(now, self._last_tx) >= interval
+                        or time.ticks_diff(now, self._last_rx) >= interval):
+                    self._send(_PINGREQ, b'')
+        finally:
+            reader.cancel()
+
+    def _publish_changes(self):
+        state = self.dn33c08.relay_register.state
+        old = self._published_state
+        changed = 0xFF if old is None else state ^ old
+        count = 0
+        r = 0
+        while changed:
+            if changed & 1:
+                topic = '%s/%d/state' % (self.prefix, r + 1)
+                self._send(_PUBLISH | 0x01, _string(topic) + (b'ON' if (state >> r) & 1 else b'OFF'))
+                count += 1
+            changed >>= 1
+            r += 1
+        self._published_state = state
+        self.published += count
+        return count
+
+    def publish(self, topic, payload, retain=False):
+        if not self.connected:
+            return False
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self._send(_PUBLISH | (0x01 if retain else 0), _string(topic) + payload)
+        return True
+
+    def _send(self, header, body):
+        self._writer.write(_packet(header, body))
+        self._last_tx = time.ticks_ms()
+
+    async def _read_packet(self):
+        header = (await self._reader.readexactly(1))[0]
+        length = 0
+        shift = 0
+        while True:
+            byte = (await self._reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        body = await self._reader.readexactly(length) if length else b''
+        self._last_rx = time.ticks_ms()
+        return header, body
+
+    async def _read_loop(self):
+        try:
+            while True:
+                header, body = await self._read_packet()
+                if header & 0xF0 == _PUBLISH:
+                    n = int.from_bytes(body[:2], 'big')
+                    topic = body[2:2 + n].decode()
+                    start = 2 + n + (2 if header & 0x06 else 0)
+                    self.received += 1
+                    self._on_message(topic, bytes(body[start:]))
+        finally:
+            # Wake _session() so it notices the dead connection now.
+            self._flag.set()
+
+    def _on_message(self, topic, payload):
+        try:
+            if topic == self.prefix + '/reload':
+                # Same as POST /reload; the changes are published to <prefix>/reload/result.
+                result = self.dn33c08.reload_settings(ujson.loads(payload) if payload else None)
+                self.publish(self.prefix + '/reload/result', ujson.dumps(result).encode())
+                return
+            if topic == self.prefix + '/scene':
+                self.dn33c08.activate_scene(payload.decode())
+                return
+            if topic == self.prefix + '/set':
+                commands = commands_from_json(ujson.loads(payload))
+            else:
+                name = topic[len(self.prefix) + 1:-4]
+                relay_id = int(name) if name.isdigit() else self.dn33c08._get_relay_id_by_name(name)
+                command = payload.upper()
+                if command in (b'ON', b'1'):
+                    commands = (('set', relay_id),)
+                elif command in (b'OFF', b'0'):
+                    commands = (('clear', relay_id),)
+                elif command == b'TOGGLE':
+                    commands = (('toggle', relay_id),)
+                else:
+                    commands = (('pulse', relay_id, int(payload)),)
+            self.dn33c08.apply_commands(commands)
+        except (ValueError, TypeError, IndexError, KeyError, OSError) as e:
+            log.warning('MQTT command on %s ignored: %s', topic, e)
+
+    def _close(self):
+        self.connected = False
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except OSError:
+                pass
+        self._reader = self._writer = None
+
+    async def disconnect(self):
+        if self.connected:
+            self._send(_PUBLISH | 0x01, _string(self.prefix + '/status') + b'offline')
+            self._send(_DISCONNECT, b'')
+            await self._writer.drain()
+        self._close()
@@ -0,0 +1,100 @@
+from array import array
+from micropython import const
+
+OP_NONE = const(0)
+OP_TOGGLE = const(1)
+OP_TIMED = const(2)
+OP_TIMER_RESETS = const(3)
+OP_ON_WHILE_ACTIVATED = const(4)
+
+# Indexed by opcode.
+BEHAVIORS = ('', 'Toggle', 'Timed', 'Timer_resets', 'On_while_activated')
+
+# Longest relay timeout, as for pulses: deadlines are int32 ms.
+MAX_DURATION_MS = const((1 << 27) - 1)
+
+
+class MappingTable:
+    # Input/relay mappings compiled to flat tables indexed by input id:
+    # a behavior opcode, a bitmask of driven relays (bit 0 is relay 1) and a
+    # duration.  relay_inputs holds the reverse bitmask per relay id.
+    def __init__(self, input_count=8, relay_count=8):
+        self.op = bytearray(input_count + 1)
+        self.relay_mask = bytearray(input_count + 1)
+        self.duration = array('i', [0] * (input_count + 1))
+        self.active = bytearray(input_count + 1)
+        self.relay_inputs = bytearray(relay_count + 1)
+        self.relay_count = relay_count
+        self.relay_ids = {}
+
+    @classmethod
+    def compile(cls, relay_config, input_config):
+        table = cls()
+        # Every relay keeps a name: names and states are looked up by id.
+        errors = [f"relay {relay_id}: missing" for relay_id in range(1, table.relay_count + 1)
+                  if relay_id not in relay_config]
+        errors += [f"relay {relay_id}: no such relay" for relay_id in relay_config
+                   if not 1 <= relay_id <= table.relay_count]
+        for relay_id, name in relay_config.items():
+            if not isinstance(name, str) or not name:
+                errors.append(f"relay {relay_id}: name must be a non-empty string")
+            elif name in table.relay_ids:
+                errors.append(f"relay {relay_id}: name '{name}' already used by relay {table.relay_ids[name]}")
+            else:
+                table.relay_ids[name] = relay_id
+        if errors:
+            raise ValueError("Invalid relays: " + "; ".join(errors))
+        for input_id, config in input_config.items():
+            relay_names, duration, behavior = config
+            if isinstance(relay_names, str):
+                relay_names = (relay_names,)
+            mask = 0
+            for name in relay_names:
+                relay_id = table.relay_ids.get(name)
+                if relay_id is None:
+                    errors.append(f"input {input_id}: no relay named '{name}'")
+                else:
+                    mask |= 1 << (relay_id - 1)
+            if behavior not in BEHAVIORS[1:]:
+                errors.append(f"input {input_id}: unknown behavior '{behavior}'")
+                continue
+            if not 1 <= input_id < len(table.op):
+                errors.append(f"input {input_id}: no such input")
+                continue
+            if behavior in ('Timed', 'Timer_resets') and (not isinstance(duration, int)
+                                                         or not 0 < duration <= MAX_DURATION_MS):
+                errors.append(f"input {input_id}: {behavior} needs a duration of 1 to {MAX_DURATION_MS} ms")
+                continue
+            table.bind(input_id, mask, BEHAVIORS.index(behavior), duration or 0)
+        if errors:
+            raise ValueError("Invalid input mappings: " + "; ".join(errors))
+        return table
+
+    def bind(self, input_id, relay_mask, op, duration=0):
+        self.unbind(input_id)
+        self.op[input_id] = op
+        self.relay_mask[input_id] = relay_mask
+        self.duration[input_id] = duration
+        bit = 1 << (input_id - 1)
+        for relay_id in self.relays_of(input_id):
+            self.relay_inputs[relay_id] |= bit
+
+    def unbind(self, input_id):
+        bit = 1 << (input_id - 1)
+        for relay_id in self.relays_of(input_id):
+            self.relay_inputs[relay_id] &= ~bit
+        self.op[input_id] = OP_NONE
+        self.relay_mask[input_id] = 0
+        self.duration[input_id] = 0
+        self.active[input_id] = 0
+
+    def relays_of(self, input_id):
+        mask = self.relay_mask[input_id]
+        return [r + 1 for r in range(self.relay_count) if mask & (1 << r)]
+
+    def inputs_of(self, relay_id):
+        mask = self.relay_inputs[relay_id]
+        return [i + 1 for i in range(len(self.op) - 1) if mask & (1 << i)]
+
+    def behavior(self, input_id):
+        return BEHAVIORS[self.op[input_id]]
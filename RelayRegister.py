@@ -0,0 +1,190 @@
+from array import array
+from micropython import const
+import uasyncio
+
+try:
+    from machine import mem32
+except ImportError:
+    mem32 = None
+
+_HISTORY = 16  # power of two
+
+_SIO_GPIO_OUT_SET = const(0xd0000014)
+_SIO_GPIO_OUT_CLR = const(0xd0000018)
+
+
+class RelayRegister:
+    # Shadow copy of the relay outputs as a bitmask (bit 0 is relay 1).
+    # Every relay write goes through update(), which drives the pins and
+    # bumps `version` when anything visible changed.  The last _HISTORY
+    # versions remember which relays they touched, so callers can ask what
+    # changed since a version they already have.  Tasks that push changes
+    # out get their own flag from subscribe(), set on every new version.
+    #
+    # When the GPIO numbers are known and the port exposes mem32, update()
+    # switches all touched relays with one write to the RP2040 SIO clear
+    # register and one to its set register instead of pin by pin.
+    #
+    # `interlocks` holds relay masks of which at most one relay may be on
+    # (see Rules.py).  update() enforces them on every write: the relay
+    # being switched on wins, the lowest one if several are, and the others
+    # in its group are switched off first, break before make.  With gap_ms
+    # set, a relay that would switch on in the same write as another in its
+    # group switches off is held back in `held` instead; the owner switches
+    # it on gap_ms later with release_held().  on_change, if set, is called
+    # with (changed, state) after every change, and on_interlock with
+    # (forced, held): relays an interlock switched off and relays it held
+    # back.
+    def __init__(self, pins, gpios=None):
+        self._pins = pins
+        self._gpio_bits = None
+        if gpios is not None and mem32 is not None:
+            self._gpio_bits = array('I', [1 << gpio for gpio in gpios])
+        self.state = 0
+        for r, pin in enumerate(pins):
+            if pin.value():
+                self.state |= 1 << r
+        self.version = 0
+        self.switches = array('I', [0] * len(pins))
+        self._hist_version = array('i', [-1] * _HISTORY)
+        self._hist_mask = bytearray(_HISTORY)
+        self._flags = []
+        self.trace = None  # optional inputtrace.TraceRecorder, fed every change
+        self.interlocks = ()
+        self.interlocked = 0  # relays switched off by an interlock
+        self.gap_ms = 0
+        self.held = 0
+        self.on_change = None
+        self.on_interlock = None
+
+    def subscribe(self):
+        flag = uasyncio.ThreadSafeFlag()
+        self._flags.append(flag)
+        return flag
+
+    def update(self, set_mask=0, clear_mask=0, toggle_mask=0):
+        old = self.state
+        new = ((old | set_mask) & ~clear_mask) ^ toggle_mask
+        touched = set_mask | clear_mask | toggle_mask
+        forced = held = 0
+        if self.interlocks:
+            # A relay written again no longer waits for its gap.
+            self.held &= ~touched
+            new, forced, held = self._interlock(old, new)
+            self.held |= held
+            touched |= old & ~new
+        if self._gpio_bits is not None:
+            self._write_sio(new, touched)
+        elif self.interlocks:
+            self._write_pins(new, touched & ~new)
+            self._write_pins(new, touched & new)
+        else:
+            self._write_pins(new, touched)
+        self.state = new
+        changed = old ^ new
+        if changed:
+            switches = self.switches
+            c = changed
+            r = 0
+            while c:
+                if c & 1:
+                    switches[r] += 1
+                c >>= 1
+                r += 1
+            self.touch(changed)
+            if self.trace is not None:
+                self.trace.relays(new)
+            if self.on_change is not None:
+                self.on_change(changed, new)
+        if (forced or held) and self.on_interlock is not None:
+            self.on_interlock(forced, held)
+        return changed
+
+    def _interlock(self, old, new):
+        # Returns (new, forced, held), see above.
+        forced = 0
+        held = 0
+        for group in self.interlocks:
+            on = new & group
+            if on & (on - 1):
+                keep = (on & ~old) or on
+                keep &= -keep
+                new &= ~(on ^ keep)
+                forced |= on ^ keep
+            if self.gap_ms and new & ~old & group and old & ~new & group:
+                held |= new & ~old & group
+        lost = forced
+        while lost:
+            self.interlocked += lost & 1
+            lost >>= 1
+        return new & ~held, forced, held
+
+    def release_held(self):
+        # Switch on the relays held back for the interlock gap.
+        held = self.held
+        self.held = 0
+        if held:
+            return self.update(set_mask=held)
+        return 0
+
+    def _write_pins(self, new, touched):
+        pins = self._pins
+        r = 0
+        while touched:
+            if touched & 1:
+                pins[r].value((new >> r) & 1)
+            touched >>= 1
+            r += 1
+
+    def _write_sio(self, new, touched):
+        bits = self._gpio_bits
+        set_bits = 0
+        clear_bits = 0
+        r = 0
+        while touched:
+            if touched & 1:
+                if (new >> r) & 1:
+                    set_bits |= bits[r]
+                else:
+                    clear_bits |= bits[r]
+            touched >>= 1
+            r += 1
+        if clear_bits:
+            mem32[_SIO_GPIO_OUT_CLR] = clear_bits
+        if set_bits:
+            mem32[_SIO_GPIO_OUT_SET] = set_bits
+
+    def write(self, mask, value):
+        if value:
+            return self.update(set_mask=mask)
+        return self.update(clear_mask=mask)
+
+    def toggle(self, mask):
+        return self.update(toggle_mask=mask)
+
+    def touch(self, mask):
+        # Record a visible change to the given relays without switching them.
+        self.version += 1
+        slot = self.version & (_HISTORY - 1)
+        self._hist_version[slot] = self.version
+        self._hist_mask[slot] = mask
+        for flag in self._flags:
+            flag.set()
+
+    def get(self, relay_id):
+        return (self.state >> (relay_id - 1)) & 1
+
+    def states(self):
+        return [(self.state >> r) & 1 for r in range(len(self._pins))]
+
+    def changed_since(self, version):
+        # Bitmask of relays touched after `version`, or None if that is
+        # too old (or from before a reboot) to tell.
+        if version == self.version:
+            return 0
+        if version < 0 or version > self.version or self.version - version > _HISTORY:
+            return None
+        mask = 0
+        for v in range(version + 1, self.version + 1):
+            mask |= self._hist_mask[v & (_HISTORY - 1)]
+        return mask
@@ -0,0 +1,127 @@
+import struct
+import time
+import uasyncio
+import atomicfile
+import log
+from Mappings import OP_ON_WHILE_ACTIVATED
+
+_VERSION = 1
+_FORMAT = '<BBBx8I'  # version, relay state, active inputs, 8 timer remainders in ms
+
+
+class RelaySnapshot:
+    # Persists the relay outputs, the inputs' active flags and the time
+    # left on each relay timer, and puts them back at boot before anything
+    # else runs.  A snapshot is written when the relay register changes,
+    # once it has been quiet for delay_ms (or max_delay_ms after the first
+    # change at the latest), so bursts of switching cost one flash write.
+    # Timers resume with the time they had left when the snapshot was
+    # taken; time spent powered off is not counted.  A change that only
+    # moves timers (a Timer_resets input retriggered, or the time left
+    # running down) is saved at most every timer_interval_ms; relay
+    # states, active inputs and which timers run are saved every time.
+    #
+    # Relays driven by On_while_activated inputs are not restored: they
+    # follow the input, which is released after a reboot.
+    def __init__(self, dn33c08, path='relays.bin', delay_ms=1000, max_delay_ms=5000, timer_interval_ms=60000):
+        self.dn33c08 = dn33c08
+        self.path = path
+        self.delay_ms = delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.timer_interval_ms = timer_interval_ms
+        self.writes = 0
+        self.restore_us = 0
+        self._saved = None
+        self._saved_ms = time.ticks_ms()
+        self._flag = dn33c08.relay_register.subscribe()
+
+    def _live_masks(self):
+        # Relay and input bitmasks that follow a held input.
+        mappings = self.dn33c08.mappings
+        relays = 0
+        inputs = 0
+        for i in range(1, 9):
+            if mappings.op[i] == OP_ON_WHILE_ACTIVATED:
+                relays |= mappings.relay_mask[i]
+                inputs |= 1 << (i - 1)
+        return relays, inputs
+
+    def capture(self):
+        dn = self.dn33c08
+        deadlines = dn.deadlines
+        active = 0
+        for i in range(1, 9):
+            if dn.mappings.active[i]:
+                active |= 1 << (i - 1)
+        live_relays, live_inputs = self._live_masks()
+        return struct.pack(_FORMAT, _VERSION, dn.relay_register.state & ~live_relays & 0xFF,
+                           active & ~live_inputs, *[deadlines.remaining(r) for r in range(8)])
+
+    def restore(self):
+        started = time.ticks_us()
+        data = atomicfile.read(self.path, 'rb')
+        if data is None or len(data) != struct.calcsize(_FORMAT) or data[0] != _VERSION:
+            return False
+        fields = struct.unpack(_FORMAT, data)
+        live_relays, live_inputs = self._live_masks()
+        state = fields[1] & ~live_relays
+        active = fields[2] & ~live_inputs
+        dn = self.dn33c08
+        dn.relay_register.update(set_mask=state)
+        for r in range(8):
+            if (state >> r) & 1 and fields[3 + r]:
+                dn.deadlines.arm(r, fields[3 + r])
+        for i in range(1, 9):
+            if (active >> (i - 1)) & 1:
+                dn.mappings.active[i] = 1
+        self._saved = data
+        self._saved_ms = time.ticks_ms()
+        self.restore_us = time.ticks_diff(time.ticks_us(), started)
+        log.info('Restored relays %02x with %d timers in %d us', state,
+                 sum(1 for r in range(8) if dn.deadlines.armed(r)), self.restore_us)
+        return True
+
+    @staticmethod
+    def _running(data):
+        # Relay state, active inputs and which timers run, without the time left.
+        fields = struct.unpack(_FORMAT, data)
+        running = 0
+        for r in range(8):
+            if fields[3 + r]:
+                running |= 1 << r
+        return fields[1] | fields[2] << 8 | running << 16
+
+    def save(self):
+        data = self.capture()
+        saved = self._saved
+        if data == saved:
+            return False
+        now = time.ticks_ms()
+        if (saved is not None and self._running(data) == self._running(saved)
+                and time.ticks_diff(now, self._saved_ms) < self.timer_interval_ms):
+            return False
+        atomicfile.write(self.path, data, 'wb')
+        self._saved = data
+        self._saved_ms = now
+        self.writes += 1
+        return True
+
+    async def run(self):
+        while True:
+            await self._flag.wait()
+            first = time.ticks_ms()
+            last = first
+            while True:
+                wait = min(self.delay_ms - time.ticks_diff(time.ticks_ms(), last),
+                           self.max_delay_ms - time.ticks_diff(time.ticks_ms(), first))
+                if wait <= 0:
+                    break
+                try:
+                    await uasyncio.wait_for_ms(self._flag.wait(), wait)
+                    last = time.ticks_ms()
+                except uasyncio.TimeoutError:
+                    break
+            try:
+                self.save()
+            except OSError as e:
+                log.error('Saving relay snapshot failed: %s', e)
@@ -0,0 +1,241 @@
+from array import array
+import time
+import log
+import metrics
+
+# Trigger kinds.  Input triggers are keyed (input_id - 1) * 3 + kind,
+# relay triggers _RELAY_KEYS + (relay_id - 1) * 2 + kind - ON.
+PRESS = 0
+RELEASE = 1
+DOUBLE = 2
+ON = 3
+OFF = 4
+TRIGGERS = ('press', 'release', 'double', 'on', 'off')
+
+_RELAY_KEYS = 8 * 3
+_KEYS = _RELAY_KEYS + 8 * 2
+
+
+def relay_ref(relay_ids, ref):
+    # A relay given by name or number, as its id.
+    if isinstance(ref, int) and 1 <= ref <= 8:
+        return ref
+    if isinstance(ref, str) and ref in relay_ids:
+        return relay_ids[ref]
+    raise ValueError(f"no relay {ref!r}")
+
+
+def compile_actions(relay_ids, scene_ids, actions):
+    # A rule's or schedule entry's "do" list, [["set", "Hall"], ["pulse",
+    # 3, 5000], ["scene", "Evening"]], as the relay masks and pulses of
+    # compile_commands() plus a scene id (0 for none).
+    from DN33C08 import compile_commands
+    commands = []
+    scene = 0
+    for action in actions:
+        if action[0] == 'scene':
+            if action[1] not in scene_ids:
+                raise ValueError(f"no scene {action[1]!r}")
+            scene = scene_ids[action[1]]
+        else:
+            commands.append((action[0], relay_ref(relay_ids, action[1])) + tuple(action[2:]))
+    masks, pulses = compile_commands(commands)
+    return masks, tuple(pulses), scene
+
+
+class RuleTable:
+    # Rules compiled to flat tables indexed by rule number, plus an index
+    # from every trigger (an input press, release or double press, a relay
+    # switching on or off) to the rules it can fire: the rule numbers for
+    # key k are index[start[k]:start[k + 1]].  A rule holds the relays that
+    # must be on and off for it to fire, its relay commands compiled to
+    # masks as by compile_commands(), pulses, and a scene to activate.
+    # Configured in settings.json as
+    #
+    #     "rules": [{"when": "press", "input": 3, "if": {"off": ["Attic"]}, "do": [["toggle", "Kitchen"]]},
+    #               {"when": "double", "input": 1, "within_ms": 400, "do": [["scene", "All off"]]},
+    #               {"when": "on", "relay": "Hall", "do": [["pulse", "Patio", 5000]]}],
+    #     "interlocks": [["Hall", "Living"]], "interlock_gap_ms": 50
+    #
+    # Relays are given by name or number.  An interlock group is compiled to
+    # a relay mask for RelayRegister.interlocks; interlock_gap_ms is how
+    # long one relay of a group is off before the next one switches on.
+    def __init__(self, count=0):
+        self.start = array('H', [0] * (_KEYS + 1))
+        self.index = array('H', [0] * count)
+        self.need_on = bytearray(count)
+        self.need_off = bytearray(count)
+        self.touched = bytearray(count)
+        self.set_mask = bytearray(count)
+        self.clear_mask = bytearray(count)
+        self.toggle_mask = bytearray(count)
+        self.pulses = [()] * count
+        self.scene = bytearray(count)
+        self.within_ms = array('H', [0] * count)
+        self.relay_triggers = 0  # relays with on/off rules
+        self.interlocks = ()
+
+    @classmethod
+    def compile(cls, relay_config, scene_ids, rule_config, interlock_config):
+        if not isinstance(rule_config, list) or not isinstance(interlock_config, list):
+            raise ValueError("rules and interlocks must be lists")
+        table = cls(len(rule_config))
+        relay_ids = {name: relay_id for relay_id, name in relay_config.items()}
+        errors = []
+
+        def mask(refs):
+            m = 0
+            for ref in refs:
+                m |= 1 << (relay_ref(relay_ids, ref) - 1)
+            return m
+
+        keys = [0] * len(rule_config)
+        for n, config in enumerate(rule_config):
+            try:
+                if config['when'] not in TRIGGERS:
+                    raise ValueError(f"unknown trigger {config['when']!r}")
+                kind = TRIGGERS.index(config['when'])
+                if kind < ON:
+                    input_id = config['input']
+                    if not isinstance(input_id, int) or not 1 <= input_id <= 8:
+                        raise ValueError(f"no input {input_id!r}")
+                    keys[n] = (input_id - 1) * 3 + kind
+                else:
+                    r = relay_ref(relay_ids, config['relay'])
+                    keys[n] = _RELAY_KEYS + (r - 1) * 2 + kind - ON
+                    table.relay_triggers |= 1 << (r - 1)
+                condition = config.get('if', {})
+                table.need_on[n] = mask(condition.get('on', ()))
+                table.need_off[n] = mask(condition.get('off', ()))
+                if kind == DOUBLE:
+                    within = config.get('within_ms', 400)
+                    if not isinstance(within, int) or not 0 <= within <= 65535:
+                        raise ValueError("within_ms must be 0 to 65535")
+                    table.within_ms[n] = within
+                masks, table.pulses[n], table.scene[n] = compile_actions(relay_ids, scene_ids, config['do'])
+                table.touched[n], table.set_mask[n], table.clear_mask[n], table.toggle_mask[n] = masks
+            except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+                errors.append(f"rule {n + 1}: {e}")
+        groups = []
+        for n, group in enumerate(interlock_config):
+            try:
+                m = mask(group) if isinstance(group, list) else 0
+                if m & (m - 1) == 0:
+                    raise ValueError("needs two or more relays")
+                groups.append(m)
+            except ValueError as e:
+                errors.append(f"interlock {n + 1}: {e}")
+        if errors:
+            raise ValueError("Invalid rules: " + "; ".join(errors))
+        table.interlocks = tuple(groups)
+        # Counting sort of rule numbers by key; rules keep their order within a key.
+        start = table.start
+        for key in keys:
+            start[key + 1] += 1
+        for key in range(_KEYS):
+            start[key + 1] += start[key]
+        fill = array('H', start)
+        for n, key in enumerate(keys):
+            table.index[fill[key]] = n
+            fill[key] += 1
+        return table
+
+
+class RuleEngine:
+    # Fires the rules of a RuleTable from the context that owns the relays
+    # (core 1 under IOEngine).  Input triggers are evaluated as the input
+    # event is dispatched, before the input's own mapping acts, and see the
+    # relays as the event found them.  A press counts as a double press
+    # when it follows the previous press of that input within the rule's
+    # within_ms; press rules fire for both presses.
+    #
+    # Relay triggers are collected from RelayRegister.on_change and fired
+    # from a deadline slot right after the write that caused them, so a
+    # follow-on action never runs in the middle of another relay write.
+    # Follow-ons that keep causing changes are cut off after max_cascade
+    # rounds.
+    def __init__(self, dn33c08, table, max_cascade=8):
+        self.dn33c08 = dn33c08
+        self.table = table
+        self.max_cascade = max_cascade
+        start = time.ticks_add(time.ticks_ms(), -0x10000)
+        self._last_press = array('i', [start] * 9)
+        self._rose = 0
+        self._fell = 0
+        self._cascade = 0
+        self._slot = dn33c08.deadlines.allocate(self._relay_rules)
+        self.fired = 0
+        self.cut_off = 0
+        metrics.counter('rules_fired_total', 'Automation rules fired', lambda: self.fired)
+        metrics.counter('rules_cascades_cut_total', 'Follow-on rule cascades stopped at max_cascade',
+                        lambda: self.cut_off)
+
+    def input_event(self, input_id, kind):
+        key = (input_id - 1) * 3 + kind
+        start = self.table.start
+        if start[key] != start[key + 1]:
+            self._fire(key)
+        if kind == PRESS:
+            key += DOUBLE
+            now = time.ticks_ms()
+            since = time.ticks_diff(now, self._last_press[input_id])
+            self._last_press[input_id] = now
+            if start[key] != start[key + 1] and self._fire(key, since):
+                # A third press starts over instead of doubling again.
+                self._last_press[input_id] = time.ticks_add(now, -0x10000)
+
+    def _fire(self, key, since=-1):
+        # Returns the number of rules fired.
+        table = self.table
+        dn = self.dn33c08
+        state = dn.relay_register.state
+        need_on = table.need_on
+        index = table.index
+        fired = 0
+        for i in range(table.start[key], table.start[key + 1]):
+            n = index[i]
+            if state & need_on[n] != need_on[n] or state & table.need_off[n]:
+                continue
+            if since >= 0 and since > table.within_ms[n]:
+                continue
+            fired += 1
+            touched = table.touched[n]
+            if touched:
+                dn.apply_masks((touched, table.set_mask[n], table.clear_mask[n], table.toggle_mask[n]),
+                               table.pulses[n])
+            scene = table.scene[n]
+            if scene:
+                dn.scenes.activate(scene)
+        self.fired += fired
+        return fired
+
+    # RelayRegister.on_change, called inside every relay write.
+    def relay_changed(self, changed, state):
+        changed &= self.table.relay_triggers
+        if changed:
+            self._rose |= changed & state
+            self._fell |= changed & ~state
+            self.dn33c08.deadlines.arm(self._slot, 0)
+
+    def _relay_rules(self, slot):
+        rose, fell = self._rose, self._fell
+        self._rose = self._fell = 0
+        self._cascade += 1
+        if self._cascade > self.max_cascade:
+            self.cut_off += 1
+            self._cascade = 0
+            log.warning('Rule cascade stopped after %d rounds', self.max_cascade)
+            return
+        start = self.table.start
+        r = 0
+        while rose | fell:
+            for kind, bits in ((ON, rose), (OFF, fell)):
+                if bits & 1:
+                    key = _RELAY_KEYS + r * 2 + kind - ON
+                    if start[key] != start[key + 1]:
+                        self._fire(key)
+            rose >>= 1
+            fell >>= 1
+            r += 1
+        if not (self._rose | self._fell):
+            self._cascade = 0
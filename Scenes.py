@@ -0,0 +1,154 @@
+import time
+import uasyncio
+import log
+import metrics
+
+
+class SceneTable:
+    # Scenes compiled to relay bitmasks indexed by scene id (from 1): on[id]
+    # holds the relays the scene switches on, off[id] the ones it switches
+    # off; relays in neither are left alone.  input_scene and button_scene
+    # give the scene triggered by each input and front-panel button, 0 for
+    # none.  Configured in settings.json as
+    #
+    #     "scenes": {"Evening": {"relays": {"Hall": 1, "Living": 1, "Attic": 0},
+    #                            "inputs": [5], "buttons": [1]}}
+    def __init__(self, count=0, input_count=8, button_count=4):
+        self.names = [''] * (count + 1)
+        self.on = bytearray(count + 1)
+        self.off = bytearray(count + 1)
+        self.input_scene = bytearray(input_count + 1)
+        self.button_scene = bytearray(button_count + 1)
+        self.ids = {}
+
+    @classmethod
+    def compile(cls, relay_config, scene_config):
+        table = cls(len(scene_config))
+        relay_ids = {name: relay_id for relay_id, name in relay_config.items()}
+        errors = []
+        for scene_id, name in enumerate(sorted(scene_config), 1):
+            config = scene_config[name]
+            if not isinstance(config, dict) or not isinstance(config.get('relays'), dict):
+                errors.append(f"scene '{name}': needs a relays object")
+                continue
+            table.names[scene_id] = name
+            table.ids[name] = scene_id
+            for relay_name, state in config['relays'].items():
+                relay_id = relay_ids.get(relay_name)
+                if relay_id is None:
+                    errors.append(f"scene '{name}': no relay named '{relay_name}'")
+                elif state not in (0, 1):
+                    errors.append(f"scene '{name}': relay '{relay_name}' state must be 0 or 1")
+                elif state:
+                    table.on[scene_id] |= 1 << (relay_id - 1)
+                else:
+                    table.off[scene_id] |= 1 << (relay_id - 1)
+            for key, triggers in (('inputs', table.input_scene), ('buttons', table.button_scene)):
+                for trigger in config.get(key, ()):
+                    if not isinstance(trigger, int) or not 1 <= trigger < len(triggers):
+                        errors.append(f"scene '{name}': no such {key[:-1]} {trigger}")
+                    elif triggers[trigger]:
+                        errors.append(f"scene '{name}': {key[:-1]} {trigger} already triggers "
+                                      f"'{table.names[triggers[trigger]]}'")
+                    else:
+                        triggers[trigger] = scene_id
+        if errors:
+            raise ValueError("Invalid scenes: " + "; ".join(errors))
+        return table
+
+    def relays(self, scene_id):
+        # (on, off) relay ids.
+        on, off = self.on[scene_id], self.off[scene_id]
+        return ([r + 1 for r in range(8) if on & (1 << r)], [r + 1 for r in range(8) if off & (1 << r)])
+
+
+class SceneSwitcher:
+    # Activates scenes from a SceneTable through DN33C08.apply_masks(), in
+    # the context that owns the relays (core 1 under IOEngine).
+    #
+    # With max_switches at 0 a scene is one relay write.  Otherwise at most
+    # max_switches relays are switched on per window_ms, lowest relay first,
+    # to cap the inrush current drawn from the shared supply; relays the
+    # scene switches off, and ones that are already on, are written at
+    # once.  The rest wait in `pending` for a deadline slot of their own.
+    # The window is shared by all scenes, and a scene activated while
+    # another is still stepping takes over the relays it names.
+    #
+    # Buttons interrupt in IRQ context, so they only leave a request for
+    # run(), which activates it from a task.
+    def __init__(self, dn33c08, table, max_switches=0, window_ms=200):
+        self.dn33c08 = dn33c08
+        self.table = table
+        self.max_switches = max_switches
+        self.window_ms = window_ms
+        self.pending = 0
+        self._window_start = time.ticks_add(time.ticks_ms(), -window_ms - 1)
+        self._window_count = 0
+        self._slot = dn33c08.deadlines.allocate(self._step)
+        self._requested = 0
+        self._flag = uasyncio.ThreadSafeFlag()
+        self.activations = 0
+        self.deferred = 0
+        metrics.counter('scene_activations_total', 'Scenes activated', lambda: self.activations)
+        metrics.counter('scene_deferred_switches_total', 'Relay switch-ons delayed by the inrush limit',
+                        lambda: self.deferred)
+        metrics.gauge('scene_pending_relays', 'Relays waiting for their staggered switch-on',
+                      lambda: bin(self.pending).count('1'))
+
+    def activate(self, scene_id):
+        on = self.table.on[scene_id]
+        off = self.table.off[scene_id]
+        self.pending = (self.pending & ~off) | on
+        self.activations += 1
+        self._advance(off)
+        self.deferred += bin(self.pending & on).count('1')
+
+    def _step(self, slot):
+        self._advance(0)
+
+    def _advance(self, off):
+        pending = self.pending
+        now_on = pending & self.dn33c08.relay_register.state
+        need = pending & ~now_on
+        take = need
+        if self.max_switches:
+            now = time.ticks_ms()
+            if time.ticks_diff(now, self._window_start) >= self.window_ms:
+                self._window_start = now
+                self._window_count = 0
+            take = 0
+            room = self.max_switches - self._window_count
+            while need and room > 0:
+                bit = need & -need
+                take |= bit
+                need ^= bit
+                room -= 1
+            self._window_count = self.max_switches - room
+        else:
+            need = 0
+        self.pending = need
+        on = now_on | take
+        if on | off:
+            self.dn33c08.apply_masks((on | off, on, off, 0), ())
+        deadlines = self.dn33c08.deadlines
+        if need:
+            delay = self.window_ms - time.ticks_diff(time.ticks_ms(), self._window_start)
+            deadlines.arm(self._slot, delay if delay > 0 else 1)
+        else:
+            deadlines.cancel(self._slot)
+
+    # IRQ context.
+    def request(self, scene_id):
+        self._requested = scene_id
+        self._flag.set()
+
+    async def run(self):
+        while True:
+            await self._flag.wait()
+            scene_id = self._requested
+            self._requested = 0
+            if scene_id:
+                try:
+                    self.dn33c08.run_scene(scene_id)
+                except OSError as e:
+                    log.warning('Scene %s not activated: %s', self.table.names[scene_id], e)
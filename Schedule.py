@@ -0,0 +1,296 @@
+from array import array
+import time
+import uasyncio
+import atomicfile
+import log
+import metrics
+from cron import CronSpec, parse_field, weekday
+from sun import sun_times
+from Rules import compile_actions
+
+SUNRISE = 1
+SUNSET = 2
+_SUN = ('sunrise', 'sunset')
+
+_CLOCK_SET = 1704067200 // 60  # 2024-01-01; the RTC reads 2021 until it has been set
+_LATE_MIN = 2  # a fire this late was missed
+_CATCH_UP_MIN = 24 * 60
+
+
+class ScheduleTable:
+    # Time-of-day entries compiled to flat tables indexed by entry number:
+    # a CronSpec, or a sun event (SUNRISE or SUNSET) with an offset in
+    # minutes and the days of the week it applies on, the entry's relay
+    # commands compiled to masks as by compile_commands(), pulses, a scene
+    # to activate, and whether a missed fire is run late or skipped.
+    # Configured in settings.json as
+    #
+    #     "schedule": [{"cron": "30 6 * * 1-5", "do": [["set", "Hall"]]},
+    #                  {"sun": "sunset", "offset_min": -15, "days": "1-5",
+    #                   "do": [["scene", "Evening"]], "missed": "run"}],
+    #     "latitude": 52.37, "longitude": 4.89, "utc_offset_min": 60
+    #
+    # Cron fields and days are local time at utc_offset_min, which is fixed:
+    # there are no daylight saving rules.  Times are minutes since
+    # 1970-01-01 00:00 UTC.
+    def __init__(self, count=0, utc_offset_min=0, latitude=None, longitude=None):
+        self.cron = [None] * count
+        self.sun = bytearray(count)
+        self.sun_offset = array('h', [0] * count)
+        self.sun_days = bytearray(count)
+        self.catch_up = bytearray(count)  # 1 for "missed": "run"
+        self.touched = bytearray(count)
+        self.set_mask = bytearray(count)
+        self.clear_mask = bytearray(count)
+        self.toggle_mask = bytearray(count)
+        self.pulses = [()] * count
+        self.scene = bytearray(count)
+        self.utc_offset = utc_offset_min
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @classmethod
+    def compile(cls, relay_config, scene_ids, entries, latitude=None, longitude=None, utc_offset_min=0):
+        if not isinstance(entries, list):
+            raise ValueError("schedule must be a list")
+        if not isinstance(utc_offset_min, int) or not -840 <= utc_offset_min <= 840:
+            raise ValueError("utc_offset_min must be whole minutes within 14 hours")
+        table = cls(len(entries), utc_offset_min, latitude, longitude)
+        relay_ids = {name: relay_id for relay_id, name in relay_config.items()}
+        errors = []
+        for n, config in enumerate(entries):
+            try:
+                if 'cron' in config:
+                    table.cron[n] = CronSpec(config['cron'])
+                elif config.get('sun') in _SUN:
+                    if latitude is None or longitude is None:
+                        raise ValueError("sun entries need latitude and longitude")
+                    table.sun[n] = _SUN.index(config['sun']) + 1
+                    offset = config.get('offset_min', 0)
+                    if not isinstance(offset, int) or not -720 <= offset <= 720:
+                        raise ValueError("offset_min must be whole minutes within 12 hours")
+                    table.sun_offset[n] = offset
+                    days = parse_field(config.get('days', '*'), 0, 7)
+                    table.sun_days[n] = (days | 1) & 0x7f if days & 0x80 else days
+                else:
+                    raise ValueError('needs "cron", or "sun": "sunrise" or "sunset"')
+                missed = config.get('missed', 'skip')
+                if missed not in ('skip', 'run'):
+                    raise ValueError(f"missed must be 'skip' or 'run', not {missed!r}")
+                table.catch_up[n] = missed == 'run'
+                masks, table.pulses[n], table.scene[n] = compile_actions(relay_ids, scene_ids, config['do'])
+                table.touched[n], table.set_mask[n], table.clear_mask[n], table.toggle_mask[n] = masks
+            except (ValueError, TypeError, KeyError, IndexError, AttributeError) as e:
+                errors.append(f"entry {n + 1}: {e}")
+        if errors:
+            raise ValueError("Invalid schedule: " + "; ".join(errors))
+        return table
+
+    def next_after(self, n, minute):
+        # Entry n's first fire after `minute`, -1 if it never fires again.
+        offset = self.utc_offset
+        spec = self.cron[n]
+        if spec is not None:
+            at = spec.next_after(minute + offset)
+            return at - offset if at >= 0 else -1
+        kind = self.sun[n] - 1
+        first = (minute + offset) // 1440 - 1
+        for days in range(first, first + 400):
+            if not self.sun_days[n] >> weekday(days) & 1:
+                continue
+            times = sun_times(days, self.latitude, self.longitude)
+            if times is not None:
+                at = days * 1440 + times[kind] + self.sun_offset[n]
+                if at > minute:
+                    return at
+        return -1
+
+
+class Scheduler:
+    # Fires ScheduleTable entries from a deadline slot, in the context that
+    # owns the relays (core 1 under IOEngine).  Every entry's next fire time
+    # sits in a binary min-heap of entry numbers, and the slot is armed for
+    # the earliest, so nothing runs between fires and a fire costs one
+    # replace-top (O(log n)) plus working out that entry's next time.  Sleeps
+    # are capped at max_sleep_ms so a clock change nobody announced is
+    # noticed; clock_changed() looks at once (the NTP sync calls it).
+    #
+    # Nothing fires until the RTC has been set.  `handled` is the minute up
+    # to which every fire is done.  An entry found due more than _LATE_MIN
+    # minutes late (the clock jumped forward) missed its fire: it runs once
+    # if its table says so and is skipped otherwise, and continues from
+    # now.  When the clock goes back, entries keep their next fire, so
+    # nothing fires twice.  The run() task keeps `handled` in state_path;
+    # once the clock is set after a reboot, every entry that runs missed
+    # fires has its latest fire since then (within _CATCH_UP_MIN) run,
+    # oldest first.  Fires in the last save_interval_s before a power cut
+    # can be run again that way, so catch-up suits idempotent actions.
+    def __init__(self, dn33c08, table, max_sleep_ms=600000, state_path='schedule.state', save_interval_s=600):
+        self.dn33c08 = dn33c08
+        self.max_sleep_ms = max_sleep_ms
+        self.state_path = state_path
+        self.save_interval_s = save_interval_s
+        self.handled = -1
+        saved = atomicfile.read(state_path)
+        try:
+            self._saved = int(saved) if saved else -1
+        except ValueError:
+            self._saved = -1
+        self._restored = self._saved
+        self._slot = dn33c08.deadlines.allocate(self._wake)
+        self.fired = 0
+        self.missed = 0
+        metrics.counter('schedule_fires_total', 'Schedule entries fired', lambda: self.fired)
+        metrics.counter('schedule_missed_total', 'Schedule fires skipped because they were missed',
+                        lambda: self.missed)
+        metrics.gauge('schedule_entries', 'Schedule entries with a next fire', lambda: self._size)
+        self.set_table(table)
+
+    def set_table(self, table):
+        # Replaces the entries and plans them from the last minute handled.
+        count = len(table.cron)
+        self.table = table
+        self._next = array('i', [-1] * count)
+        self._heap = array('H', [0] * count)
+        self._size = 0
+        if self.handled >= 0:
+            now = time.time() // 60
+            self._plan(max(self.handled, now - 1) if now >= _CLOCK_SET else self.handled)
+        self.dn33c08.deadlines.arm(self._slot, 0)
+
+    def clock_changed(self):
+        self.dn33c08.deadlines.arm(self._slot, 0)
+
+    def next_fire(self, n):
+        # Entry n's next fire in seconds since 1970 UTC, None if not planned.
+        at = self._next[n]
+        return at * 60 if at >= 0 else None
+
+    def _wake(self, slot):
+        now_s = time.time()
+        now = now_s // 60
+        deadlines = self.dn33c08.deadlines
+        if now < _CLOCK_SET:
+            deadlines.arm(slot, self.max_sleep_ms)
+            return
+        if self.handled < 0:
+            self._start(now)
+        table = self.table
+        heap = self._heap
+        nexts = self._next
+        while self._size and nexts[heap[0]] <= now:
+            n = heap[0]
+            due = nexts[n]
+            late = now - due >= _LATE_MIN
+            if late and not table.catch_up[n]:
+                self.missed += 1
+            else:
+                self._fire(n)
+            if late:
+                log.info('Schedule entry %d was due %d min ago: %s', n + 1, now - due,
+                         'run' if table.catch_up[n] else 'skipped')
+            at = table.next_after(n, now - 1 if late else due)
+            if at < 0:
+                self._size -= 1
+                heap[0] = heap[self._size]
+            nexts[n] = at
+            self._sift_down(0)
+        self.handled = now
+        sleep_ms = self.max_sleep_ms
+        if self._size:
+            sleep_ms = min(sleep_ms, (nexts[heap[0]] * 60 - now_s) * 1000)
+        deadlines.arm(slot, sleep_ms)
+
+    def _start(self, now):
+        # First valid time since boot.
+        since = self._restored
+        if 0 <= since < now - 1:
+            table = self.table
+            since = max(since, now - _CATCH_UP_MIN)
+            missed = []
+            for n in range(len(table.cron)):
+                if not table.catch_up[n]:
+                    continue
+                latest = -1
+                at = table.next_after(n, since)
+                while 0 <= at < now:
+                    latest = at
+                    at = table.next_after(n, at)
+                if latest >= 0:
+                    missed.append((latest, n))
+            missed.sort()
+            for _, n in missed:
+                self._fire(n)
+            if missed:
+                log.info('Schedule ran %d entries missed since the last boot', len(missed))
+        self.handled = max(since, now - 1)
+        self._plan(self.handled)
+
+    def _plan(self, minute):
+        # Every entry's next fire after minute, heapified bottom-up in O(n).
+        table = self.table
+        heap = self._heap
+        nexts = self._next
+        size = 0
+        for n in range(len(table.cron)):
+            at = table.next_after(n, minute)
+            nexts[n] = at
+            if at >= 0:
+                heap[size] = n
+                size += 1
+        self._size = size
+        for i in range(size // 2 - 1, -1, -1):
+            self._sift_down(i)
+
+    def _sift_down(self, i):
+        # Ties go to the lower entry number, so entries due together fire in config order.
+        heap = self._heap
+        nexts = self._next
+        size = self._size
+        if i >= size:
+            return
+        n = heap[i]
+        at = nexts[n]
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            c = heap[child]
+            if child + 1 < size:
+                d = heap[child + 1]
+                if nexts[d] < nexts[c] or (nexts[d] == nexts[c] and d < c):
+                    child += 1
+                    c = d
+            if nexts[c] > at or (nexts[c] == at and c > n):
+                break
+            heap[i] = c
+            i = child
+        heap[i] = n
+
+    def _fire(self, n):
+        table = self.table
+        dn = self.dn33c08
+        self.fired += 1
+        touched = table.touched[n]
+        if touched:
+            dn.apply_masks((touched, table.set_mask[n], table.clear_mask[n], table.toggle_mask[n]), table.pulses[n])
+        scene = table.scene[n]
+        if scene:
+            dn.scenes.activate(scene)
+
+    def save(self):
+        handled = self.handled
+        if handled <= self._saved:
+            return False
+        atomicfile.write(self.state_path, str(handled))
+        self._saved = handled
+        return True
+
+    async def run(self):
+        # Keeps `handled` in state_path for catch-up after a reboot.
+        while True:
+            await uasyncio.sleep(self.save_interval_s)
+            try:
+                self.save()
+            except OSError as e:
+                log.error('Saving schedule state failed: %s', e)
@@ -1,4 +1,33 @@
+import time
+import ujson
+import uasyncio
+import atomicfile
+import log
+
+SCHEMA_VERSION = 1
+
+_FIELDS = ('ip', 'subnet_mask', 'gateway', 'dns_server', 'mqtt_broker', 'mqtt_topic_prefix', 'mqtt',
+           'input_trace', 'dual_core', 'input_mode', 'scan_period_ms', 'scan_press_ms', 'scan_release_ms',
+           'udp', 'udp_port', 'udp_key', 'scenes', 'scene_max_switches', 'scene_window_ms',
+           'rules', 'interlocks', 'interlock_gap_ms', 'schedule', 'latitude', 'longitude', 'utc_offset_min',
+           'ntp_host')
+
+
 class Settings:
+    # Settings live in settings.json as {"version": N, ...}.  Saves write a
+    # temporary file and rename it over the old one, so a power cut leaves
+    # either the old or the new file, never half of one.  config.py is
+    # read to migrate boards that have no settings.json yet, and as the
+    # fallback when settings.json cannot be used: the file is then copied
+    # to settings.json.bad and left alone, and the board runs on config.py's
+    # settings, in memory only, until they are changed.
+    #
+    # Callers that change settings in bursts (renaming relays from the web
+    # page) use save_later(); run_saver() then writes once the edits have
+    # been quiet for save_delay_ms, and skips the write if nothing changed.
+    path = 'settings.json'
+    save_delay_ms = 3000
+
     relays = {}
     inputs = {}
     ip = ""
@@ -7,39 +36,179 @@ class Settings:
     dns_server = ""
     mqtt_broker = "your_mqtt_broker_ip"
     mqtt_topic_prefix = "pico/relay"
+    mqtt = False
+    input_trace = False
+    dual_core = False
+    input_mode = 'irq'  # or 'scan': poll the GPIO register, see lib/inputscan.py
+    scan_period_ms = 2
+    scan_press_ms = 20
+    scan_release_ms = 40
+    udp = False  # UDP control protocol, see UdpControl.py
+    udp_port = 5555
+    udp_key = ''  # HMAC key; empty accepts unsigned datagrams
+    scenes = {}  # name -> {"relays": {relay name: 0 or 1}, "inputs": [...], "buttons": [...]}, see Scenes.py
+    scene_max_switches = 0  # relays a scene may switch on per window; 0 for all at once
+    scene_window_ms = 200
+    rules = []  # automation rules, see Rules.py
+    interlocks = []  # groups of relay names of which at most one may be on
+    interlock_gap_ms = 50  # off time before another relay in a group switches on
+    schedule = []  # time-of-day entries, see Schedule.py
+    latitude = None  # degrees north, for sunrise/sunset entries
+    longitude = None  # degrees east
+    utc_offset_min = 0  # local time for cron fields; no daylight saving rules
+    ntp_host = 'pool.ntp.org'  # sets the RTC while there is a schedule
+
+    _saved = None
+    _dirty_ticks = 0
+    _save_event = None
 
     @classmethod
     def load_settings(cls):
+        try:
+            data = cls._read(cls.path)
+        except ValueError as e:
+            cls._apply(cls._from_config())
+            try:
+                atomicfile.write(cls.path + '.bad', atomicfile.read(cls.path))
+            except OSError:
+                pass
+            log.error('Invalid %s, kept as %s.bad, using the defaults from config.py: %s', cls.path, cls.path, e)
+            return
+        if data is None:
+            data = cls._from_config()
+            cls._apply(data)
+            log.info('Settings migrated from config.py to %s', cls.path)
+            cls.save_settings()
+            return
+        text, data = data
+        cls._apply(cls._migrate(data))
+        cls._saved = text
+
+    @classmethod
+    def read_mappings(cls, patch=None):
+        # {"relays", "inputs", "scenes", "rules", "interlocks", "schedule"}, relays and
+        # inputs with int ids, without applying them: as saved in
+        # settings.json, or the current ones with the entries in patch
+        # replaced (or removed where the value is null).  Rules, interlocks
+        # and the schedule are lists and are replaced whole.
+        if patch is None:
+            loaded = cls._read(cls.path)
+            if loaded is None:
+                raise ValueError(f"No {cls.path}")
+            data = cls._migrate(loaded[1])
+            config = {'relays': {}, 'inputs': {}, 'scenes': {}, 'rules': [], 'interlocks': [], 'schedule': []}
+        else:
+            data = patch
+            config = {'relays': dict(cls.relays), 'inputs': dict(cls.inputs), 'scenes': dict(cls.scenes),
+                      'rules': cls.rules, 'interlocks': cls.interlocks, 'schedule': cls.schedule}
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        for key, convert in (('relays', int), ('inputs', int), ('scenes', str)):
+            entries = data.get(key, {})
+            if not isinstance(entries, dict):
+                raise ValueError(f"{key} must be an object")
+            table = config[key]
+            for k, v in entries.items():
+                if v is None:
+                    table.pop(convert(k), None)
+                else:
+                    table[convert(k)] = v
+        for key in ('rules', 'interlocks', 'schedule'):
+            if data.get(key) is not None:
+                config[key] = data[key]
+        return config
+
+    @classmethod
+    def save_settings(cls):
+        text = ujson.dumps(cls._to_dict())
+        if text == cls._saved:
+            return False
+        atomicfile.write(cls.path, text)
+        cls._saved = text
+        return True
+
+    @classmethod
+    def save_later(cls):
+        cls._dirty_ticks = time.ticks_ms()
+        if cls._save_event is None:
+            cls._save_event = uasyncio.Event()
+        cls._save_event.set()
+
+    @classmethod
+    async def run_saver(cls):
+        if cls._save_event is None:
+            cls._save_event = uasyncio.Event()
+        while True:
+            await cls._save_event.wait()
+            cls._save_event.clear()
+            while True:
+                quiet = time.ticks_diff(time.ticks_ms(), cls._dirty_ticks)
+                if quiet >= cls.save_delay_ms:
+                    break
+                await uasyncio.sleep_ms(cls.save_delay_ms - quiet)
+            try:
+                cls.save_settings()
+            except OSError as e:
+                log.error('Saving settings failed: %s', e)
+
+    @classmethod
+    def _read(cls, path):
+        # Returns (text, data), None if there is no file; raises ValueError
+        # if it is not a settings object this firmware can read.  The text
+        # lets save_settings() skip rewriting a file that would come out
+        # identical.
+        text = atomicfile.read(path)
+        if text is None:
+            return None
+        data = ujson.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        if data.get('version', 0) > SCHEMA_VERSION:
+            raise ValueError(f"version {data['version']} is newer than this firmware's {SCHEMA_VERSION}")
+        return text, data
+
+    @classmethod
+    def _migrate(cls, data):
+        # Add a step here whenever SCHEMA_VERSION is bumped.
+        return data
+
+    @classmethod
+    def reset_mappings(cls):
+        # config.py's relays and inputs, no scenes, rules or schedule; not saved.
         import sys
-        if 'config' in sys.modules:
-            del sys.modules['config']
         import config
-        cls.relays = config.relays
-        cls.inputs = config.inputs
-        cls.ip = getattr(config, 'ip', cls.ip)
-        cls.subnet_mask = getattr(config, 'subnet_mask', cls.subnet_mask)
-        cls.gateway = getattr(config, 'gateway', cls.gateway)
-        cls.dns_server = getattr(config, 'dns_server', cls.dns_server)
-        cls.mqtt_broker = getattr(config, 'mqtt_broker', cls.mqtt_broker)
-        cls.mqtt_topic_prefix = getattr(config, 'mqtt_topic_prefix', cls.mqtt_topic_prefix)
+        cls.relays = dict(config.relays)
+        cls.inputs = dict(config.inputs)
+        cls.scenes = {}
+        cls.rules = []
+        cls.interlocks = []
+        cls.schedule = []
+        del sys.modules['config']
 
     @classmethod
-    def save_settings(cls):
-        settings_str = f"""relays = {cls.relays}
-inputs = {cls.inputs}
-ip = "{cls.ip}"
-subnet_mask = "{cls.subnet_mask}"
-gateway = "{cls.gateway}"
-dns_server = "{cls.dns_server}"
-mqtt_broker = "{cls.mqtt_broker}"
-mqtt_topic_prefix = "{cls.mqtt_topic_prefix}"
-"""
-        with open("config.py", "w") as fp:
-            fp.write(settings_str)
-
-    @classmethod
-    def initialize(cls):
-        cls.load_settings()
-
-# Initialize settings when the module is imported
-Settings.initialize()
+    def _from_config(cls):
+        import sys
+        import config
+        data = {'version': SCHEMA_VERSION, 'relays': config.relays, 'inputs': config.inputs}
+        for name in _FIELDS:
+            data[name] = getattr(config, name, getattr(cls, name))
+        del sys.modules['config']
+        return data
+
+    @classmethod
+    def _apply(cls, data):
+        # JSON object keys are strings; relay and input ids are ints.
+        cls.relays = {int(k): v for k, v in data.get('relays', {}).items()}
+        cls.inputs = {int(k): v for k, v in data.get('inputs', {}).items()}
+        for name in _FIELDS:
+            setattr(cls, name, data.get(name, getattr(cls, name)))
+
+    @classmethod
+    def _to_dict(cls):
+        # MicroPython's ujson writes int keys unquoted, so quote them here.
+        data = {'version': SCHEMA_VERSION,
+                'relays': {str(k): v for k, v in cls.relays.items()},
+                'inputs': {str(k): v for k, v in cls.inputs.items()}}
+        for name in _FIELDS:
+            data[name] = getattr(cls, name)
+        return data
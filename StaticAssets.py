@@ -0,0 +1,79 @@
+import binascii
+import os
+import log
+
+
+class StaticAssets:
+    # Files served from memory.  Each asset is read from flash once, the
+    # first time it is requested, together with a prebuilt header block.
+    # If `<filename>.gz` exists (see tools/compress_assets.py) it is served
+    # to clients that accept gzip, and the plain file is only loaded for
+    # clients that do not, unless it is older than the plain file: a stale
+    # .gz is ignored.  ETags are the CRC32 of the served bytes.
+    def __init__(self, max_age=0):
+        self.cache_control = f'max-age={max_age}' if max_age else 'no-cache'
+        self._assets = {}
+
+    def add(self, path, filename, content_type):
+        # Variants are [plain, gzip]; None until loaded, False if missing.
+        self._assets[path] = [filename, content_type, None, None]
+
+    def __contains__(self, path):
+        return path in self._assets
+
+    def register_routes(self, server):
+        for path in self._assets:
+            server.route('GET', path, self._http_asset)
+
+    async def _http_asset(self, req):
+        self.serve(req.writer, req.path, req.header('accept-encoding').encode(),
+                   req.header('if-none-match').encode())
+
+    def _load(self, asset, gzip):
+        filename, content_type = asset[0], asset[1]
+        if gzip:
+            filename += '.gz'
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return False
+        if gzip:
+            try:
+                stale = os.stat(asset[0])[8] > stat[8]
+            except OSError:
+                stale = False
+            if stale:
+                log.warning('%s is older than %s, serving the plain file', filename, asset[0])
+                return False
+        with open(filename, 'rb') as file:
+            body = file.read()
+        etag = '"%08x"' % (binascii.crc32(body) & 0xFFFFFFFF)
+        encoding = 'Content-Encoding: gzip\r\n' if gzip else ''
+        headers = ('HTTP/1.0 200 OK\r\nContent-Type: %s\r\nContent-Length: %d\r\n%sETag: %s\r\n'
+                   'Cache-Control: %s\r\nVary: Accept-Encoding\r\n\r\n'
+                   % (content_type, len(body), encoding, etag, self.cache_control)).encode()
+        not_modified = f'HTTP/1.0 304 Not Modified\r\nETag: {etag}\r\n\r\n'.encode()
+        return (etag.encode(), headers, not_modified, body)
+
+    def _variant(self, asset, gzip):
+        slot = 3 if gzip else 2
+        if asset[slot] is None:
+            asset[slot] = self._load(asset, gzip)
+        return asset[slot]
+
+    def serve(self, writer, path, accept_encoding=b'', if_none_match=b''):
+        asset = self._assets[path]
+        variant = False
+        if b'gzip' in accept_encoding:
+            variant = self._variant(asset, True)
+        if not variant:
+            variant = self._variant(asset, False)
+        if not variant:
+            writer.write(b'HTTP/1.0 404 Not Found\r\n\r\n')
+            return
+        etag, headers, not_modified, body = variant
+        if if_none_match and etag in if_none_match:
+            writer.write(not_modified)
+            return
+        writer.write(headers)
+        writer.write(body)
@@ -0,0 +1,246 @@
+import hashlib
+import struct
+import time
+import uasyncio
+import usocket as socket
+from micropython import const
+import log
+import metrics
+from DN33C08 import MAX_PULSE_MS
+
+MAGIC = b'DN'
+VERSION = 1
+
+# Message types; replies have the high bit set.
+T_COMMAND = const(1)  # set, clear, toggle, pulse masks (u8 each), pulse ms (u32)
+T_QUERY = const(2)
+T_SUBSCRIBE = const(3)  # notifications for lease_ms; send again to renew
+T_UNSUBSCRIBE = const(4)
+T_REPLY = const(0x81)  # status (u8), relay state (u8), register version (u32)
+T_NOTIFY = const(0x82)  # changed relays (u8), relay state (u8), register version (u32)
+
+S_OK = const(0)
+S_BAD_REQUEST = const(1)
+S_BUSY = const(2)
+S_STALE = const(3)  # signed request not newer than the last one; version is that sequence number
+
+_HEADER = '<2sBBH'  # magic, version, type, sequence number
+_COMMAND = '<BBBBI'
+_STATUS = '<BBI'
+_HEADER_SIZE = const(6)
+_COMMAND_SIZE = const(14)
+_MAC_SIZE = const(8)
+_SO_REGISTER_HANDLER = const(20)
+
+
+def _pad_key(key, pad):
+    if len(key) > 64:
+        key = hashlib.sha256(key).digest()
+    return bytes((key[i] if i < len(key) else 0) ^ pad for i in range(64))
+
+
+class UdpControl:
+    # Relay control over single UDP datagrams, for dashboards and home
+    # automation that cannot afford a TCP handshake per action.  Every
+    # message is a 6-byte header (b'DN', version 1, type, sequence number)
+    # plus a fixed payload, see the T_* constants, all little-endian.  A
+    # request is answered by a T_REPLY carrying its sequence number and the
+    # relay state after the request has been applied.  T_COMMAND masks must
+    # not overlap; pulse relays switch on and off again after pulse ms.
+    # Subscribers get a T_NOTIFY with the server's own sequence number on
+    # every relay change.
+    #
+    # The sequence number makes retries safe: a request repeating the last
+    # number seen from that address gets the cached reply and is not
+    # applied twice.  Without a key, an older number from that address is
+    # dropped.  With a key set, every datagram ends in the first 8 bytes of
+    # HMAC-SHA256(key, message), anything that does not verify is dropped
+    # without a reply, and the sequence is one for the key, whatever the
+    # source address: a request must be newer than the last one accepted,
+    # or it is answered S_STALE with that number in the version field, so
+    # a client can continue from it.  That stops replays of captured
+    # datagrams, from any address, for the next 32767 requests of a boot;
+    # the first signed request after a reboot is always accepted.
+    #
+    # Datagrams are read as they arrive: the lwIP socket handler sets a
+    # ThreadSafeFlag, and one task drains the socket and dispatches
+    # straight to DN33C08.apply_compiled().
+    def __init__(self, dn33c08, port=5555, key='', max_clients=8, lease_ms=60000):
+        self.dn33c08 = dn33c08
+        self.port = port
+        self.max_clients = max_clients
+        self.lease_ms = lease_ms
+        self._ipad = self._opad = None
+        if key:
+            key = key.encode() if isinstance(key, str) else key
+            self._ipad = _pad_key(key, 0x36)
+            self._opad = _pad_key(key, 0x5c)
+        self._sock = None
+        self._flag = uasyncio.ThreadSafeFlag()
+        self._clients = {}  # addr -> [last sequence number, reply]
+        self._key_seq = -1  # last sequence number accepted under the key
+        self._subscribers = {}  # addr -> lease expiry, ticks_ms
+        self._notify_seq = 0
+        self.requests = {T_COMMAND: 0, T_QUERY: 0, T_SUBSCRIBE: 0, T_UNSUBSCRIBE: 0}
+        self.rejected = {'malformed': 0, 'auth': 0, 'stale': 0, 'error': 0}
+        self.retransmits = 0
+        self.latency = metrics.histogram('udp_request_us', 'UDP datagram received to reply sent')
+        metrics.counter('udp_requests_total', 'UDP requests handled',
+                        lambda: [('type="%d"' % t, n) for t, n in self.requests.items()])
+        metrics.counter('udp_rejected_total', 'UDP datagrams dropped',
+                        lambda: [('reason="%s"' % r, n) for r, n in self.rejected.items()])
+        metrics.counter('udp_retransmits_total', 'Repeated UDP requests answered from cache', lambda: self.retransmits)
+        metrics.gauge('udp_subscribers', 'UDP notification subscribers', lambda: len(self._subscribers))
+
+    def _mac(self, message):
+        inner = hashlib.sha256(self._ipad)
+        inner.update(message)
+        outer = hashlib.sha256(self._opad)
+        outer.update(inner.digest())
+        return outer.digest()[:_MAC_SIZE]
+
+    def _verify(self, message, mac):
+        expected = self._mac(message)
+        diff = 0
+        for i in range(_MAC_SIZE):
+            diff |= expected[i] ^ mac[i]
+        return diff == 0
+
+    def _pack(self, kind, seq, a, b, version):
+        message = struct.pack(_HEADER, MAGIC, VERSION, kind, seq) + struct.pack(_STATUS, a, b, version & 0xFFFFFFFF)
+        if self._ipad is not None:
+            message += self._mac(message)
+        return message
+
+    def open(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(socket.getaddrinfo('0.0.0.0', self.port)[0][-1])
+        sock.setblocking(False)
+        sock.setsockopt(socket.SOL_SOCKET, _SO_REGISTER_HANDLER, self._readable)
+        self._sock = sock
+        # Anything that arrived before the handler was in place.
+        self._flag.set()
+
+    def _readable(self, sock):
+        self._flag.set()
+
+    async def run(self):
+        self.open()
+        log.info('UDP control on port %d%s', self.port, ' (HMAC)' if self._ipad is not None else '')
+        notifier = uasyncio.create_task(self._notify())
+        sock = self._sock
+        try:
+            while True:
+                await self._flag.wait()
+                while True:
+                    try:
+                        data, addr = sock.recvfrom(64)
+                    except OSError:
+                        break
+                    try:
+                        await self._handle(data, addr)
+                    except Exception as e:
+                        # One bad datagram must not stop the socket.
+                        self.rejected['error'] += 1
+                        log.error('UDP datagram from %s dropped: %r', addr, e)
+        finally:
+            notifier.cancel()
+            sock.setsockopt(socket.SOL_SOCKET, _SO_REGISTER_HANDLER, None)
+            sock.close()
+
+    def _send(self, message, addr):
+        try:
+            self._sock.sendto(message, addr)
+        except OSError as e:
+            log.warning('UDP send to %s failed: %s', addr, e)
+
+    async def _handle(self, data, addr):
+        started = time.ticks_us()
+        size = len(data)
+        if self._ipad is not None:
+            size -= _MAC_SIZE
+        if size < _HEADER_SIZE:
+            self.rejected['malformed'] += 1
+            return
+        magic, version, kind, seq = struct.unpack_from(_HEADER, data)
+        if magic != MAGIC or version != VERSION or kind not in self.requests:
+            self.rejected['malformed'] += 1
+            return
+        if self._ipad is not None and not self._verify(data[:size], data[size:]):
+            self.rejected['auth'] += 1
+            return
+        client = self._clients.get(addr)
+        if client is not None and client[0] == seq:
+            self.retransmits += 1
+            self._send(client[1], addr)
+            return
+        dn = self.dn33c08
+        if self._ipad is not None:
+            last = self._key_seq
+            if last >= 0 and not 0 < (seq - last) & 0xFFFF < 0x8000:
+                self.rejected['stale'] += 1
+                register = dn.relay_register
+                self._send(self._pack(T_REPLY, seq, S_STALE, register.state, last), addr)
+                return
+            self._key_seq = seq
+        elif client is not None and (seq - client[0]) & 0xFFFF >= 0x8000:
+            self.rejected['stale'] += 1
+            return
+        self.requests[kind] += 1
+        status = S_OK
+        if kind == T_COMMAND:
+            status = await self._command(data, size)
+        elif kind == T_SUBSCRIBE:
+            self._subscribers[addr] = time.ticks_add(time.ticks_ms(), self.lease_ms)
+        elif kind == T_UNSUBSCRIBE:
+            self._subscribers.pop(addr, None)
+        register = dn.relay_register
+        reply = self._pack(T_REPLY, seq, status, register.state, register.version)
+        if client is None:
+            if len(self._clients) >= self.max_clients:
+                self._clients.pop(next(iter(self._clients)))
+            self._clients[addr] = [seq, reply]
+        else:
+            client[0] = seq
+            client[1] = reply
+        self._send(reply, addr)
+        self.latency.observe(time.ticks_diff(time.ticks_us(), started))
+
+    async def _command(self, data, size):
+        if size != _COMMAND_SIZE:
+            return S_BAD_REQUEST
+        set_mask, clear_mask, toggle_mask, pulse_mask, pulse_ms = struct.unpack_from(_COMMAND, data, _HEADER_SIZE)
+        if (set_mask & clear_mask or set_mask & toggle_mask or set_mask & pulse_mask or clear_mask & toggle_mask
+                or clear_mask & pulse_mask or toggle_mask & pulse_mask or (pulse_mask and not 0 < pulse_ms <= MAX_PULSE_MS)):
+            return S_BAD_REQUEST
+        pulses = [(r, pulse_ms) for r in range(8) if pulse_mask & (1 << r)]
+        touched = set_mask | clear_mask | toggle_mask | pulse_mask
+        try:
+            self.dn33c08.apply_compiled((touched, set_mask | pulse_mask, clear_mask, toggle_mask), pulses)
+        except OSError:
+            return S_BUSY
+        await self.dn33c08.sync()
+        return S_OK
+
+    async def _notify(self):
+        register = self.dn33c08.relay_register
+        flag = register.subscribe()
+        version = register.version
+        while True:
+            await flag.wait()
+            if not self._subscribers:
+                version = register.version
+                continue
+            changed = register.changed_since(version)
+            if changed is None:
+                changed = 0xFF
+            version = register.version
+            self._notify_seq = (self._notify_seq + 1) & 0xFFFF
+            message = self._pack(T_NOTIFY, self._notify_seq, changed, register.state, version)
+            now = time.ticks_ms()
+            for addr, expiry in list(self._subscribers.items()):
+                if time.ticks_diff(expiry, now) < 0:
+                    del self._subscribers[addr]
+                else:
+                    self._send(message, addr)
@@ -1,36 +1,231 @@
+import binascii
+import time
+import ujson
 import uasyncio
 import network
-from machine import Pin, Timer
-import socket
 from NetworkCredentials import NetworkCredentials
 from Settings import Settings
+import atomicfile
+import log
+import metrics
+
+DOWN = 0
+CONNECTING = 1
+CONFIGURING = 2
+UP = 3
+
+# Millisecond buckets for the reconnect time histogram.
+RECONNECT_MS = (250, 500, 1000, 2000, 5000, 10000, 20000, 60000)
+
 
 class WifiConnection:
-    def __init__(self, dn33c08=None):
+    # Keeps the station connected with a small state machine run by
+    # start_and_maintain_connection():
+    #
+    #   down -> connecting -> configuring -> up -> (link lost) -> down
+    #
+    # After a successful connect the access point's BSSID and channel (where
+    # the port reports them) and the IP configuration in use are cached in
+    # wifi.json.  A reconnect within fast_window_ms of losing the link, or
+    # the first connect after boot, takes the fast path: the radio stays
+    # on, connect() is pinned to the cached BSSID so the firmware can skip
+    # its scan, and the cached IP configuration is applied straight away.
+    # While the AP stays away the fast path is retried every
+    # check_interval_ms (unpinned after the first try, in case the AP was
+    # replaced).  Once the window has passed, or if the cached IP
+    # configuration no longer works, the full path power-cycles the radio,
+    # connects to any AP with the SSID and applies the static IP from
+    # Settings, falling back to DHCP.
+    #
+    # Nothing here blocks the event loop: connectivity is probed with a
+    # non-blocking TCP connect to probe_addr bounded by probe_timeout_ms.
+    # The time from losing the link (or from boot) to being up again is
+    # recorded in the wifi_reconnect_ms histogram.
+    cache_path = 'wifi.json'
+    probe_addr = ('8.8.8.8', 53)
+
+    def __init__(self, dn33c08=None, check_interval_ms=1000, fast_window_ms=30000, fast_timeout_ms=5000,
+                 connect_timeout_ms=20000, probe_timeout_ms=2000, retry_ms=5000):
         self.dn33c08 = dn33c08
         self.wlan = network.WLAN(network.STA_IF)
         self.status = network.STAT_IDLE
-        self.connection_timer = Timer(-1)
+        self.state = DOWN
+        self.check_interval_ms = check_interval_ms
+        self.fast_window_ms = fast_window_ms
+        self.fast_timeout_ms = fast_timeout_ms
+        self.connect_timeout_ms = connect_timeout_ms
+        self.probe_timeout_ms = probe_timeout_ms
+        self.retry_ms = retry_ms
+        self.cache = self._load_cache()
+        self.down_since = time.ticks_ms()
+        self.last_reconnect_ms = -1
+        self.connects = {'fast': 0, 'full': 0}
+        self.failures = 0
+        self._fast_attempts = 0  # failed fast attempts in the current outage
+        self._up = uasyncio.Event()
+        self.reconnect_ms = metrics.histogram('wifi_reconnect_ms', 'Link lost (or boot) to Wi-Fi up again, ms',
+                                              RECONNECT_MS)
+        metrics.gauge('wifi_state', 'Wi-Fi state: 0 down, 1 connecting, 2 configuring, 3 up', lambda: self.state)
+        metrics.gauge('wifi_last_reconnect_ms', 'Duration of the last reconnect', lambda: self.last_reconnect_ms)
+        metrics.counter('wifi_connects_total', 'Successful connects by path',
+                        lambda: [('path="%s"' % path, n) for path, n in self.connects.items()])
+        metrics.counter('wifi_connect_failures_total', 'Failed connect attempts', lambda: self.failures)
         if self.dn33c08:
             self.dn33c08.register_button_callback(3, self.display_ip_from_settings)
             self.dn33c08.register_button_callback(4, self.display_ip)
 
-    def start_and_maintain_connection(self, check_interval_ms=30000):
-        self.connection_timer.init(period=check_interval_ms, mode=Timer.PERIODIC, callback=self._check_connection)
+    def is_up(self):
+        return self.state == UP
 
-    def _check_connection(self, timer):
-        if not self.wlan.isconnected():
-            print("WiFi disconnected. Attempting to reconnect...")
-            uasyncio.create_task(self._reconnect())
-        else:
-            print("WiFi is connected. IP:", self.wlan.ifconfig())
+    async def wait_connected(self):
+        await self._up.wait()
 
-    async def _reconnect(self):
-        connected = await self.connect()
-        if not connected:
-            print("Reconnection failed")
+    async def start_and_maintain_connection(self):
+        while True:
+            if self.state == UP:
+                if self.wlan.isconnected():
+                    await uasyncio.sleep_ms(self.check_interval_ms)
+                    continue
+                log.warning('WiFi link lost')
+                self._set_state(DOWN)
+                self.down_since = time.ticks_ms()
+            if await self._reconnect():
+                continue
             if self.dn33c08:
                 self.dn33c08.blink_led(4)
+            await uasyncio.sleep_ms(self.check_interval_ms if self._fast_attempts else self.retry_ms)
+
+    def _set_state(self, state):
+        self.state = state
+        if state == UP:
+            self._up.set()
+        else:
+            self._up.clear()
+
+    async def _reconnect(self):
+        outage = time.ticks_diff(time.ticks_ms(), self.down_since)
+        path = None
+        if self.cache and outage < self.fast_window_ms:
+            if await self._connect_fast(pin_bssid=self._fast_attempts == 0):
+                path = 'fast'
+            elif self.status != network.STAT_GOT_IP:
+                # The AP is not back yet; a radio power cycle would not help.
+                self._fast_attempts += 1
+                self.failures += 1
+                self._set_state(DOWN)
+                return False
+            else:
+                log.info('Cached IP configuration rejected, reconnecting from scratch')
+        if path is None and await self.connect():
+            path = 'full'
+        if path is None:
+            self.failures += 1
+            self._set_state(DOWN)
+            log.warning('Reconnection failed with status %d', self.status)
+            return False
+        elapsed = time.ticks_diff(time.ticks_ms(), self.down_since)
+        self.last_reconnect_ms = elapsed
+        self.reconnect_ms.observe(elapsed)
+        self.connects[path] += 1
+        self._fast_attempts = 0
+        self._set_state(UP)
+        self._save_cache()
+        log.info('WiFi up (%s path) in %d ms, IP %s', path, elapsed, self.wlan.ifconfig()[0])
+        return True
+
+    async def _connect_fast(self, pin_bssid=True):
+        self._set_state(CONNECTING)
+        wlan = self.wlan
+        if not wlan.active():
+            wlan.active(True)
+        bssid = self.cache.get('bssid')
+        if bssid and pin_bssid:
+            wlan.connect(NetworkCredentials.ssid, NetworkCredentials.password, bssid=binascii.unhexlify(bssid))
+        else:
+            wlan.connect(NetworkCredentials.ssid, NetworkCredentials.password)
+        if not await self.wait_for_connection(self.fast_timeout_ms):
+            return False
+        self._set_state(CONFIGURING)
+        wlan.ifconfig(tuple(self.cache['ifconfig']))
+        return await self.probe()
+
+    async def connect(self):
+        log.info('Connecting to Wi-Fi - please wait')
+        self._set_state(CONNECTING)
+        wlan = self.wlan
+        wlan.active(False)
+        await uasyncio.sleep_ms(300)
+        wlan.active(True)
+        wlan.connect(NetworkCredentials.ssid, NetworkCredentials.password)
+        if not await self.wait_for_connection(self.connect_timeout_ms):
+            log.warning('Connection failed with status: %d', self.status)
+            self.display_actual_ip()
+            return False
+        self._set_state(CONFIGURING)
+        if Settings.ip:
+            log.info('Trying static IP: %s', Settings.ip)
+            wlan.ifconfig((Settings.ip, Settings.subnet_mask, Settings.gateway, Settings.dns_server))
+            if await self.probe():
+                return True
+            log.warning('Static IP configuration failed. Falling back to DHCP.')
+        wlan.ifconfig('dhcp')
+        deadline = time.ticks_add(time.ticks_ms(), 5000)
+        while wlan.ifconfig()[0] in ('0.0.0.0', Settings.ip) and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            await uasyncio.sleep_ms(100)
+        return True
+
+    async def probe(self):
+        # Non-blocking TCP connect; True once probe_addr accepts.
+        try:
+            reader, writer = await uasyncio.wait_for_ms(uasyncio.open_connection(*self.probe_addr),
+                                                        self.probe_timeout_ms)
+        except Exception:
+            return False
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        return True
+
+    async def wait_for_connection(self, timeout_ms):
+        deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+        while True:
+            self.status = self.wlan.status()
+            if self.status < 0 or self.status >= network.STAT_GOT_IP:
+                break
+            if time.ticks_diff(deadline, time.ticks_ms()) <= 0:
+                break
+            await uasyncio.sleep_ms(50)
+        return self.status == network.STAT_GOT_IP
+
+    def _load_cache(self):
+        text = atomicfile.read(self.cache_path)
+        if text is None:
+            return None
+        try:
+            cache = ujson.loads(text)
+        except ValueError:
+            return None
+        if cache.get('ssid') != NetworkCredentials.ssid or len(cache.get('ifconfig', ())) != 4:
+            return None
+        return cache
+
+    def _save_cache(self):
+        wlan = self.wlan
+        cache = {'ssid': NetworkCredentials.ssid, 'ifconfig': list(wlan.ifconfig())}
+        for key in ('bssid', 'channel'):
+            try:
+                value = wlan.config(key)
+            except (ValueError, OSError, KeyError):
+                continue
+            cache[key] = binascii.hexlify(value).decode() if isinstance(value, bytes) else value
+        if cache == self.cache:
+            return
+        self.cache = cache
+        try:
+            atomicfile.write(self.cache_path, ujson.dumps(cache))
+        except OSError as e:
+            log.error('Saving %s failed: %s', self.cache_path, e)
 
     def display_ip_from_settings(self, button=2):
         self.display_ip(Settings.ip, button*600)
@@ -51,56 +246,3 @@ class WifiConnection:
         display_value = f"{third_octet_last_digit}{int(last_octet):3d}"
         print(f"Displaying IP: {display_value}")
         self.dn33c08.set_display(display_value, ".   ", duration)
-
-    async def connect(self):
-        print(f"Connecting to Wi-Fi - please wait")
-        self.wlan.active(False)
-        await uasyncio.sleep_ms(300)
-        self.wlan.active(True)
-        self.wlan.connect(NetworkCredentials.ssid, NetworkCredentials.password)
-        await self.wait_for_connection()
-        print(f"Status after wait_for_connection: {self.status}")
-        if self.status == network.STAT_GOT_IP:
-            print("Attempting to set static IP")
-            if await self.try_static_ip(Settings.ip):
-                return True
-            
-            print("Static IP configuration failed. Falling back to DHCP.")
-            self.wlan.ifconfig('dhcp')
-            await uasyncio.sleep(5)  # Wait for DHCP to assign an IP
-            print(f"Connected with DHCP. IP: {self.wlan.ifconfig()[0]}")
-            return True
-        else:
-            print(f"Connection failed with status: {self.status}")
-            self.display_actual_ip()
-        return False
-
-    async def ping_test(self):
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(4)
-            s.connect(("8.8.8.8", 53))
-            s.close()
-            return True
-        except:
-            return False
-
-    async def try_static_ip(self, ip):
-        print(f"Trying static IP: {ip}")
-        self.wlan.ifconfig((ip, Settings.subnet_mask, Settings.gateway, Settings.dns_server))
-        await uasyncio.sleep(2)  # Wait for settings to apply
-        if await self.ping_test():
-            print(f"Connected successfully with IP: {ip}")
-            return True
-        return False
-
-    async def wait_for_connection(self):
-        max_wait = 20
-        while max_wait > 0:
-            self.status = self.wlan.status()
-            print(f"Current status: {self.status}")
-            if self.status < 0 or self.status >= 3:
-                break
-            max_wait -= 1
-            await uasyncio.sleep(1)
-        print(f"Final status after waiting: {self.status}")
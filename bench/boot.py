@@ -0,0 +1,86 @@
+# boot.py: time from power-up to relays responding, with Wi-Fi down
+#
+#     python -m bench.boot
+#
+# Boots main.py on a board whose access point is unreachable, presses two
+# wall switches shortly after power-up and reports when input processing
+# started and when the first press was acted on (virtual ms since
+# power-up), plus the host time spent importing and constructing the
+# firmware.  Then cuts power with a relay timer running, boots again and
+# checks that the relays and the remaining timer time were restored.
+# The imports run on the realtime clock, so the boot profile recorded by
+# lib/bootprof.py shows host time for those phases.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench import harness
+from bench.harness import print_table, quiet
+from sim import machine
+from sim.clock import clock
+
+
+def boot(run_ms, presses=()):
+    harness.fresh_board(start_ms=0)
+    from sim import network
+    network.WLAN.ap_available = False
+    started = time.perf_counter_ns()
+    clock.set_realtime(True)
+    with quiet():
+        import main
+    clock.set_realtime(False)
+    import_ms = (time.perf_counter_ns() - started) / 1e6
+    import uasyncio
+
+    async def scenario():
+        task = uasyncio.create_task(main.main())
+        for at_ms, input_id in presses:
+            await uasyncio.sleep_ms(at_ms - clock.ticks_ms())
+            pin = machine.Pin(harness.INPUT_PINS[input_id - 1])
+            pin.drive(0)
+            await uasyncio.sleep_ms(50)
+            pin.drive(1)
+        await uasyncio.sleep_ms(max(0, run_ms - clock.ticks_ms()))
+        task.cancel()
+
+    with quiet():
+        uasyncio.run(scenario())
+    network.WLAN.ap_available = True
+    return main, import_ms
+
+
+def main(argv):
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(harness.sim.ROOT, 'config.py'), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        # Input 1 is Timed (12 s) on relay 1, input 3 toggles relay 3.
+        first, import_ms = boot(4000, presses=((20, 1), (100, 3)))
+        dn = first.dn33c08
+        rows = [{'boot': 'cold, no Wi-Fi', 'host_import_ms': import_ms,
+                 'inputs_ready_ms': dn.boot_ready_ms, 'first_response_ms': dn.first_response_ms,
+                 'relays': '%02x' % dn.relay_register.state,
+                 'relay1_timer_ms': dn.get_timer_remaining(1), 'snapshot_writes': first.snapshot.writes}]
+        second, import_ms = boot(100)
+        dn = second.dn33c08
+        rows.append({'boot': 'after power cut', 'host_import_ms': import_ms,
+                     'inputs_ready_ms': dn.boot_ready_ms,
+                     'relays': '%02x' % dn.relay_register.state,
+                     'relay1_timer_ms': dn.get_timer_remaining(1)})
+        import bootprof
+        print_table('Boot profile (second boot)', ('phase', 'us', 'at_ms'),
+                    [{'phase': name, 'us': us, 'at_ms': at_ms} for name, us, heap, at_ms in bootprof.phases])
+        print_table('Boot with the access point unreachable',
+                    ('boot', 'host_import_ms', 'inputs_ready_ms', 'first_response_ms', 'relays',
+                     'relay1_timer_ms', 'snapshot_writes'), rows)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,90 @@
+# display.py: CPU cost of multiplexing the 4-digit LED display
+#
+#     python -m bench.display [--seconds S]
+#
+# Runs each refresh strategy for S simulated seconds and reports the pin
+# writes per timer callback (how long one refresh IRQ blocks the input
+# IRQs on the device) and per second, the host CPU time spent in refresh
+# per simulated second, and whether the words latched into the 74HC595s
+# match the requested digits.  On the board, set display.profile = True
+# and read refresh_us / refresh_ticks for the same figure in real time.
+
+import sys
+import time
+
+from bench import harness
+from bench.harness import print_table
+from sim import machine
+from sim.clock import clock
+
+LATCH, CLOCK, DATA = 9, 10, 11
+
+
+class ShiftRegisterProbe:
+    # Decodes the words latched into the 74HC595 chain.
+    def __init__(self, display):
+        self.display = display
+        self.shift = 0
+        self.latched = []
+        self.pin_writes = 0
+        machine.output_hooks.append(self._on_write)
+
+    def close(self):
+        machine.output_hooks.remove(self._on_write)
+
+    def _on_write(self, pin_id, level):
+        if pin_id not in (LATCH, CLOCK, DATA):
+            return
+        self.pin_writes += 1
+        if pin_id == CLOCK and level:
+            self.shift = ((self.shift << 1) | machine.Pin(DATA)._level) & 0xFFFF
+        elif pin_id == LATCH and level:
+            if self.display.backend == 'spi':
+                high, low = self.display.spi.last
+                self.latched.append((high << 8) | low)
+            else:
+                self.latched.append(self.shift)
+
+
+def run(strategy, seconds):
+    harness.fresh_board()
+    from LED_8SEG import LED_8SEG
+    backend = 'spi' if strategy == 'spi' else 'bitbang'
+    display = LED_8SEG(backend=backend)
+    probe = ShiftRegisterProbe(display)
+    content = '    ' if strategy == 'blank' else 'AD23'
+    if strategy == 'legacy':
+        # The previous engine: all four digits from a 12 ms periodic timer.
+        display.set_buffer(content, ' .  ')
+        display.refresh_timer.init(period=12, mode=machine.Timer.PERIODIC, callback=lambda t: display.update_display())
+    else:
+        display.set_display(content, ' .  ' if strategy != 'blank' else '    ', 0)
+    probe.pin_writes = 0
+    probe.latched = []
+    started = time.perf_counter_ns()
+    clock.advance(seconds * 1000)
+    elapsed = time.perf_counter_ns() - started
+    probe.close()
+    period = 12 if strategy == 'legacy' else display.tick_ms
+    ticks = seconds * 1000 / period if probe.pin_writes else 0
+    expected = set(display.frames)
+    correct = all(word in expected for word in probe.latched)
+    return {'strategy': strategy, 'refreshing': display.refreshing or strategy == 'legacy',
+            'digit_hz': len(probe.latched) / seconds / 4,
+            'pin_writes_per_irq': probe.pin_writes / ticks if ticks else 0,
+            'pin_writes_per_s': probe.pin_writes / seconds,
+            'host_us_per_s': elapsed / 1000 / seconds,
+            'frames_ok': correct}
+
+
+def main(argv):
+    seconds = 5
+    if '--seconds' in argv:
+        seconds = float(argv[argv.index('--seconds') + 1])
+    rows = [run(s, seconds) for s in ('legacy', 'bitbang', 'spi', 'blank')]
+    print_table(f'Display refresh over {seconds:g} simulated seconds',
+                ('strategy', 'refreshing', 'digit_hz', 'pin_writes_per_irq', 'pin_writes_per_s', 'host_us_per_s', 'frames_ok'), rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,126 @@
+# dualcore.py: input latency with the I/O engine on its own core
+#
+#     python -m bench.dualcore [--presses N] [--busy-ms N] [--switch-us N]
+#
+# Runs the same workload twice on the realtime clock: once with everything
+# on the event loop (process_input_queue), once with the IOEngine on a
+# second thread standing in for core 1.  Meanwhile the event loop is kept
+# busy the way a TLS handshake or a large HTTP response would keep it: a
+# task runs --busy-ms of pure Python work between yields, and another
+# toggles relay 8 through apply_commands() every 50 ms and waits for it to
+# be applied.  A third thread plays the wiring and presses inputs 1-7
+# (all mapped to Toggle) at random intervals.
+#
+# Reported per mode: press-to-relay latency, lost presses, and the
+# apply_commands() -> applied round trip seen by the event loop.
+#
+# CPython threads share the GIL, so the "cores" only approximate running
+# in parallel: the interpreter is made to switch threads every
+# --switch-us (default 200 us) instead of every 5 ms.  The numbers show
+# the isolation, not RP2040 latencies.
+
+import random
+import sys
+import threading
+import time
+
+from bench import harness
+from bench.harness import Probe, latency_summary, print_table, quiet
+
+
+def run(mode, presses, busy_ms):
+    with quiet():
+        harness.fresh_board()
+        harness.sim.install(realtime=True)
+        import uasyncio
+        from DN33C08 import DN33C08
+        dn = DN33C08()
+    for i in range(1, 9):
+        dn.register_input_output_mapping(i, i, 'Toggle', 0)
+    dn.debounce = 20
+    probe = Probe()
+    round_trips = []
+    engine = None
+
+    def wiring():
+        rng = random.Random(1)
+        for n in range(presses):
+            input_id = n % 7 + 1
+            probe.edge(input_id, 0, (input_id,))
+            time.sleep(rng.uniform(0.03, 0.06))
+            probe.edge(input_id, 1)
+            time.sleep(rng.uniform(0.03, 0.06))
+
+    async def load():
+        total = 0
+        while True:
+            end = time.perf_counter() + busy_ms / 1000
+            while time.perf_counter() < end:
+                total += sum(range(200))
+            await uasyncio.sleep_ms(0)
+
+    async def commands():
+        while True:
+            await uasyncio.sleep_ms(50)
+            started = time.perf_counter_ns()
+            dn.apply_commands((('toggle', 8),))
+            await dn.sync()
+            round_trips.append(time.perf_counter_ns() - started)
+
+    async def scenario():
+        nonlocal engine
+        if mode == 'dual core':
+            from IOEngine import IOEngine
+            engine = IOEngine(dn)
+            engine.start()
+            io_task = uasyncio.create_task(engine.pump())
+        else:
+            io_task = uasyncio.create_task(dn.process_input_queue())
+        tasks = [io_task, uasyncio.create_task(load()), uasyncio.create_task(commands())]
+        driver = threading.Thread(target=wiring)
+        driver.start()
+        while driver.is_alive():
+            await uasyncio.sleep_ms(20)
+        await uasyncio.sleep_ms(100)
+        for task in tasks:
+            task.cancel()
+        if engine is not None:
+            engine.stop()
+
+    with quiet():
+        uasyncio.run(scenario())
+    harness.sim.install(realtime=False)
+    probe.finish()
+    row = {'mode': mode}
+    row.update(latency_summary(probe.latencies_ns))
+    row['lost'] = probe.dropped
+    row['cmd_p50_us'] = latency_summary(round_trips)['p50_us']
+    row['cmd_max_us'] = latency_summary(round_trips)['max_us']
+    row['engine_loop_max_us'] = engine.loop_max_us if engine else ''
+    return row
+
+
+def main(argv):
+    presses = 100
+    busy_ms = 20
+    switch_us = 200
+    if '--presses' in argv:
+        presses = int(argv[argv.index('--presses') + 1])
+    if '--busy-ms' in argv:
+        busy_ms = int(argv[argv.index('--busy-ms') + 1])
+    if '--switch-us' in argv:
+        switch_us = int(argv[argv.index('--switch-us') + 1])
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(switch_us / 1000000)
+    try:
+        rows = [run(mode, presses, busy_ms) for mode in ('single loop', 'dual core')]
+    finally:
+        sys.setswitchinterval(interval)
+    print_table('Press to relay with the event loop busy %d ms between yields (%d presses, host time)'
+                % (busy_ms, presses),
+                ('mode', 'n', 'p50_us', 'p95_us', 'p99_us', 'max_us', 'lost', 'cmd_p50_us', 'cmd_max_us',
+                 'engine_loop_max_us'), rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
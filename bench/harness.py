@@ -0,0 +1,119 @@
+# harness.py: shared plumbing for the host benchmarks
+#
+# Every scenario gets a fresh simulated board.  Probe timestamps injected
+# input edges with the host's perf counter and matches them against the
+# relay writes they cause, so latencies measure the Python work between
+# the IRQ handler and the relay pin (virtual time does not move while the
+# firmware computes).
+
+import sys
+import time
+
+import sim
+
+sim.install()
+
+from sim import machine
+from sim.clock import clock
+
+INPUT_PINS = (3, 4, 5, 6, 7, 8, 14, 15)
+RELAY_PINS = (13, 12, 28, 27, 26, 19, 17, 16)
+RELAY_BY_PIN = {pin: i + 1 for i, pin in enumerate(RELAY_PINS)}
+
+
+def fresh_board(start_ms=1000):
+    # Reset the board and advance past the firmware's initial debounce window.
+    sim.reset()
+    sim.install()
+    clock.advance(start_ms)
+
+
+class Probe:
+    def __init__(self):
+        self.pending = {}
+        self.latencies_ns = []
+        self.relay_writes = 0
+        self.edges = 0
+        self.expected = 0
+        self.dropped = 0
+        machine.output_hooks.append(self._on_write)
+
+    def close(self):
+        machine.output_hooks.remove(self._on_write)
+
+    def _on_write(self, pin_id, level):
+        relay_id = RELAY_BY_PIN.get(pin_id)
+        if relay_id is None:
+            return
+        self.relay_writes += 1
+        started = self.pending.pop(relay_id, None)
+        if started is not None:
+            self.latencies_ns.append(time.perf_counter_ns() - started)
+
+    def edge(self, input_id, level, relay_ids=()):
+        # Drive an input pin; relay_ids lists the relays this edge must write.
+        self.edges += 1
+        now = time.perf_counter_ns()
+        for relay_id in relay_ids:
+            if relay_id in self.pending:
+                self.dropped += 1
+            self.pending[relay_id] = now
+            self.expected += 1
+        machine.Pin(INPUT_PINS[input_id - 1]).drive(level)
+
+    def finish(self):
+        self.dropped += len(self.pending)
+        self.pending = {}
+        self.close()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(latencies_ns):
+    return {
+        'n': len(latencies_ns),
+        'p50_us': percentile(latencies_ns, 50) / 1000,
+        'p95_us': percentile(latencies_ns, 95) / 1000,
+        'p99_us': percentile(latencies_ns, 99) / 1000,
+        'max_us': max(latencies_ns) / 1000 if latencies_ns else 0,
+    }
+
+
+def print_table(title, columns, rows):
+    print(title)
+    widths = [max(len(str(c)), *(len(_fmt(r.get(c, ''))) for r in rows)) for c in columns]
+    print('  '.join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(_fmt(row.get(c, '')).ljust(w) for c, w in zip(columns, widths)))
+    print()
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f'{value:.1f}'
+    return str(value)
+
+
+class quiet:
+    # Swallow the firmware's console prints while a scenario runs.
+    def __enter__(self):
+        self._stdout = sys.stdout
+        sys.stdout = _Null()
+        return self
+
+    def __exit__(self, *exc):
+        sys.stdout = self._stdout
+
+
+class _Null:
+    def write(self, s):
+        return len(s)
+
+    def flush(self):
+        pass
@@ -0,0 +1,129 @@
+# http.py: HttpServer routing cost, slow clients and connection limits
+#
+#     python -m bench.http [--requests N] [--slow N]
+#
+# Times the route lookup for each URL the web page uses (host time), then
+# serves N real requests over loopback and reports host latency.  Then
+# opens --slow connections that send half a request line and stall, and
+# shows that a well-behaved client is refused with an immediate 503 while
+# they hold every slot, and served again once the header deadline has
+# dropped them (simulated time).  Finally checks the header size cap.
+
+import sys
+import time
+
+from bench import harness
+from bench.harness import percentile, print_table, quiet
+from sim.clock import clock
+
+URLS = ('/', '/relay_states?since=3', '/events', '/toggle_relay5', '/update_name2?name=Garden%20light',
+        '/metrics', '/nope')
+
+
+def main(argv):
+    requests = 200
+    slow = 6
+    if '--requests' in argv:
+        requests = int(argv[argv.index('--requests') + 1])
+    if '--slow' in argv:
+        slow = int(argv[argv.index('--slow') + 1])
+    with quiet():
+        harness.fresh_board()
+        from DN33C08 import DN33C08
+        from EventStream import EventStream
+        from HttpServer import HttpServer
+        from StaticAssets import StaticAssets
+        dn = DN33C08()
+    import uasyncio
+    server = HttpServer(max_connections=4, header_timeout_ms=5000)
+    assets = StaticAssets()
+    assets.add('/', 'relays_overview.html', 'text/html')
+    assets.register_routes(server)
+    EventStream(dn).register_routes(server)
+    dn.register_routes(server)
+
+    async def nothing(req):
+        req.send('200 OK')
+
+    server.route('GET', '/metrics', nothing)
+
+    rows = []
+    for url in URLS:
+        path = url.partition('?')[0]
+        n = 20000
+        started = time.perf_counter_ns()
+        for _ in range(n):
+            server.match(path, {})
+        rows.append({'url': url, 'matched': bool(server.match(path, {})),
+                     'us_per_lookup': (time.perf_counter_ns() - started) / n / 1000})
+    print_table('Route lookup', ('url', 'matched', 'us_per_lookup'), rows)
+
+    results = {}
+
+    async def get(port, target, extra=b''):
+        reader, writer = await uasyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET %s HTTP/1.0\r\n%s\r\n' % (target.encode(), extra))
+        await writer.drain()
+        response = await reader.read(-1)
+        await writer.wait_closed()
+        return response
+
+    async def scenario():
+        listener = await server.start('127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+
+        latencies = []
+        for i in range(requests):
+            started = time.perf_counter_ns()
+            response = await get(port, '/relay_states?since=%d' % i)
+            latencies.append(time.perf_counter_ns() - started)
+            assert response.startswith(b'HTTP/1.0 200'), response
+        results['latency'] = latencies
+
+        stalled = []
+        for _ in range(slow):
+            reader, writer = await uasyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /relay_sta')
+            await writer.drain()
+            stalled.append((reader, writer))
+        await uasyncio.sleep_ms(10)
+        started = clock.ticks_ms()
+        response = await get(port, '/relay_states')
+        results['busy_status'] = response.split(b'\r\n')[0].decode()
+        results['busy_ms'] = clock.ticks_ms() - started
+        started = clock.ticks_ms()
+        while True:
+            response = await get(port, '/relay_states')
+            if response.startswith(b'HTTP/1.0 200'):
+                break
+            await uasyncio.sleep_ms(100)
+        results['recovered_ms'] = clock.ticks_ms() - started
+        for reader, writer in stalled:
+            await writer.wait_closed()
+
+        response = await get(port, '/relay_states', b'X-Filler: %s\r\n' % (b'x' * 4000))
+        results['oversized_status'] = response.split(b'\r\n')[0].decode()
+        response = await get(port, '/update_name2?name=Garden%20light')
+        results['renamed'] = dn.relay_names[1]
+        listener.close()
+
+    with quiet():
+        uasyncio.run(scenario())
+
+    latencies = results['latency']
+    print_table('Sequential GET /relay_states over loopback (host time)',
+                ('requests', 'p50_us', 'p95_us', 'max_us'),
+                [{'requests': len(latencies), 'p50_us': percentile(latencies, 50) / 1000,
+                  'p95_us': percentile(latencies, 95) / 1000, 'max_us': max(latencies) / 1000}])
+    print_table('%d stalled clients, max_connections=%d, header_timeout_ms=%d (simulated time)'
+                % (slow, server.max_connections, server.header_timeout_ms),
+                ('busy_response', 'busy_ms', 'served_again_after_ms', 'rejected', 'timeouts'),
+                [{'busy_response': results['busy_status'], 'busy_ms': results['busy_ms'],
+                  'served_again_after_ms': results['recovered_ms'], 'rejected': server.rejected,
+                  'timeouts': server.timeouts}])
+    print_table('Header cap and URL decoding', ('oversized_headers', 'renamed_to'),
+                [{'oversized_headers': results['oversized_status'], 'renamed_to': results['renamed']}])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
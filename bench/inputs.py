@@ -0,0 +1,122 @@
+# inputs.py: edge-to-relay latency, queue throughput and dropped events
+#
+#     python -m bench.inputs [--cycles N] [--burst N] [--stall N]
+#
+# "behavior" rows drive press/release cycles with clean edges into every
+# input mapped 1:1 onto its relay.  "bounce" adds contact chatter to every
+# press.  "burst" fires an IRQ storm at one edge per millisecond and only
+# lets the event loop run every --stall edges, the way a long HTTP response
+# or TLS handshake would, then measures throughput and lost events.
+
+import sys
+import time
+
+from bench import harness
+from bench.harness import Probe, clock, latency_summary, print_table, quiet
+
+BEHAVIORS = ('Toggle', 'Timed', 'Timer_resets', 'On_while_activated')
+DURATION_MS = 5000
+
+
+def _boot(behavior):
+    harness.fresh_board()
+    import uasyncio
+    from DN33C08 import DN33C08
+    dn = DN33C08()
+    for i in range(1, 9):
+        dn.register_input_output_mapping(i, i, behavior, DURATION_MS)
+    return uasyncio, dn
+
+
+def run_behavior(behavior, cycles, bounce=False):
+    with quiet():
+        uasyncio, dn = _boot(behavior)
+        probe = Probe()
+
+        async def drive():
+            consumer = uasyncio.create_task(dn.process_input_queue())
+            for n in range(cycles):
+                input_id = n % 8 + 1
+                probe.edge(input_id, 0, (input_id,))
+                if bounce:
+                    for level in (1, 0, 1, 0):
+                        clock.advance(1)
+                        probe.edge(input_id, level)
+                await uasyncio.sleep_ms(50)
+                release = (input_id,) if behavior == 'On_while_activated' else ()
+                probe.edge(input_id, 1, release)
+                await uasyncio.sleep_ms(400)
+            await uasyncio.sleep_ms(10)
+            consumer.cancel()
+
+        started = clock.ticks_ms()
+        uasyncio.run(drive())
+        probe.finish()
+    row = {'scenario': ('bounce/' if bounce else '') + behavior, 'edges': probe.edges,
+           'expected': probe.expected, 'dropped': probe.dropped,
+           'virtual_ms': clock.ticks_ms() - started}
+    row.update(latency_summary(probe.latencies_ns))
+    return row
+
+
+def run_burst(presses, stall):
+    with quiet():
+        uasyncio, dn = _boot('Toggle')
+        dn.debounce = 0
+        probe = Probe()
+        peak = [0]
+
+        async def drive():
+            consumer = uasyncio.create_task(dn.process_input_queue())
+            await uasyncio.sleep_ms(0)
+            started = time.perf_counter_ns()
+            for n in range(presses):
+                input_id = n % 8 + 1
+                probe.edge(input_id, 0, ())
+                clock.advance(1)
+                probe.edge(input_id, 1)
+                clock.advance(1)
+                if probe.edges % stall == 0:
+                    peak[0] = max(peak[0], dn.input_events.count())
+                    await uasyncio.sleep_ms(0)
+            probe.expected = presses
+            for _ in range(1000):
+                if not dn.input_events.count():
+                    break
+                await uasyncio.sleep_ms(0)
+            elapsed = time.perf_counter_ns() - started
+            consumer.cancel()
+            return elapsed
+
+        elapsed_ns = uasyncio.run(drive())
+        probe.close()
+    processed = probe.relay_writes
+    return {'scenario': f'burst/{presses}/stall{stall}', 'edges': probe.edges, 'expected': presses,
+            'dropped': presses - processed, 'overflows': dn.input_events.overflows, 'queue_peak': peak[0],
+            'events_per_s': processed / (elapsed_ns / 1e9) if elapsed_ns else 0,
+            'host_ms': elapsed_ns / 1e6}
+
+
+def main(argv):
+    cycles = 200
+    burst = 400
+    stall = 16
+    if '--cycles' in argv:
+        cycles = int(argv[argv.index('--cycles') + 1])
+    if '--burst' in argv:
+        burst = int(argv[argv.index('--burst') + 1])
+    if '--stall' in argv:
+        stall = int(argv[argv.index('--stall') + 1])
+
+    rows = [run_behavior(b, cycles) for b in BEHAVIORS]
+    rows.append(run_behavior('Toggle', cycles, bounce=True))
+    print_table('Edge-to-relay latency (host CPU time, IRQ handler to relay pin write)',
+                ('scenario', 'edges', 'expected', 'dropped', 'n', 'p50_us', 'p95_us', 'p99_us', 'max_us', 'virtual_ms'),
+                rows)
+    print_table('Input queue throughput under an IRQ burst',
+                ('scenario', 'edges', 'expected', 'dropped', 'overflows', 'queue_peak', 'events_per_s', 'host_ms'),
+                [run_burst(burst, stall), run_burst(burst, stall * 4)])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
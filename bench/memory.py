@@ -0,0 +1,79 @@
+# memory.py: heap footprint of the runtime model and allocations per input
+#
+#     python -m bench.memory [--events N]
+#
+# Measures with tracemalloc on the host: the Python heap retained by
+# constructing DN33C08 (pins, tables, queues, timers), then drives N
+# press/release edges per behavior through the IRQ handler and the event
+# dispatcher and reports the bytes still held afterwards (growth; a few
+# hundred bytes are tracemalloc's own bookkeeping) and the largest
+# transient allocation of a single press/release pair, including the
+# simulator's own work (what fragments the heap on the device).  On the
+# board, wrap the same calls in gc.mem_alloc() with gc.disable() for
+# device figures.
+
+import sys
+import tracemalloc
+
+from bench import harness
+from bench.harness import print_table, quiet
+from sim import machine
+from sim.clock import clock
+
+BEHAVIORS = ('Toggle', 'Timed', 'Timer_resets', 'On_while_activated')
+
+
+def main(argv):
+    events = 1000
+    if '--events' in argv:
+        events = int(argv[argv.index('--events') + 1])
+    with quiet():
+        harness.fresh_board()
+        from DN33C08 import DN33C08
+        DN33C08()
+        harness.fresh_board()
+        from DN33C08 import DN33C08
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        dn = DN33C08()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    footprint = sum(s.size_diff for s in stats)
+    blocks = sum(s.count_diff for s in stats)
+    print_table('DN33C08() footprint', ('bytes', 'blocks'), [{'bytes': footprint, 'blocks': blocks}])
+
+    rows = []
+    for i, behavior in enumerate(BEHAVIORS):
+        input_id = i + 1
+        dn.register_input_output_mapping(input_id, input_id, behavior, 5000)
+        pin = machine.Pin(harness.INPUT_PINS[i])
+
+        def edge(level):
+            pin.drive(level)
+            dn.input_events.drain(dn._dispatch_input_event)
+            clock.advance(400)
+
+        with quiet():
+            for _ in range(20):
+                edge(0)
+                edge(1)
+            tracemalloc.start()
+            start = tracemalloc.get_traced_memory()[0]
+            worst = 0
+            for _ in range(events):
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                edge(0)
+                edge(1)
+                worst = max(worst, tracemalloc.get_traced_memory()[1] - base)
+            retained = tracemalloc.get_traced_memory()[0] - start
+            tracemalloc.stop()
+        rows.append({'behavior': behavior, 'events': events * 2,
+                     'retained_bytes': retained, 'peak_bytes_per_press': worst})
+    print_table('Heap use while handling input edges (includes clock advance)',
+                ('behavior', 'events', 'retained_bytes', 'peak_bytes_per_press'), rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
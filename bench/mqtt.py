@@ -0,0 +1,89 @@
+# mqtt.py: MQTTManager against the stand-in broker (sim/broker.py)
+#
+#     python -m bench.mqtt [--seconds S]
+#
+# Switches relays for S simulated seconds and counts the state publishes,
+# against the 8 per second the old once-a-second full publish sent.
+# Measures the host time from a command being published on the broker to
+# the relay pin write, then restarts the broker and reports how long the
+# client took to come back, in simulated time.
+
+import sys
+import time
+
+from bench import harness
+from bench.harness import percentile, print_table, quiet
+from sim import machine
+from sim.broker import Broker
+from sim.clock import clock
+
+
+def main(argv):
+    seconds = 60
+    if '--seconds' in argv:
+        seconds = int(argv[argv.index('--seconds') + 1])
+    with quiet():
+        harness.fresh_board()
+        from DN33C08 import DN33C08
+        from MQTTManager import MQTTManager
+        dn = DN33C08()
+    import uasyncio
+    broker = Broker()
+    results = {}
+
+    async def scenario():
+        port = await broker.start()
+        mqtt = MQTTManager(dn, '127.0.0.1', port=port, keepalive=30)
+        with quiet():
+            task = uasyncio.create_task(mqtt.run())
+            while not mqtt.connected:
+                await uasyncio.sleep_ms(10)
+            await uasyncio.sleep_ms(100)
+        initial = mqtt.published
+
+        # One relay switch every 500 ms.
+        for i in range(seconds * 2):
+            dn.apply_commands((('toggle', 1 + i % 8),))
+            await uasyncio.sleep_ms(500)
+        results['switches'] = seconds * 2
+        results['publishes'] = mqtt.published - initial
+        results['legacy_publishes'] = seconds * 8
+        results['retained_topics'] = len(broker.retained)
+
+        latencies = []
+        pending = []
+        hook = lambda pin_id, level: pending and latencies.append(time.perf_counter_ns() - pending.pop())
+        machine.output_hooks.append(hook)
+        for i in range(200):
+            relay = 1 + i % 8
+            pending.append(time.perf_counter_ns())
+            broker.publish('pico/relay/%d/set' % relay, b'TOGGLE')
+            while pending:
+                await uasyncio.sleep_ms(1)
+        machine.output_hooks.remove(hook)
+        results['command_p50_us'] = percentile(latencies, 50) / 1000
+        results['command_p99_us'] = percentile(latencies, 99) / 1000
+
+        with quiet():
+            await broker.stop()
+            await uasyncio.sleep_ms(3000)
+            down_at = clock.ticks_ms()
+            await broker.start(port=port)
+            while not mqtt.connected:
+                await uasyncio.sleep_ms(10)
+        results['reconnect_ms'] = clock.ticks_ms() - down_at
+        results['reconnects'] = mqtt.reconnects
+        results['status'] = broker.retained.get('pico/relay/status')
+        task.cancel()
+        await broker.stop()
+
+    uasyncio.run(scenario())
+    print_table(f'MQTT over {seconds} simulated seconds',
+                ('switches', 'publishes', 'legacy_publishes', 'retained_topics'), [results])
+    print_table('Inbound command to relay write (host time)',
+                ('command_p50_us', 'command_p99_us'), [results])
+    print_table('Broker restart', ('reconnect_ms', 'reconnects', 'status'), [results])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
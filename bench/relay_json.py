@@ -0,0 +1,50 @@
+# relay_json.py: cost of answering a /relay_states poll
+#
+#     python -m bench.relay_json
+#
+# Compares an unchanged poll (served from the per-version cache), a delta
+# poll after one relay switched, and a full rebuild after a change.
+
+import sys
+import time
+
+from bench import harness
+from bench.harness import print_table, quiet
+
+
+def _per_call_us(fn, n=2000):
+    started = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter_ns() - started) / n / 1000
+
+
+def main(argv):
+    with quiet():
+        harness.fresh_board()
+        from DN33C08 import DN33C08
+        dn = DN33C08()
+    register = dn.relay_register
+    dn.relay_json()
+
+    def switch_then_full():
+        register.toggle(1)
+        return dn.relay_json()
+
+    def switch_then_delta():
+        since = register.version
+        register.toggle(1)
+        return dn.relay_json(since)
+
+    rows = [
+        {'poll': 'unchanged (cached)', 'us_per_poll': _per_call_us(dn.relay_json), 'bytes': len(dn.relay_json())},
+        {'poll': 'since=current', 'us_per_poll': _per_call_us(lambda: dn.relay_json(register.version)),
+         'bytes': len(dn.relay_json(register.version))},
+        {'poll': 'one relay changed, delta', 'us_per_poll': _per_call_us(switch_then_delta), 'bytes': len(switch_then_delta())},
+        {'poll': 'one relay changed, full', 'us_per_poll': _per_call_us(switch_then_full), 'bytes': len(switch_then_full())},
+    ]
+    print_table('/relay_states serialization cost (host CPU time)', ('poll', 'us_per_poll', 'bytes'), rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,111 @@
+# reload.py: hot config reload, what survives it and what it costs
+#
+#     python -m bench.reload [--n N]
+#
+# Boots the simulated board with config.py, starts three Timed relays,
+# toggles one and holds an On_while_activated input, then reloads a config
+# that lengthens input 2's timer, turns input 5 into a Toggle and renames
+# relay 6.  The first table shows every relay's output, running timer and
+# its inputs' active flags before and after: only the entries that changed
+# may differ.  The second times --n reloads (host time, from the call to
+# the new mappings being live) with an unchanged config, with those
+# changes applied as a patch, and re-read from settings.json.
+
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench import harness
+from bench.harness import latency_summary, print_table, quiet
+from sim import machine
+from sim.clock import clock
+
+
+def _relay_rows(dn):
+    rows = {}
+    mappings = dn.mappings
+    for relay_id in range(1, 9):
+        rows[relay_id] = {
+            'name': dn.relay_config[relay_id],
+            'on': dn.get_relay_state(relay_id),
+            'timer_ms': dn.get_timer_remaining(relay_id),
+            'active': ','.join('%d%s' % (i, '*' if mappings.active[i] else '') for i in mappings.inputs_of(relay_id)),
+        }
+    return rows
+
+
+def main(argv):
+    n = 200
+    if '--n' in argv:
+        n = int(argv[argv.index('--n') + 1])
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(harness.sim.ROOT, 'config.py'), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with quiet():
+            harness.fresh_board()
+            import uasyncio
+            from DN33C08 import DN33C08
+            from Settings import Settings
+            dn = DN33C08()
+        pins = [machine.Pin(pin) for pin in harness.INPUT_PINS]
+        base = {'relays': dict(Settings.relays), 'inputs': copy.deepcopy(Settings.inputs)}
+        inputs = Settings.inputs
+        changed = {'relays': {6: 'Wine cellar'},
+                   'inputs': {2: ['Living', 60000, 'Timed'], 5: ['Attic', 0, 'Toggle'],
+                              6: ['Wine cellar'] + inputs[6][1:]}}
+
+        async def scenario():
+            consumer = uasyncio.create_task(dn.process_input_queue())
+            for input_id in (1, 2, 4, 5, 3, 8):
+                pins[input_id - 1].drive(0)
+                await uasyncio.sleep_ms(50)
+                if input_id != 8:
+                    pins[input_id - 1].drive(1)
+                    await uasyncio.sleep_ms(50)
+            await uasyncio.sleep_ms(5000)
+            before = _relay_rows(dn)
+            with quiet():
+                result = dn.reload_settings(changed)
+            after = _relay_rows(dn)
+            consumer.cancel()
+            return before, after, result
+
+        with quiet():
+            before, after, result = uasyncio.run(scenario())
+        rows = []
+        for relay_id in range(1, 9):
+            row = {'relay': relay_id}
+            for key in ('name', 'on', 'timer_ms', 'active'):
+                row[key] = before[relay_id][key]
+                if after[relay_id][key] != before[relay_id][key]:
+                    row[key] = '%s -> %s' % (before[relay_id][key], after[relay_id][key])
+            rows.append(row)
+        print_table('Relays across a reload at t=%d ms (inputs changed %s, relays renamed %s; * = active)'
+                    % (clock.ticks_ms(), result['inputs'], result['relays']),
+                    ('relay', 'name', 'on', 'timer_ms', 'active'), rows)
+
+        timings = []
+        for label, configs in (('unchanged', (base, base)), ('three inputs changed', (base, changed)),
+                               ('from settings.json', (None, None))):
+            samples = []
+            with quiet():
+                for i in range(n):
+                    started = time.perf_counter_ns()
+                    dn.reload_settings(configs[i & 1])
+                    samples.append(time.perf_counter_ns() - started)
+            row = {'reload': label}
+            row.update(latency_summary(samples))
+            timings.append(row)
+        print_table('Reload apply time (host)', ('reload', 'n', 'p50_us', 'p95_us', 'p99_us', 'max_us'), timings)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
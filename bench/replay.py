@@ -0,0 +1,239 @@
+# replay.py: replay a recorded input trace against the firmware
+#
+#     python -m bench.replay [TRACE] [--speeds 1,10,100,1000] [--settings settings.json]
+#     python -m bench.replay --record PATH [--presses N] [--seed N]
+#
+# TRACE is an inputs.trace copied off a board that runs with
+# "input_trace": true (see lib/inputtrace.py).  Without one, a synthetic
+# trace is recorded first through the same TraceRecorder on the simulated
+# board: random presses on every input, each edge followed by a burst of
+# contact bounce.  --record only writes that trace.
+#
+# Each speed replays the edges on a fresh board with the given settings
+# (default config.py), in simulated time, paced against the host clock at
+# speed x the recorded rate.  While the host keeps up, the firmware runs
+# up to each edge before it is injected.  When it falls behind, edges are
+# injected back to back without giving the event loop a turn, the way
+# IRQs preempt a busy consumer, and pile up in the 32-slot input ring.
+# Reported per speed:
+#
+#   lost         edges dropped by the full input ring
+#   equivalent   whether the sequence of relay states matches the trace's
+#                recorded relay states (or the first replay, if the trace
+#                has none); the first divergence is printed
+#   max_skew_ms  largest simulated-time difference between matching
+#                relay changes
+#   p50/p99/max  host time from injecting an edge to its dispatch
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+
+from bench import harness
+from bench.harness import percentile, print_table, quiet
+from sim import machine
+from sim.clock import clock
+
+
+def _board(settings):
+    harness.fresh_board()
+    if settings:
+        shutil.copy(settings, 'settings.json')
+    elif not os.path.exists('settings.json'):
+        shutil.copy(os.path.join(harness.sim.ROOT, 'config.py'), '.')
+    from DN33C08 import DN33C08
+    return DN33C08()
+
+
+def _settle_ms(dn):
+    return max(dn.mappings.duration) + 1000
+
+
+def record(path, presses, seed, settings=None):
+    with quiet():
+        dn = _board(settings)
+    import uasyncio
+    from inputtrace import TraceRecorder
+    rng = random.Random(seed)
+    register = dn.relay_register
+    trace = TraceRecorder(path, relay_state=register.state)
+    dn.trace = trace
+    register.trace = trace
+    pins = [machine.Pin(pin) for pin in harness.INPUT_PINS]
+
+    def bouncy(pin, level):
+        for _ in range(rng.randrange(0, 6)):
+            pin.drive(level)
+            clock.advance_us(rng.randrange(50, 900))
+            pin.drive(not level)
+            clock.advance_us(rng.randrange(50, 900))
+        pin.drive(level)
+
+    async def scenario():
+        tasks = [uasyncio.create_task(dn.process_input_queue()), uasyncio.create_task(trace.run())]
+        for _ in range(presses):
+            pin = pins[rng.randrange(8)]
+            bouncy(pin, 0)
+            await uasyncio.sleep_ms(rng.randrange(30, 600))
+            bouncy(pin, 1)
+            await uasyncio.sleep_ms(rng.randrange(100, 1500))
+        await uasyncio.sleep_ms(_settle_ms(dn))
+        for task in tasks:
+            task.cancel()
+
+    with quiet():
+        uasyncio.run(scenario())
+    trace.flush()
+    return trace.records
+
+
+class _Outcome:
+    # Stands in for the TraceRecorder on the relay register.
+    def __init__(self, t0):
+        self.t0 = t0
+        self.changes = []
+
+    def relays(self, state):
+        self.changes.append((clock.ticks_us() - self.t0, state))
+
+
+def replay(state, records, speed, settings=None):
+    with quiet():
+        dn = _board(settings)
+    import uasyncio
+    register = dn.relay_register
+    register.update(set_mask=state, clear_mask=~state & 0xFF)
+    ring = dn.input_events
+    overflows = ring.overflows
+    debounced = dn.debounced_edges
+    pins = [machine.Pin(pin) for pin in harness.INPUT_PINS]
+    edges = [r for r in records if r[1] == 0]
+    start = edges[0][0] if edges else 0
+    injected = deque()
+    latencies = []
+    dispatch = dn._dispatch_input_event
+
+    def timed_dispatch(input_id, edge, ticks):
+        latencies.append(time.perf_counter_ns() - injected.popleft())
+        dispatch(input_id, edge, ticks)
+
+    dn._dispatch_input_event = timed_dispatch
+
+    async def scenario():
+        task = uasyncio.create_task(dn.process_input_queue())
+        await uasyncio.sleep_ms(0)
+        t0 = clock.ticks_us()
+        outcome = _Outcome(t0)
+        register.trace = outcome
+        host0 = time.perf_counter()
+        for us, kind, input_id, level in edges:
+            us -= start
+            delay = t0 + us - clock.ticks_us()
+            if time.perf_counter() < host0 + us / speed / 1000000:
+                await uasyncio.sleep_ms(max(0, delay) / 1000)
+                wait = host0 + us / speed / 1000000 - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+            elif delay > 0:
+                clock.advance_us(delay)
+            head = ring._head
+            pins[input_id - 1].drive(level)
+            if ring._head != head:
+                injected.append(time.perf_counter_ns())
+        await uasyncio.sleep_ms(_settle_ms(dn))
+        task.cancel()
+        return outcome.changes
+
+    started = time.perf_counter()
+    with quiet():
+        changes = uasyncio.run(scenario())
+    return {'speed': speed, 'edges': len(edges), 'accepted': len(latencies),
+            'debounced': dn.debounced_edges - debounced, 'lost': ring.overflows - overflows,
+            'changes': changes, 'latencies': latencies, 'wall_s': time.perf_counter() - started,
+            'start': start}
+
+
+def compare(expected, got):
+    # Returns (index of the first differing relay state or None, max skew in ms).
+    skew = 0
+    for i in range(min(len(expected), len(got))):
+        if expected[i][1] != got[i][1]:
+            return i, skew
+        skew = max(skew, abs(expected[i][0] - got[i][0]) / 1000)
+    if len(expected) != len(got):
+        return min(len(expected), len(got)), skew
+    return None, skew
+
+
+def main(argv):
+    args = list(argv)
+    options = {}
+    for name in ('--speeds', '--settings', '--record', '--presses', '--seed'):
+        if name in args:
+            i = args.index(name)
+            options[name] = args[i + 1]
+            del args[i:i + 2]
+    settings = os.path.abspath(options['--settings']) if '--settings' in options else None
+    presses = int(options.get('--presses', 30))
+    seed = int(options.get('--seed', 1))
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    path = os.path.abspath(args[0]) if args else os.path.join(workdir, 'synthetic.trace')
+    if '--record' in options:
+        path = os.path.abspath(options['--record'])
+    os.chdir(workdir)
+    try:
+        if not args:
+            n = record(path, presses, seed, settings)
+            print('Recorded %d records (%d bytes) to %s\n' % (n, os.path.getsize(path), path))
+            if '--record' in options:
+                return
+        from inputtrace import load
+        state, records = load(path)
+        speeds = [int(s) for s in options.get('--speeds', '1,10,100,1000').split(',')]
+        results = [replay(state, records, speed, settings) for speed in speeds]
+        start = results[0]['start']
+        recorded = [(us - start, value) for us, kind, _, value in records if kind == 1]
+        reference = recorded or results[0]['changes']
+        rows = []
+        divergence = None
+        for result in results:
+            index, skew = compare(reference, result['changes'])
+            if index is not None and divergence is None:
+                divergence = (result['speed'], index, result['changes'])
+            latencies = result['latencies']
+            rows.append({'speed': '%dx' % result['speed'], 'edges': result['edges'], 'accepted': result['accepted'],
+                         'debounced': result['debounced'], 'lost': result['lost'],
+                         'relay_changes': len(result['changes']),
+                         'equivalent': 'yes' if index is None else 'no (#%d)' % index,
+                         'max_skew_ms': skew, 'p50_us': percentile(latencies, 50) / 1000,
+                         'p99_us': percentile(latencies, 99) / 1000,
+                         'max_us': max(latencies) / 1000 if latencies else 0, 'wall_s': result['wall_s']})
+        print_table('Replay of %d records against %s (reference: %s)'
+                    % (len(records), os.path.basename(path), 'recorded relay states' if recorded else 'first replay'),
+                    ('speed', 'edges', 'accepted', 'debounced', 'lost', 'relay_changes', 'equivalent',
+                     'max_skew_ms', 'p50_us', 'p99_us', 'max_us', 'wall_s'), rows)
+        if divergence:
+            speed, index, changes = divergence
+            print('First divergence at %dx, relay change #%d:' % (speed, index))
+            for label, seq in (('expected', reference), ('got', changes)):
+                if index < len(seq):
+                    print('  %-8s %10.1f ms  relays %s' % (label, seq[index][0] / 1000, bin(seq[index][1])))
+                else:
+                    print('  %-8s (none)' % label)
+            at = reference[index][0] if index < len(reference) else changes[index][0]
+            for us, kind, input_id, level in records:
+                if kind == 0 and at - 2000000 <= us - start <= at:
+                    print('  edge     %10.1f ms  input %d %s' % ((us - start) / 1000, input_id,
+                                                               'press' if level == 0 else 'release'))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,192 @@
+# rules.py: automation rule cost per input event as the rule count grows
+#
+#     python -m bench.rules [--n N] [--seed N]
+#
+# Loads config.py plus a generated rule set of 0 to 1000 rules spread over
+# every trigger (input press, release and double press, relay on and off),
+# with conditions and relay commands.  Input 1 always has the same two
+# press rules, and the generated ones only watch and switch relays 2-4,
+# which those two do not touch, so every size does the same work for
+# input 1.  The first table times --n press/release pairs on input 1
+# through the full dispatch path (host time), with the indexed RuleEngine
+# and with the same rules found by testing each one against the event, the
+# way an unindexed engine would.  The second table checks interlocks (pin
+# write order and timing at the relay-write layer), a double press, and a
+# follow-on loop being cut off.
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from bench import harness
+from bench.harness import latency_summary, print_table, quiet
+from sim import machine
+from sim.clock import clock
+
+NAMES = ('Hall', 'Living', 'Kitchen', 'Dining', 'Attic', 'Cellar', 'Patio', 'Toilet')
+FIXED = [{'when': 'press', 'input': 1, 'if': {'off': ['Attic']}, 'do': [['toggle', 'Patio']]},
+         {'when': 'press', 'input': 1, 'if': {'on': ['Cellar']}, 'do': [['pulse', 'Toilet', 500]]}]
+
+
+def generate(rng, count):
+    rules = list(FIXED)
+    while len(rules) < count:
+        when = rng.choice(('press', 'release', 'double', 'on', 'off'))
+        rule = {'when': when, 'do': [[rng.choice(('set', 'clear', 'toggle')), rng.choice(NAMES[1:4])]]}
+        if when in ('on', 'off'):
+            rule['relay'] = rng.choice(NAMES[1:4])
+        else:
+            rule['input'] = rng.randrange(2, 9)
+        if rng.random() < 0.5:
+            rule['if'] = {'on': [rng.choice(NAMES)]}
+        rules.append(rule)
+    return rules
+
+
+def board(rules, interlocks=()):
+    with quiet():
+        harness.fresh_board()
+        from DN33C08 import DN33C08
+        dn = DN33C08()
+        dn.reload_settings({'rules': rules, 'interlocks': list(interlocks)})
+    return dn
+
+
+def scanning(dn):
+    # Replace the index lookup by a pass over every rule.
+    from Rules import RuleEngine, PRESS, DOUBLE
+    engine = dn.rules
+    table = engine.table
+    keys = [0] * len(table.index)
+    for key in range(len(table.start) - 1):
+        for i in range(table.start[key], table.start[key + 1]):
+            keys[table.index[i]] = key
+    dn_ = dn
+
+    # Relay triggers stay with the original engine; only input events scan.
+    class ScanEngine(RuleEngine):
+        def input_event(self, input_id, kind):
+            key = (input_id - 1) * 3 + kind
+            since = -1
+            if kind == PRESS:
+                now = time.ticks_ms()
+                since = time.ticks_diff(now, self._last_press[input_id])
+                self._last_press[input_id] = now
+            state = dn_.relay_register.state
+            for n in range(len(keys)):
+                k = keys[n]
+                if k != key and not (since >= 0 and k == key + DOUBLE and since <= table.within_ms[n]):
+                    continue
+                if state & table.need_on[n] != table.need_on[n] or state & table.need_off[n]:
+                    continue
+                if table.touched[n]:
+                    dn_.apply_masks((table.touched[n], table.set_mask[n], table.clear_mask[n],
+                                     table.toggle_mask[n]), table.pulses[n])
+
+    scan = ScanEngine.__new__(ScanEngine)
+    scan.__dict__.update(engine.__dict__)
+    dn.rules = scan
+
+
+def per_event(dn, n):
+    from DN33C08 import EDGE_PRESS, EDGE_RELEASE
+    dispatch = dn._dispatch_input_event
+    samples = []
+    with quiet():
+        for _ in range(n):
+            clock.advance(500)
+            started = time.perf_counter_ns()
+            dispatch(1, EDGE_PRESS, 0)
+            dispatch(1, EDGE_RELEASE, 0)
+            samples.append(time.perf_counter_ns() - started)
+            dn.deadlines.run_due()
+    return latency_summary(samples)
+
+
+def checks():
+    import time as utime
+    rows = []
+    # Interlock: Hall on, then Living on; the register must clear Hall's pin and
+    # only set Living's interlock_gap_ms later.
+    dn = board([], [['Hall', 'Living']])
+    writes = []
+    hook = lambda pin_id, level: writes.append((harness.RELAY_BY_PIN.get(pin_id), level, clock.ticks_ms()))
+    machine.output_hooks.append(hook)
+    dn.apply_commands([('set', 1)])
+    del writes[:]
+    started = clock.ticks_ms()
+    dn.apply_commands([('set', 2)])
+    clock.advance(dn.relay_register.gap_ms)
+    dn.deadlines.run_due()
+    dn.apply_commands([('set', 1), ('set', 2)])
+    clock.advance(dn.relay_register.gap_ms)
+    dn.deadlines.run_due()
+    machine.output_hooks.remove(hook)
+    rows.append({'check': 'interlock Hall/Living: set 2, then set 1+2',
+                 'result': 'pin writes %s (relay=level@ms), state %s, overridden %d'
+                           % (' '.join('%d=%d@%d' % (r, level, at - started) for r, level, at in writes if r),
+                              bin(dn.relay_register.state), dn.relay_register.interlocked)})
+    # Double press on input 3 within 400 ms switches Attic on; a slow second press does not.
+    from DN33C08 import EDGE_PRESS, EDGE_RELEASE
+    dn = board([{'when': 'double', 'input': 3, 'within_ms': 400, 'do': [['set', 'Attic']]}])
+    with quiet():
+        for gap in (700, 300):
+            dn._dispatch_input_event(3, EDGE_PRESS, 0)
+            clock.advance(100)
+            dn._dispatch_input_event(3, EDGE_RELEASE, 0)
+            clock.advance(gap - 100)
+            dn._dispatch_input_event(3, EDGE_PRESS, 0)
+            rows.append({'check': 'double press input 3, presses %d ms apart' % gap,
+                         'result': 'Attic %s' % ('on' if dn.get_relay_state(5) else 'off')})
+            dn._dispatch_input_event(3, EDGE_RELEASE, 0)
+            clock.advance(1000)
+    # Patio on -> Toilet on -> Patio off -> Toilet off -> Patio on ... must stop.
+    dn = board([{'when': 'on', 'relay': 'Patio', 'do': [['set', 'Toilet']]},
+                {'when': 'on', 'relay': 'Toilet', 'do': [['clear', 'Patio']]},
+                {'when': 'off', 'relay': 'Patio', 'do': [['clear', 'Toilet']]},
+                {'when': 'off', 'relay': 'Toilet', 'do': [['set', 'Patio']]}])
+    with quiet():
+        dn.apply_commands([('set', 7)])
+        started = utime.perf_counter()
+        dn.deadlines.run_due()
+        elapsed = (utime.perf_counter() - started) * 1e6
+    rows.append({'check': 'follow-on loop Patio/Toilet',
+                 'result': 'cut off %d time(s) after %d rules, %.0f us' % (dn.rules.cut_off, dn.rules.fired, elapsed)})
+    return rows
+
+
+def main(argv):
+    n = 2000
+    seed = 1
+    if '--n' in argv:
+        n = int(argv[argv.index('--n') + 1])
+    if '--seed' in argv:
+        seed = int(argv[argv.index('--seed') + 1])
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(harness.sim.ROOT, 'config.py'), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        rows = []
+        for count in (0, 2, 10, 100, 300, 1000):
+            rules = generate(random.Random(seed), count) if count else []
+            for engine in ('indexed', 'scan'):
+                dn = board(rules)
+                if engine == 'scan':
+                    scanning(dn)
+                row = {'rules': count, 'engine': engine}
+                row.update(per_event(dn, n))
+                rows.append(row)
+        print_table('Input 1 press + release through dispatch (host time)',
+                    ('rules', 'engine', 'n', 'p50_us', 'p95_us', 'p99_us', 'max_us'), rows)
+        print_table('Behavior checks', ('check', 'result'), checks())
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
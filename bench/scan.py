@@ -0,0 +1,136 @@
+# scan.py: per-pin edge IRQs vs the polled input scanner on noisy wiring
+#
+#     python -m bench.scan [--presses N] [--glitch-hz N] [--period-ms N]
+#
+# Every input is pressed --presses times (held 150-400 ms, released
+# 300-800 ms) in three kinds of wiring, run on the simulated clock:
+#
+#   clean   one edge per transition
+#   bounce  2-8 contact bounces of 50-900 us on every transition
+#   noisy   bounce plus --glitch-hz spikes of 5-60 us per input, pressed
+#           or not, the way a long unshielded cable picks up interference
+#
+# "irq" is the default input mode (an IRQ per edge, 300 ms timestamp
+# debounce); "scan" samples GPIO_IN every --period-ms through
+# lib/inputscan.py.  Reported per run: raw edges on the pins, calls into
+# input handling (IRQ handlers or scans) and their host time per simulated
+# second, and presses missed or invented compared to the presses made.
+# The simulator reads GPIO_IN pin by pin, so host time per scan overstates
+# what the single register read costs on the board; the call rate is the
+# figure that carries over.
+
+import random
+import sys
+import time
+
+from bench import harness
+from bench.harness import print_table, quiet
+from sim import machine
+from sim.clock import clock
+
+
+def timeline(rng, presses, bounce, glitch_hz):
+    # [(us, input_id, level)] for all inputs, sorted.
+    events = []
+    for input_id in range(1, 9):
+        t = rng.randrange(0, 200000)
+        for _ in range(presses):
+            for target, hold in ((0, rng.randrange(150000, 400000)), (1, rng.randrange(300000, 800000))):
+                if bounce:
+                    for _ in range(rng.randrange(2, 9)):
+                        events.append((t, input_id, target))
+                        t += rng.randrange(50, 900)
+                        events.append((t, input_id, 1 - target))
+                        t += rng.randrange(50, 900)
+                events.append((t, input_id, target))
+                end = t + hold
+                if glitch_hz:
+                    g = t + int(rng.expovariate(glitch_hz) * 1000000)
+                    while g < end - 1000:
+                        width = rng.randrange(5, 60)
+                        events.append((g, input_id, 1 - target))
+                        events.append((g + width, input_id, target))
+                        g += width + int(rng.expovariate(glitch_hz) * 1000000)
+                t = end
+    events.sort()
+    return events, max(t for t, _, _ in events)
+
+
+def run(mode, wiring, presses, glitch_hz, period_ms):
+    with quiet():
+        harness.fresh_board()
+        import uasyncio
+        from DN33C08 import DN33C08, EDGE_PRESS
+        dn = DN33C08()
+        for i in range(1, 9):
+            dn.register_input_output_mapping(i, i, 'Toggle', 0)
+    calls = [0, 0]  # calls, host ns
+
+    def timed(fn):
+        def wrapper(*args):
+            started = time.perf_counter_ns()
+            fn(*args)
+            calls[0] += 1
+            calls[1] += time.perf_counter_ns() - started
+        return wrapper
+
+    if mode == 'scan':
+        scanner = dn.start_scanner(period_ms)
+        scanner.scan = timed(scanner.scan)
+    else:
+        dn.handle_interrupt = timed(dn.handle_interrupt)
+    detected = [0]
+    dispatch = dn._dispatch_input_event
+
+    def counting(input_id, edge, ticks):
+        if edge == EDGE_PRESS:
+            detected[0] += 1
+        dispatch(input_id, edge, ticks)
+
+    dn._dispatch_input_event = counting
+    rng = random.Random(7)
+    events, end = timeline(rng, presses, wiring != 'clean', glitch_hz if wiring == 'noisy' else 0)
+    pins = [machine.Pin(pin) for pin in harness.INPUT_PINS]
+
+    async def scenario():
+        consumer = uasyncio.create_task(dn.process_input_queue())
+        t0 = clock.ticks_us()
+        for us, input_id, level in events:
+            delay = t0 + us - clock.ticks_us()
+            if delay > 0:
+                clock.advance_us(delay)
+            pins[input_id - 1].drive(level)
+            await uasyncio.sleep_ms(0)
+        await uasyncio.sleep_ms(100)
+        consumer.cancel()
+
+    with quiet():
+        uasyncio.run(scenario())
+    seconds = (end + 100000) / 1000000
+    made = presses * 8
+    return {'mode': mode, 'wiring': wiring, 'raw_edges': len(events), 'calls': calls[0],
+            'calls_per_s': calls[0] / seconds, 'host_us_per_s': calls[1] / 1000 / seconds,
+            'presses': made, 'missed': max(0, made - detected[0]), 'invented': max(0, detected[0] - made),
+            'lost': dn.input_events.overflows}
+
+
+def main(argv):
+    presses = 20
+    glitch_hz = 200
+    period_ms = 2
+    if '--presses' in argv:
+        presses = int(argv[argv.index('--presses') + 1])
+    if '--glitch-hz' in argv:
+        glitch_hz = int(argv[argv.index('--glitch-hz') + 1])
+    if '--period-ms' in argv:
+        period_ms = int(argv[argv.index('--period-ms') + 1])
+    rows = [run(mode, wiring, presses, glitch_hz, period_ms)
+            for wiring in ('clean', 'bounce', 'noisy') for mode in ('irq', 'scan')]
+    print_table('Input handling cost and accuracy (scan period %d ms, 20/40 ms press/release, %d Hz glitches)'
+                % (period_ms, glitch_hz),
+                ('mode', 'wiring', 'raw_edges', 'calls', 'calls_per_s', 'host_us_per_s', 'presses', 'missed',
+                 'invented', 'lost'), rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,153 @@
+# scenes.py: scene activation, one relay write vs a toggle per relay
+#
+#     python -m bench.scenes [--n N] [--window-ms N]
+#
+# Adds three scenes to config.py's relays: "All on" (button 1), "All off"
+# (button 2) and "Evening" (input 3: four relays on, two off).  The first
+# table presses button 1 with the board all off, on the simulated clock,
+# for several inrush limits (relays switched on per --window-ms), and
+# reports each switch-on as it reaches the pins: how many relay writes it
+# took, when the last relay came on, the most switch-ons seen within any
+# window, and the order.  Then button 2 is pressed halfway through a
+# staggered "All on", which must leave every relay off, and input 3 is
+# pressed, which also toggles the Kitchen relay it is mapped to.  The second table
+# times --n activations (host time) of a whole scene against the same
+# change made the way clients do without scenes, one command per relay.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench import harness
+from bench.harness import latency_summary, print_table, quiet
+from sim import machine
+from sim.clock import clock
+
+BUTTON_PINS = (18, 20, 21, 22)
+ALL = {name: 1 for name in ('Hall', 'Living', 'Kitchen', 'Dining', 'Attic', 'Cellar', 'Patio', 'Toilet')}
+SCENES = {
+    'All on': {'relays': ALL, 'buttons': [1]},
+    'All off': {'relays': {name: 0 for name in ALL}, 'buttons': [2]},
+    'Evening': {'relays': {'Hall': 1, 'Living': 1, 'Dining': 1, 'Patio': 1, 'Attic': 0, 'Cellar': 0}, 'inputs': [3]},
+}
+
+
+class Switches:
+    # Stands in for the input trace on RelayRegister: (ms, relays switched on) per write.
+    def __init__(self, register):
+        self.state = register.state
+        self.writes = []
+
+    def relays(self, new):
+        on = new & ~self.state
+        self.state = new
+        if on:
+            self.writes.append((clock.ticks_ms(), on))
+
+
+def press(button):
+    pin = machine.Pin(BUTTON_PINS[button - 1])
+    pin.drive(0)
+    pin.drive(1)
+
+
+def board():
+    with quiet():
+        harness.fresh_board()
+        from DN33C08 import DN33C08
+        dn = DN33C08()
+        dn.reload_settings({'scenes': SCENES})
+    return dn
+
+
+def staggered(limit, window_ms, interrupt=False, evening=False):
+    import uasyncio
+    dn = board()
+    scenes = dn.scenes
+    scenes.max_switches = limit
+    scenes.window_ms = window_ms
+    register = dn.relay_register
+    switches = Switches(register)
+    register.trace = switches
+
+    async def scenario():
+        tasks = [uasyncio.create_task(dn.process_input_queue()), uasyncio.create_task(scenes.run())]
+        await uasyncio.sleep_ms(window_ms * 2)
+        started = clock.ticks_ms()
+        if evening:
+            pin = machine.Pin(harness.INPUT_PINS[2])
+            pin.drive(0)
+            await uasyncio.sleep_ms(50)
+            pin.drive(1)
+        else:
+            press(1)
+        if interrupt:
+            await uasyncio.sleep_ms(window_ms * 3 // 2)
+            press(2)
+        await uasyncio.sleep_ms(window_ms * 10)
+        for task in tasks:
+            task.cancel()
+        return started
+
+    with quiet():
+        started = uasyncio.run(scenario())
+    register.trace = None
+    peak = 0
+    for t, _ in switches.writes:
+        peak = max(peak, sum(bin(on).count('1') for u, on in switches.writes if t <= u < t + window_ms))
+    order = ' '.join(','.join(str(r + 1) for r in range(8) if on & (1 << r)) for _, on in switches.writes)
+    return {'limit': '%d / %d ms' % (limit, window_ms) if limit else 'none',
+            'press': 'input 3: Evening' if evening else 'All on, All off' if interrupt else 'All on',
+            'writes': len(switches.writes),
+            'last_on_ms': switches.writes[-1][0] - started if switches.writes else '-',
+            'peak_per_window': peak, 'order': order, 'final': bin(register.state)}
+
+
+def main(argv):
+    n = 500
+    window_ms = 200
+    if '--n' in argv:
+        n = int(argv[argv.index('--n') + 1])
+    if '--window-ms' in argv:
+        window_ms = int(argv[argv.index('--window-ms') + 1])
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(harness.sim.ROOT, 'config.py'), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        rows = [staggered(limit, window_ms) for limit in (0, 4, 2, 1)]
+        rows.append(staggered(2, window_ms, interrupt=True))
+        rows.append(staggered(2, window_ms, evening=True))
+        print_table('Scenes from all off (simulated clock)',
+                    ('limit', 'press', 'writes', 'last_on_ms', 'peak_per_window', 'order', 'final'), rows)
+
+        dn = board()
+        all_on = [('set', r) for r in range(1, 9)]
+        all_off = [('clear', r) for r in range(1, 9)]
+        timings = []
+        for label, on, off in (
+                ('scene', lambda: dn.activate_scene('All on'), lambda: dn.activate_scene('All off')),
+                ('command per relay', lambda: [dn.apply_commands((c,)) for c in all_on],
+                 lambda: [dn.apply_commands((c,)) for c in all_off])):
+            samples = []
+            versions = dn.relay_register.version
+            with quiet():
+                for i in range(n):
+                    started = time.perf_counter_ns()
+                    (off if i & 1 else on)()
+                    samples.append(time.perf_counter_ns() - started)
+            row = {'path': label}
+            row.update(latency_summary(samples))
+            row['versions_per_change'] = (dn.relay_register.version - versions) / n
+            timings.append(row)
+        print_table('Switching all eight relays (host time)',
+                    ('path', 'n', 'p50_us', 'p95_us', 'p99_us', 'max_us', 'versions_per_change'), timings)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
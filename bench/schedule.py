@@ -0,0 +1,244 @@
+# schedule.py: time-of-day schedule cost per fire as the entry count grows
+#
+#     python -m bench.schedule [--days N] [--seed N]
+#
+# Loads config.py plus a generated schedule of 100 to 10000 entries (cron
+# entries with minute and hour lists, steps and weekdays, and one in five
+# sunrise or sunset entries with an offset), sets the RTC to a Monday in
+# June 2025, and runs --days simulated days on the deadline scheduler.
+# The first table reports the host time per wake of the Scheduler (each
+# wake fires every entry due at that minute), per fire, and per simulated
+# day, against a scheduler that polls every minute and asks each entry
+# whether it is due (timed over one simulated hour, scaled to a day); a
+# poll every second costs sixty times that.  The fires of a sample of
+# cron entries are checked against a minute-by-minute evaluation of their
+# fields with datetime.  The second table checks the clock handling:
+# nothing fires before the RTC is set, a forward jump runs or skips the
+# missed fires per entry, a backward jump fires nothing twice, and a
+# reboot runs the fires missed while powered off.
+
+import datetime
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from bench import harness
+from bench.harness import latency_summary, print_table, quiet
+from sim import machine
+from sim.clock import clock
+
+NAMES = ('Hall', 'Living', 'Kitchen', 'Dining', 'Attic', 'Cellar', 'Patio', 'Toilet')
+START = datetime.datetime(2025, 6, 2)  # a Monday, UTC
+LATITUDE = 52.37
+LONGITUDE = 4.89
+
+
+def generate(rng, count):
+    entries = []
+    for _ in range(count):
+        entry = {'do': [[rng.choice(('set', 'clear')), rng.choice(NAMES)]]}
+        if rng.random() < 0.2:
+            entry['sun'] = rng.choice(('sunrise', 'sunset'))
+            entry['offset_min'] = rng.randrange(-60, 61)
+            if rng.random() < 0.5:
+                entry['days'] = rng.choice(('1-5', '0,6'))
+        else:
+            minute = rng.choice(('%d' % rng.randrange(60), '*/%d' % rng.choice((5, 10, 15, 30)),
+                                 '%d,%d' % (rng.randrange(30), rng.randrange(30, 60))))
+            hour = rng.choice(('*', '%d' % rng.randrange(24), '%d-%d' % (rng.randrange(12), rng.randrange(12, 24))))
+            week = rng.choice(('*', '*', '1-5', '0,6', '%d' % rng.randrange(7)))
+            entry['cron'] = '%s %s * * %s' % (minute, hour, week)
+        entries.append(entry)
+    return entries
+
+
+def board(entries, when=START, utc_offset_min=0):
+    with quiet():
+        harness.fresh_board()
+        from DN33C08 import DN33C08
+        from Settings import Settings
+        dn = DN33C08()
+        Settings.latitude = LATITUDE
+        Settings.longitude = LONGITUDE
+        Settings.utc_offset_min = utc_offset_min
+        dn.reload_settings({'schedule': entries})
+        if when is not None:
+            set_rtc(dn, when)
+    return dn
+
+
+def set_rtc(dn, when):
+    machine.RTC().datetime((when.year, when.month, when.day, when.weekday(), when.hour, when.minute, when.second, 0))
+    dn.clock_changed()
+
+
+def run_for(dn, ms):
+    # The deadline task, on the simulated clock.
+    deadlines = dn.deadlines
+    end = clock.ticks_ms() + ms
+    while True:
+        wait = deadlines.run_due()
+        if wait is None or clock.ticks_ms() + wait > end:
+            clock.advance(end - clock.ticks_ms())
+            deadlines.run_due()
+            return
+        clock.advance(wait)
+
+
+def record(dn):
+    # Wraps Scheduler._fire: (entry, UTC minute) per fire.
+    schedule = dn.schedule
+    fires = []
+    fire = schedule._fire
+
+    def recording(n):
+        fires.append((n, int(time.time()) // 60))
+        fire(n)
+    schedule._fire = recording
+    return fires
+
+
+def expected(spec_text, first, last):
+    # Minutes in [first, last] matching the cron fields, evaluated one by one.
+    from cron import parse_field
+    fields = spec_text.split()
+    masks = [parse_field(field, low, high)
+             for field, (low, high) in zip(fields, ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7)))]
+    week = (masks[4] | 1) & 0x7f if masks[4] & 0x80 else masks[4]
+    any_day = fields[2].startswith('*') or fields[4].startswith('*')
+    minutes = []
+    for minute in range(first, last + 1):
+        t = datetime.datetime(1970, 1, 1) + datetime.timedelta(minutes=minute)
+        in_month = masks[2] >> t.day & 1
+        in_week = week >> (t.weekday() + 1) % 7 & 1
+        if not (in_month and in_week if any_day else in_month or in_week):
+            continue
+        if masks[0] >> t.minute & 1 and masks[1] >> t.hour & 1 and masks[3] >> t.month & 1:
+            minutes.append(minute)
+    return minutes
+
+
+def scale(rng, count, days):
+    entries = generate(rng, count)
+    dn = board(entries)
+    schedule = dn.schedule
+    fires = record(dn)
+    samples = []
+    wake = schedule._wake
+
+    def timed(slot):
+        started = time.perf_counter_ns()
+        wake(slot)
+        samples.append(time.perf_counter_ns() - started)
+    dn.deadlines._callbacks[schedule._slot] = timed
+    first = int(time.time()) // 60
+    with quiet():
+        run_for(dn, days * 86400 * 1000)
+    last = int(time.time()) // 60
+    wrong = 0
+    sample = [n for n in range(count) if 'cron' in entries[n]][:50]
+    for n in sample:
+        if [m for e, m in fires if e == n] != expected(entries[n]['cron'], first, last):
+            wrong += 1
+    row = {'entries': count}
+    row.update(latency_summary(samples))
+    row['fires'] = len(fires)
+    row['us_per_fire'] = sum(samples) / 1000 / max(len(fires), 1)
+    row['ms_per_day'] = sum(samples) / 1e6 / days
+    row['poll_ms_per_day'] = polling(dn, count) * 24
+    row['checked'] = '%d/%d ok' % (len(sample) - wrong, len(sample))
+    return row
+
+
+def polling(dn, count):
+    # One simulated hour of per-minute polling: every entry asked whether it is due.
+    table = dn.schedule.table
+    now = int(time.time()) // 60
+    started = time.perf_counter()
+    for minute in range(now, now + 60):
+        for n in range(count):
+            table.next_after(n, minute - 1) == minute
+    return (time.perf_counter() - started) * 1000
+
+
+def checks(workdir):
+    rows = []
+    morning = [{'cron': '0 7 * * *', 'do': [['set', 'Hall']], 'missed': 'run'},
+               {'cron': '0 7 * * *', 'do': [['set', 'Living']]},
+               {'cron': '*/15 * * * *', 'do': [['toggle', 'Patio']]},
+               {'sun': 'sunset', 'offset_min': -15, 'do': [['set', 'Attic']], 'missed': 'run'}]
+
+    def fired(fires):
+        return ', '.join('%d@%s' % (n + 1, (datetime.datetime(1970, 1, 1) + datetime.timedelta(minutes=m))
+                                    .strftime('%H:%M')) for n, m in fires) or 'none'
+
+    # RTC never set: the board thinks it is 2021-01-01 and must stay idle.
+    dn = board(morning, when=None)
+    fires = record(dn)
+    with quiet():
+        run_for(dn, 3600 * 1000)
+    rows.append({'check': 'RTC not set, 1 h', 'result': 'fired %s' % fired(fires)})
+
+    # 06:50, then the clock jumps to 09:10: entry 1 runs late, 2 is skipped, 3 skips its missed quarters.
+    dn = board(morning, when=START.replace(hour=6, minute=50))
+    fires = record(dn)
+    with quiet():
+        run_for(dn, 5 * 60 * 1000)
+        set_rtc(dn, START.replace(hour=9, minute=10))
+        run_for(dn, 60 * 1000)
+    rows.append({'check': 'clock 06:55 -> 09:10', 'result': 'fired %s; missed %d; Hall %s, Living %s' % (
+        fired(fires), dn.schedule.missed, dn.get_relay_state(1), dn.get_relay_state(2))})
+
+    # 07:20, then back to 06:58: 07:00 already fired and must not fire again.
+    dn = board(morning, when=START.replace(hour=6, minute=58))
+    fires = record(dn)
+    with quiet():
+        run_for(dn, 22 * 60 * 1000)
+        set_rtc(dn, START.replace(hour=6, minute=58))
+        run_for(dn, 30 * 60 * 1000)
+    rows.append({'check': 'clock 07:20 -> 06:58, 30 min', 'result': 'fired %s' % fired(fires)})
+
+    # Off from 06:30 until the next day's 10:00: entries 1 and 4 run their latest missed fire.
+    from Settings import Settings
+    dn = board(morning, when=START.replace(hour=6, minute=30))
+    with quiet():
+        run_for(dn, 60 * 1000)
+        dn.schedule.save()
+        Settings.save_settings()
+    dn = board(None, when=None)
+    fires = record(dn)
+    with quiet():
+        set_rtc(dn, START.replace(day=3, hour=10))
+        run_for(dn, 1000)
+    rows.append({'check': 'off 06:31 -> next day 10:00', 'result': 'fired %s' % fired(fires)})
+    os.remove(os.path.join(workdir, 'schedule.state'))
+    return rows
+
+
+def main(argv):
+    days = 2
+    seed = 1
+    if '--days' in argv:
+        days = int(argv[argv.index('--days') + 1])
+    if '--seed' in argv:
+        seed = int(argv[argv.index('--seed') + 1])
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(harness.sim.ROOT, 'config.py'), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        rows = [scale(random.Random(seed), count, days) for count in (100, 1000, 5000, 10000)]
+        print_table('Schedule wakes over %d simulated days (host time)' % days,
+                    ('entries', 'n', 'p50_us', 'p95_us', 'p99_us', 'max_us', 'fires', 'us_per_fire',
+                     'ms_per_day', 'poll_ms_per_day', 'checked'), rows)
+        print_table('Clock handling', ('check', 'result'), checks(workdir))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
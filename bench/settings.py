@@ -0,0 +1,91 @@
+# settings.py: cost of reloading and saving settings
+#
+#     python -m bench.settings [--edits N]
+#
+# Compares reloading the old generated config.py (compiled from source,
+# as the board has to after every save) with reading settings.json, by
+# host time and peak Python heap.  Then renames relays N times, 200 ms
+# apart, and counts how many times the settings file is written.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench import harness
+from bench.harness import print_table, quiet
+
+
+def _measure(fn, n=200):
+    fn()
+    started = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    elapsed = (time.perf_counter_ns() - started) / n / 1000
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(argv):
+    edits = 20
+    if '--edits' in argv:
+        edits = int(argv[argv.index('--edits') + 1])
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(harness.sim.ROOT, 'config.py'), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with quiet():
+            harness.fresh_board()
+            from Settings import Settings
+            Settings.load_settings()
+        with open('config.py') as file:
+            source = file.read()
+
+        def legacy_reload():
+            namespace = {}
+            exec(compile(source, 'config.py', 'exec'), namespace)
+            return namespace['relays']
+
+        rows = []
+        for name, fn in (('config.py', legacy_reload), ('settings.json', Settings.load_settings)):
+            us, peak = _measure(fn)
+            rows.append({'reload': name, 'us_per_reload': us, 'peak_heap_bytes': peak})
+        print_table('Settings reload', ('reload', 'us_per_reload', 'peak_heap_bytes'), rows)
+
+        writes = [0]
+        save = Settings.save_settings
+
+        def counted_save():
+            wrote = save()
+            writes[0] += wrote
+            return wrote
+
+        Settings.save_settings = counted_save
+        import uasyncio
+
+        async def burst():
+            saver = uasyncio.create_task(Settings.run_saver())
+            for i in range(edits):
+                Settings.relays[1 + i % 8] = f'Relay {i}'
+                Settings.save_later()
+                await uasyncio.sleep_ms(200)
+            await uasyncio.sleep_ms(Settings.save_delay_ms + 1000)
+            saver.cancel()
+
+        uasyncio.run(burst())
+        Settings.save_settings = save
+        print_table('Burst of relay renames', ('edits', 'flash_writes'),
+                    [{'edits': edits, 'flash_writes': writes[0]}])
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
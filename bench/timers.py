@@ -0,0 +1,89 @@
+# timers.py: cost of the relay deadline scheduler
+#
+#     python -m bench.timers [--slots N] [--seconds S]
+#
+# Operation costs are host CPU time per call.  Expiry lateness runs the
+# scheduler on the realtime clock with 8 relay slots plus N job slots being
+# re-armed at random, and reports how late each callback ran.
+
+import random
+import sys
+import time
+
+from bench import harness
+from bench.harness import latency_summary, print_table
+from sim.clock import clock
+
+
+def _per_call_ns(fn, n):
+    started = time.perf_counter_ns()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter_ns() - started) / n
+
+
+def op_costs(slots):
+    harness.fresh_board()
+    from deadlines import DeadlineScheduler
+    sched = DeadlineScheduler()
+    for _ in range(slots):
+        sched.allocate(lambda slot: None)
+    n = 20000
+    rows = [
+        {'op': 'arm (new)', 'ns_per_call': _per_call_ns(lambda i: (sched.cancel(i % slots), sched.arm(i % slots, 1000)), n)},
+        {'op': 're-arm later', 'ns_per_call': _per_call_ns(lambda i: (clock.advance(0), sched.arm(i % slots, 1000 + i)), n)},
+        {'op': 'remaining', 'ns_per_call': _per_call_ns(lambda i: sched.remaining(i % slots), n)},
+        {'op': 'cancel', 'ns_per_call': _per_call_ns(lambda i: sched.cancel(i % slots), n)},
+    ]
+    return rows, sched._size
+
+
+def expiry_lateness(jobs, seconds):
+    harness.fresh_board()
+    harness.sim.install(realtime=True)
+    import uasyncio
+    from deadlines import DeadlineScheduler
+    sched = DeadlineScheduler()
+    due = {}
+    late_ns = []
+
+    def fired(slot):
+        late_ns.append(time.perf_counter_ns() - due.pop(slot))
+
+    slots = [sched.allocate(fired) for _ in range(8 + jobs)]
+
+    async def drive():
+        runner = uasyncio.create_task(sched.run())
+        rng = random.Random(1)
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            slot = rng.choice(slots)
+            delay = rng.randint(5, 200)
+            due[slot] = time.perf_counter_ns() + delay * 1000000
+            sched.arm(slot, delay)
+            await uasyncio.sleep_ms(rng.randint(0, 3))
+        await uasyncio.sleep_ms(250)
+        runner.cancel()
+
+    uasyncio.run(drive())
+    harness.sim.install(realtime=False)
+    row = {'slots': len(slots)}
+    row.update(latency_summary(late_ns))
+    return row
+
+
+def main(argv):
+    slots = 40
+    seconds = 2
+    if '--slots' in argv:
+        slots = int(argv[argv.index('--slots') + 1])
+    if '--seconds' in argv:
+        seconds = float(argv[argv.index('--seconds') + 1])
+    rows, heap = op_costs(slots)
+    print_table(f'Deadline scheduler operations ({slots} slots, heap holds {heap} entries)', ('op', 'ns_per_call'), rows)
+    print_table('Expiry lateness on the realtime clock (callback time minus deadline)',
+                ('slots', 'n', 'p50_us', 'p95_us', 'p99_us', 'max_us'), [expiry_lateness(slots - 8, seconds)])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
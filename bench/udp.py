@@ -0,0 +1,134 @@
+# udp.py: relay command round trips, UDP datagrams vs HTTP
+#
+#     python -m bench.udp [--n N]
+#
+# Runs the firmware on the realtime clock with the HTTP server and two
+# UdpControl endpoints (one unsigned, one with an HMAC key) on localhost,
+# and drives them from a host thread the way a dashboard or automation
+# would: --n toggles of relay 1, each waiting for its reply before the
+# next.  HTTP opens a connection per command (POST /relays, HTTP/1.0);
+# UDP uses tools/udpclient.py.  A second UDP client subscribes and counts
+# the change notifications it receives.  Round trips are host time on
+# loopback, so they show the firmware's per-command overhead, not Wi-Fi.
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from bench import harness
+from bench.harness import latency_summary, print_table, quiet
+
+sys.path.insert(0, os.path.join(harness.sim.ROOT, 'tools'))
+from udpclient import UdpClient  # noqa: E402
+
+KEY = 'bench-key'
+
+
+def _free_udp_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _http_toggle(port):
+    body = b'[["toggle", 1]]'
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.sendall(b'POST /relays HTTP/1.0\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+    data = b''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    sock.close()
+    if not data.startswith(b'HTTP/1.0 200'):
+        raise OSError(data[:40])
+
+
+def drive(n, http_port, udp_port, hmac_port, results):
+    watcher = UdpClient('127.0.0.1', udp_port)
+    watcher.subscribe()
+    runs = (('HTTP POST /relays', lambda: _http_toggle(http_port)),
+            ('UDP', UdpClient('127.0.0.1', udp_port).command),
+            ('UDP + HMAC', UdpClient('127.0.0.1', hmac_port, key=KEY).command))
+    for label, send in runs:
+        samples = []
+        started = time.perf_counter()
+        for _ in range(n):
+            t0 = time.perf_counter_ns()
+            if label == 'HTTP POST /relays':
+                send()
+            else:
+                status, state, version = send(toggle=1)
+                if status:
+                    raise OSError('status %d' % status)
+            samples.append(time.perf_counter_ns() - t0)
+        elapsed = time.perf_counter() - started
+        row = {'path': label}
+        row.update(latency_summary(samples))
+        row['cmds_per_s'] = n / elapsed
+        results.append(row)
+    notified = 0
+    while watcher.wait_notification(0.2) is not None:
+        notified += 1
+    results.append(notified)
+
+
+def main(argv):
+    n = 300
+    if '--n' in argv:
+        n = int(argv[argv.index('--n') + 1])
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(harness.sim.ROOT, 'config.py'), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = []
+    try:
+        with quiet():
+            harness.fresh_board()
+            harness.sim.install(realtime=True)
+            import uasyncio
+            from DN33C08 import DN33C08
+            from HttpServer import HttpServer
+            from UdpControl import UdpControl
+            dn = DN33C08()
+        udp = UdpControl(dn, _free_udp_port())
+        signed = UdpControl(dn, _free_udp_port(), KEY)
+
+        async def scenario():
+            http = HttpServer()
+            dn.register_routes(http)
+            server = await http.start('127.0.0.1', 0)
+            http_port = server.sockets[0].getsockname()[1]
+            tasks = [uasyncio.create_task(dn.process_input_queue()), uasyncio.create_task(udp.run()),
+                     uasyncio.create_task(signed.run())]
+            await uasyncio.sleep_ms(10)
+            client = threading.Thread(target=drive, args=(n, http_port, udp.port, signed.port, results))
+            client.start()
+            while client.is_alive():
+                await uasyncio.sleep_ms(20)
+            for task in tasks:
+                task.cancel()
+            server.close()
+
+        with quiet():
+            uasyncio.run(scenario())
+        harness.sim.install(realtime=False)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+    notified = results.pop()
+    print_table('Toggle round trip on localhost (%d commands each, host time)' % n,
+                ('path', 'n', 'p50_us', 'p95_us', 'p99_us', 'max_us', 'cmds_per_s'), results)
+    print('UDP subscriber received %d notifications for %d relay changes '
+          '(changes between two notifier wakeups share one)' % (notified, 3 * n))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
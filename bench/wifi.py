@@ -0,0 +1,128 @@
+# wifi.py: WifiConnection connect and reconnect paths on the simulated WLAN
+#
+#     python -m bench.wifi [--short-ms N] [--long-ms N]
+#
+# Boots without and then with the wifi.json cache, drops the link with the
+# access point still up, takes the AP away for a short and a long outage,
+# replaces it with one with a new BSSID, and boots once more with the probe
+# target refusing connections (static IP rejected, DHCP fallback).
+# Reports, in simulated time, which path brought the link back and how
+# long after the drop or the AP's return (up_after_ms) and after the
+# firmware noticed the loss (reconnect_ms, the wifi_reconnect_ms metric),
+# plus the longest host-time gap between turns of a 10 ms ticker task,
+# which is how long the event loop (and input handling) was held up.  The
+# probe target is a local listener instead of 8.8.8.8.
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench import harness
+from bench.harness import print_table, quiet
+from sim import network
+from sim.clock import clock
+
+
+def main(argv):
+    short_ms = 3000
+    long_ms = 60000
+    if '--short-ms' in argv:
+        short_ms = int(argv[argv.index('--short-ms') + 1])
+    if '--long-ms' in argv:
+        long_ms = int(argv[argv.index('--long-ms') + 1])
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(harness.sim.ROOT, 'config.py'), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    rows = []
+    try:
+        with quiet():
+            harness.fresh_board()
+            from Settings import Settings
+            from WifiConnection import WifiConnection
+            Settings.load_settings()
+        import uasyncio
+
+        async def accept(reader, writer):
+            await writer.wait_closed()
+
+        async def boot(probe_addr, label):
+            network.WLAN.reset()
+            wifi = WifiConnection(probe_timeout_ms=500)
+            wifi.probe_addr = probe_addr
+            task = uasyncio.create_task(wifi.start_and_maintain_connection())
+            await wifi.wait_connected()
+            rows.append({'scenario': label, 'path': 'fast' if wifi.connects['fast'] else 'full',
+                         'up_after_ms': wifi.last_reconnect_ms, 'reconnect_ms': wifi.last_reconnect_ms,
+                         'ip': wifi.wlan.ifconfig()[0]})
+            return wifi, task
+
+        async def outage(wifi, ms, label):
+            network.WLAN.ap_available = False
+            cut = clock.ticks_ms()
+            before = dict(wifi.connects)
+            await uasyncio.sleep_ms(ms)
+            network.WLAN.ap_available = True
+            await uasyncio.sleep_ms(0)
+            await wifi.wait_connected()
+            path = 'fast' if wifi.connects['fast'] > before['fast'] else 'full'
+            rows.append({'scenario': label, 'path': path, 'up_after_ms': clock.ticks_ms() - cut - ms,
+                         'reconnect_ms': wifi.last_reconnect_ms, 'ip': wifi.wlan.ifconfig()[0]})
+
+        async def drop(wifi, label):
+            # Link lost with the AP still there (deauth, interference).
+            before = dict(wifi.connects)
+            cut = clock.ticks_ms()
+            wifi.wlan.disconnect()
+            while wifi.is_up():
+                await uasyncio.sleep_ms(10)
+            await wifi.wait_connected()
+            path = 'fast' if wifi.connects['fast'] > before['fast'] else 'full'
+            rows.append({'scenario': label, 'path': path, 'up_after_ms': clock.ticks_ms() - cut,
+                         'reconnect_ms': wifi.last_reconnect_ms, 'ip': wifi.wlan.ifconfig()[0]})
+
+        async def scenario():
+            stall = [0]
+
+            async def ticker():
+                last = time.perf_counter()
+                while True:
+                    await uasyncio.sleep_ms(10)
+                    now = time.perf_counter()
+                    stall[0] = max(stall[0], now - last)
+                    last = now
+
+            ticking = uasyncio.create_task(ticker())
+            listener = await uasyncio.start_server(accept, '127.0.0.1', 0)
+            probe = ('127.0.0.1', listener.sockets[0].getsockname()[1])
+            wifi, task = await boot(probe, 'boot, no cache')
+            task.cancel()
+            wifi, task = await boot(probe, 'boot, cached')
+            await drop(wifi, 'link drop')
+            await outage(wifi, short_ms, 'AP gone %d ms' % short_ms)
+            await outage(wifi, long_ms, 'AP gone %d ms' % long_ms)
+            network.WLAN.bssid = b'\x10\x20\x30\x40\x50\x61'
+            await drop(wifi, 'AP replaced')
+            task.cancel()
+            listener.close()
+            os.remove(WifiConnection.cache_path)
+            wifi, task = await boot(probe, 'boot, probe refused')
+            task.cancel()
+            ticking.cancel()
+            return stall[0]
+
+        with quiet():
+            stall = uasyncio.run(scenario())
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+    print_table('Wi-Fi up times (simulated; AP scan %d ms, association %d ms)'
+                % (network.WLAN.scan_ms, network.WLAN.connect_ms),
+                ('scenario', 'path', 'up_after_ms', 'reconnect_ms', 'ip'), rows)
+    print_table('Event loop', ('max_loop_stall_host_ms',), [{'max_loop_stall_host_ms': stall * 1000}])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
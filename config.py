@@ -13,7 +13,7 @@ inputs = {	1: ['Hall', 12000, "Timed"],
             5: ['Attic', 36000, "Timed"],
             6: ['Cellar', 36000, "Timed"],
             7: ['Patio', 3600, "Timer_resets"],
-            8: ['Toilet', 0, "On_while_pressed"]}
+            8: ['Toilet', 0, "On_while_activated"]}
 ip = "192.168.1.253"
 subnet_mask = "255.255.255.0"
 gateway = "192.168.1.1"
@@ -0,0 +1,31 @@
+# atomicfile.py: replace small files on flash without leaving them half written
+#
+# write() writes <path>.tmp and renames it over <path>, so after a power cut
+# the file holds either the old or the new contents.  Where the filesystem
+# cannot rename over an existing file (FAT) the old file is removed first;
+# read() then falls back to the .tmp copy left behind if power failed in
+# between.
+
+import os
+
+
+def write(path, data, mode='w'):
+    tmp = path + '.tmp'
+    with open(tmp, mode) as fp:
+        fp.write(data)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        os.remove(path)
+        os.rename(tmp, path)
+
+
+def read(path, mode='r'):
+    # Contents of path (or its .tmp copy), or None if neither can be read.
+    for name in (path, path + '.tmp'):
+        try:
+            with open(name, mode) as fp:
+                return fp.read()
+        except OSError:
+            pass
+    return None
@@ -0,0 +1,36 @@
+# bootprof.py: time and heap taken by each boot phase
+#
+#     import bootprof
+#     ...imports, construction...
+#     bootprof.mark('core imports')
+#
+# Each mark() records the microseconds and heap bytes used since the
+# previous mark (or since this module was imported).  `phases` keeps
+# (name, us, heap_bytes, at_ms) tuples, where at_ms is ticks_ms since
+# power-up; heap_bytes is None on ports without gc.mem_alloc.
+
+import gc
+import time
+
+phases = []
+
+_mem_alloc = getattr(gc, 'mem_alloc', None)
+_last_us = time.ticks_us()
+_last_heap = _mem_alloc() if _mem_alloc else None
+
+
+def mark(name):
+    global _last_us, _last_heap
+    now = time.ticks_us()
+    heap = _mem_alloc() if _mem_alloc else None
+    phases.append((name, time.ticks_diff(now, _last_us), None if heap is None else heap - _last_heap,
+                   time.ticks_ms()))
+    _last_us = now
+    _last_heap = heap
+
+
+def report():
+    lines = ['Boot profile:']
+    for name, us, heap, at_ms in phases:
+        lines.append('  %-20s %8d us %8s bytes  at %d ms' % (name, us, '-' if heap is None else heap, at_ms))
+    return '\n'.join(lines)
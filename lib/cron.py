@@ -0,0 +1,126 @@
+# cron.py: cron expressions and calendar dates in integer arithmetic
+#
+# CronSpec parses the five classic fields (minute, hour, day of month,
+# month, day of week) with *, lists, ranges and /steps, and finds the next
+# matching minute after a given one.  Minutes and hours are looked up in
+# tables of the next allowed value, so a search costs one day test per day
+# it passes, and whole months that cannot match are stepped over.  Like
+# cron, when both day fields are restricted a day matching either one
+# matches; day of week 0 and 7 are both Sunday.
+#
+# Times are minutes since 1970-01-01 00:00 and days are days since then, in
+# whatever zone the caller works in.  days_from_civil() and
+# civil_from_days() convert dates without time.mktime() and friends, whose
+# epoch differs between ports.
+
+_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+_NONE = 255
+_SEARCH_DAYS = 8 * 366  # long enough for 29 February on a given weekday
+
+
+def days_from_civil(year, month, day):
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month - 3 if month > 2 else month + 9) + 2) // 5 + day - 1
+    return era * 146097 + yoe * 365 + yoe // 4 - yoe // 100 + doy - 719468
+
+
+def civil_from_days(days):
+    # (year, month, day)
+    days += 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    month = mp + 3 if mp < 10 else mp - 9
+    return yoe + era * 400 + (month <= 2), month, doy - (153 * mp + 2) // 5 + 1
+
+
+def weekday(days):
+    # 0 = Sunday, as in cron.
+    return (days + 4) % 7
+
+
+def parse_field(text, low, high):
+    # A cron field as a bitmask of the values it allows.
+    mask = 0
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+            if step < 1:
+                raise ValueError(f"bad step in {text!r}")
+        if part == '*':
+            first, last = low, high
+        elif '-' in part:
+            first, last = part.split('-')
+            first, last = int(first), int(last)
+        else:
+            first = last = int(part)
+            if step > 1:
+                last = high
+        if not low <= first <= last <= high:
+            raise ValueError(f"{text!r} not within {low}-{high}")
+        for value in range(first, last + 1, step):
+            mask |= 1 << value
+    return mask
+
+
+def _next_table(mask, count):
+    # table[i] is the first allowed value >= i, _NONE past the last one.
+    table = bytearray(count + 1)
+    following = _NONE
+    for i in range(count, -1, -1):
+        if i < count and mask >> i & 1:
+            following = i
+        table[i] = following
+    return table
+
+
+class CronSpec:
+    def __init__(self, text):
+        fields = text.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron needs five fields: {text!r}")
+        minute, hour, self.month_days, self.months, week_days = [
+            parse_field(field, low, high) for field, (low, high) in zip(fields, _RANGES)]
+        if week_days & 0x80:
+            week_days = (week_days | 1) & 0x7f
+        self.week_days = week_days
+        self.any_day = fields[2].startswith('*') or fields[4].startswith('*')
+        self._minutes = _next_table(minute, 60)
+        self._hours = _next_table(hour, 24)
+
+    def day_matches(self, days, month_day):
+        in_month = self.month_days >> month_day & 1
+        in_week = self.week_days >> weekday(days) & 1
+        if self.any_day:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, minute):
+        # The first matching minute after `minute`, -1 if there is none.
+        minute += 1
+        days, of_day = divmod(minute, 1440)
+        end = days + _SEARCH_DAYS
+        while days < end:
+            year, month, day = civil_from_days(days)
+            if not self.months >> month & 1:
+                days = days_from_civil(year + (month == 12), month % 12 + 1, 1)
+                of_day = 0
+                continue
+            if self.day_matches(days, day):
+                hour = self._hours[of_day // 60]
+                at = of_day % 60 if hour == of_day // 60 else 0
+                while hour != _NONE:
+                    found = self._minutes[at]
+                    if found != _NONE:
+                        return days * 1440 + hour * 60 + found
+                    hour = self._hours[hour + 1]
+                    at = 0
+            days += 1
+            of_day = 0
+        return -1
@@ -0,0 +1,186 @@
+# deadlines.py: one task serving many one-shot deadlines
+#
+# Every timed thing (a relay timeout, a pulse, a job) owns a slot.  A slot
+# holds at most one deadline; arming it again replaces the deadline.
+# Armed slots sit in a binary min-heap of slot numbers kept in a fixed
+# array, with each slot's heap position recorded, so arming and cancelling
+# are O(log n) in place and never allocate.  The heap is ordered by each
+# slot's key, the deadline it was placed with: re-arming a running slot
+# later (a Timer_resets input retriggered) only rewrites its deadline, in
+# O(1), and the slot is moved down when its key reaches the top.
+# remaining() is O(1) and only reads, so it may be called from another
+# core while the scheduler runs.  Callbacks run in the scheduler task,
+# never in IRQ context.
+#
+# Deadlines are kept as milliseconds since the scheduler started, derived
+# from ticks_diff() so that ticks_ms() wrap-around is harmless.
+
+from array import array
+import time
+import uasyncio
+import log
+
+_REBASE_MS = 1 << 29
+
+
+class DeadlineScheduler:
+    def __init__(self):
+        self._deadline = array('i')
+        self._key = array('i')  # heap order; earlier than _deadline after a lazy re-arm
+        self._pos = array('h')  # heap index of each slot, -1 when not armed
+        self._heap = array('H')  # slot numbers; the first _size are the heap
+        self._size = 0
+        self._callbacks = []
+        self._last_ticks = time.ticks_ms()
+        self._elapsed = 0
+        self._seq = 0  # odd while now() updates the clock, for remaining()
+        self._wake = uasyncio.Event()
+        self._sleep_until = None
+        self.expired = 0
+
+    def allocate(self, callback):
+        # Reserve a slot; callback(slot) runs when its deadline passes.
+        self._deadline.append(0)
+        self._key.append(0)
+        self._pos.append(-1)
+        self._heap.append(0)
+        self._callbacks.append(callback)
+        return len(self._callbacks) - 1
+
+    def now(self):
+        ticks = time.ticks_ms()
+        self._seq += 1
+        self._elapsed += time.ticks_diff(ticks, self._last_ticks)
+        self._last_ticks = ticks
+        if self._elapsed >= _REBASE_MS:
+            self._rebase()
+        self._seq += 1
+        return self._elapsed
+
+    def _rebase(self):
+        # Shifting every deadline by the same amount keeps the heap order.
+        shift = self._elapsed
+        self._elapsed = 0
+        for slot in range(len(self._deadline)):
+            self._deadline[slot] -= shift
+            self._key[slot] -= shift
+        if self._sleep_until is not None:
+            self._sleep_until -= shift
+
+    def _sift_up(self, i):
+        heap, pos, key = self._heap, self._pos, self._key
+        slot = heap[i]
+        d = key[slot]
+        while i:
+            parent = (i - 1) >> 1
+            other = heap[parent]
+            if key[other] <= d:
+                break
+            heap[i] = other
+            pos[other] = i
+            i = parent
+        heap[i] = slot
+        pos[slot] = i
+
+    def _sift_down(self, i):
+        heap, pos, key = self._heap, self._pos, self._key
+        size = self._size
+        slot = heap[i]
+        d = key[slot]
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and key[heap[child + 1]] < key[heap[child]]:
+                child += 1
+            other = heap[child]
+            if d <= key[other]:
+                break
+            heap[i] = other
+            pos[other] = i
+            i = child
+        heap[i] = slot
+        pos[slot] = i
+
+    def _remove_at(self, i):
+        slot = self._heap[i]
+        self._pos[slot] = -1
+        self._size -= 1
+        if i < self._size:
+            last = self._heap[self._size]
+            self._heap[i] = last
+            if i and self._key[last] < self._key[self._heap[(i - 1) >> 1]]:
+                self._sift_up(i)
+            else:
+                self._sift_down(i)
+
+    def arm(self, slot, delay_ms):
+        deadline = self.now() + delay_ms
+        i = self._pos[slot]
+        self._deadline[slot] = deadline
+        if i >= 0 and deadline >= self._key[slot]:
+            # Later than its place in the heap: moved when it gets to the top.
+            return
+        self._key[slot] = deadline
+        if i < 0:
+            i = self._size
+            self._size += 1
+            self._heap[i] = slot
+        self._sift_up(i)
+        if self._sleep_until is None or deadline < self._sleep_until:
+            self._wake.set()
+
+    def cancel(self, slot):
+        i = self._pos[slot]
+        if i >= 0:
+            self._remove_at(i)
+
+    def armed(self, slot):
+        return self._pos[slot] >= 0
+
+    def remaining(self, slot):
+        # Computed without advancing the clock; a read that overlapped an
+        # update in now() is retried.
+        while True:
+            seq = self._seq
+            if self._pos[slot] < 0:
+                return 0
+            left = self._deadline[slot] - self._elapsed - time.ticks_diff(time.ticks_ms(), self._last_ticks)
+            if not seq & 1 and seq == self._seq:
+                return max(0, left)
+
+    def run_due(self):
+        # Fire every deadline that has passed; returns ms until the next one.
+        heap, key, deadline = self._heap, self._key, self._deadline
+        now = self.now()
+        while self._size and key[heap[0]] <= now:
+            slot = heap[0]
+            if deadline[slot] != key[slot]:
+                # Re-armed later since it was placed.
+                key[slot] = deadline[slot]
+                self._sift_down(0)
+                continue
+            self._remove_at(0)
+            self.expired += 1
+            try:
+                self._callbacks[slot](slot)
+            except Exception as e:
+                log.error('Deadline callback for slot %d failed: %r', slot, e)
+            now = self.now()
+        if self._size:
+            return key[heap[0]] - now
+        return None
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            wait = self.run_due()
+            if wait is None:
+                self._sleep_until = None
+                await self._wake.wait()
+                continue
+            self._sleep_until = self._elapsed + wait
+            try:
+                await uasyncio.wait_for_ms(self._wake.wait(), wait)
+            except uasyncio.TimeoutError:
+                pass
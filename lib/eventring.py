@@ -0,0 +1,69 @@
+# eventring.py: fixed-size ring buffer of (id, edge, ticks) events
+#
+# put() is safe to call from an IRQ handler: it only writes into storage
+# preallocated at construction and never allocates.  There must be a single
+# producer context (the input IRQs) and a single consumer task.  When the
+# ring is full the new event is discarded and counted in `overflows`.
+
+from array import array
+import uasyncio
+
+
+class EventRing:
+    def __init__(self, size=32):
+        if size < 2 or size & (size - 1):
+            raise ValueError("EventRing size must be a power of two")
+        self._mask = size - 1
+        self._ids = bytearray(size)
+        self._edges = bytearray(size)
+        self._ticks = array('i', [0] * size)
+        self._head = 0  # next slot to write, owned by the producer
+        self._tail = 0  # next slot to read, owned by the consumer
+        self.overflows = 0
+        self.high_water = 0
+        self.flag = uasyncio.ThreadSafeFlag()
+
+    def put(self, id, edge, ticks):
+        head = self._head
+        nxt = (head + 1) & self._mask
+        if nxt == self._tail:
+            self.overflows += 1
+            return False
+        self._ids[head] = id
+        self._edges[head] = edge
+        self._ticks[head] = ticks
+        self._head = nxt
+        used = (nxt - self._tail) & self._mask
+        if used > self.high_water:
+            self.high_water = used
+        self.flag.set()
+        return True
+
+    def count(self):
+        return (self._head - self._tail) & self._mask
+
+    def capacity(self):
+        return self._mask
+
+    def drain(self, handler, limit=0):
+        # Call handler(id, edge, ticks) for queued events, oldest first.
+        n = 0
+        tail = self._tail
+        while tail != self._head:
+            id = self._ids[tail]
+            edge = self._edges[tail]
+            ticks = self._ticks[tail]
+            tail = (tail + 1) & self._mask
+            self._tail = tail
+            handler(id, edge, ticks)
+            n += 1
+            if n == limit:
+                break
+        return n
+
+    async def wait(self):
+        if self._head == self._tail:
+            await self.flag.wait()
+
+    def clear(self):
+        self._tail = self._head
@@ -0,0 +1,115 @@
+# inputscan.py: debounced inputs sampled from the GPIO input register
+#
+# Instead of an IRQ per edge, scan() reads every input at once, from the
+# RP2040 SIO GPIO_IN register where the port exposes mem32, and is called
+# at a fixed rate by a timer (or by whoever owns the inputs, see IOEngine).
+# The cost is one call per period however noisy the wiring is.
+#
+# Inputs are active low.  Each one has an integrator: a sample that
+# disagrees with the debounced state counts up, one that agrees counts
+# down, so isolated glitches cancel out instead of restarting the count.
+# The state flips, and emit(input_id, pressed) is called, once the count
+# reaches press_ms or release_ms worth of samples.  A glitch that dies out
+# before that is counted in `rejected`.  Inputs that are stable with a
+# zero count cost nothing beyond the register read.  The counts are
+# bytes, so press_ms and release_ms may be at most 255 periods; other
+# timings raise ValueError.
+
+from micropython import const
+from machine import Timer
+
+try:
+    from machine import mem32
+except ImportError:
+    mem32 = None
+
+_SIO_GPIO_IN = const(0xd0000004)
+
+
+class InputScanner:
+    def __init__(self, pins, gpios, emit, period_ms=2, press_ms=20, release_ms=40):
+        if not isinstance(period_ms, int) or period_ms <= 0:
+            raise ValueError(f"Invalid scan period: {period_ms!r} ms")
+        self._pins = pins
+        self._emit = emit
+        self.period_ms = period_ms
+        self.press_n = max(1, press_ms // period_ms)
+        self.release_n = max(1, release_ms // period_ms)
+        if self.press_n > 255 or self.release_n > 255:
+            raise ValueError(f"Invalid scan timing: press and release within 255 periods of {period_ms} ms")
+        self._counts = bytearray(len(pins))
+        self._all = (1 << len(pins)) - 1
+        # Runs of consecutive GPIOs as (register shift, width mask, input
+        # bit), so gathering the inputs takes a few shifts, not one per pin.
+        self._runs = []
+        if mem32 is not None:
+            i = 0
+            while i < len(gpios):
+                j = i
+                while j + 1 < len(gpios) and gpios[j + 1] == gpios[j] + 1:
+                    j += 1
+                self._runs.append((gpios[i], (1 << (j - i + 1)) - 1, i))
+                i = j + 1
+        self.state = self.read()  # debounced, bit i set while input i + 1 is pressed
+        self._active = 0  # inputs with a non-zero count
+        self.samples = 0
+        self.edges = 0
+        self.rejected = 0
+        self._timer = Timer(-1)
+        self._tick_cb = self._tick
+
+    def read(self):
+        # Raw pressed bitmask, bit i for input i + 1.
+        levels = 0
+        if self._runs:
+            raw = mem32[_SIO_GPIO_IN]
+            for shift, mask, bit in self._runs:
+                levels |= ((raw >> shift) & mask) << bit
+        else:
+            pins = self._pins
+            for i in range(len(pins)):
+                if pins[i].value():
+                    levels |= 1 << i
+        return ~levels & self._all
+
+    def start(self):
+        self._timer.init(period=self.period_ms, mode=Timer.PERIODIC, callback=self._tick_cb)
+
+    def stop(self):
+        self._timer.deinit()
+
+    def _tick(self, timer):
+        self.scan()
+
+    def scan(self):
+        self.samples += 1
+        pressed = self.read()
+        state = self.state
+        busy = (pressed ^ state) | self._active
+        if not busy:
+            return
+        counts = self._counts
+        i = 0
+        while busy:
+            if busy & 1:
+                bit = 1 << i
+                count = counts[i]
+                if (pressed ^ state) & bit:
+                    count += 1
+                    if count >= (self.release_n if state & bit else self.press_n):
+                        count = 0
+                        state ^= bit
+                        self.state = state
+                        self.edges += 1
+                        self._emit(i + 1, state & bit)
+                else:
+                    count -= 1
+                    if not count:
+                        self.rejected += 1
+                counts[i] = count
+                if count:
+                    self._active |= bit
+                else:
+                    self._active &= ~bit
+            busy >>= 1
+            i += 1
@@ -0,0 +1,205 @@
+# inputtrace.py: compact binary trace of input edges and relay states
+#
+#     trace = TraceRecorder('inputs.trace', relay_state=register.state)
+#     dn33c08.trace = trace                  # every raw edge, bounce included
+#     register.trace = trace                 # every relay state change
+#     uasyncio.create_task(trace.run())
+#
+# A file is an 8-byte header (b'DNTR', format version, relay bitmask when
+# the file was started, two pad bytes) followed by little-endian 32-bit
+# records.  Each record holds the microseconds since the previous one and
+# stays below 2**30, so storing it never allocates a long int:
+#
+#     bits 0-1   kind: 0 edge, 1 relays, 2 gap
+#     edge       bits 2-4 input id - 1, bit 5 pin level, bits 6-29 delta
+#     relays     bits 2-9 relay bitmask, bits 10-29 delta
+#     gap        bits 2-29 delta, for pauses too long for the next record
+#
+# edge() is called from the input IRQ and relays() from tasks; both only
+# write into a preallocated ring, which has that one side as its only
+# writer: run() has idle() write the gap records for long pauses there
+# too, through the call it is given.  run() appends the ring to the file
+# every flush_ms, or sooner when it is half full.  The first flush after
+# boot and every flush past max_bytes start a new file and keep the
+# previous one as <path>.1.  Records that find the ring full are counted
+# in `dropped`.
+
+from array import array
+from machine import disable_irq, enable_irq
+import os
+import struct
+import time
+import uasyncio
+
+MAGIC = b'DNTR'
+VERSION = 1
+HEADER = '<4sBBxx'
+HEADER_SIZE = 8
+
+EDGE = 0
+RELAYS = 1
+GAP = 2
+
+_EDGE_MAX = (1 << 24) - 1
+_RELAYS_MAX = (1 << 20) - 1
+_GAP_MAX = (1 << 28) - 1
+# Idle time after which run() writes a gap record, well under half the
+# ticks_us period so deltas never become ambiguous.
+_IDLE_US = 300000000
+
+
+class TraceRecorder:
+    def __init__(self, path='inputs.trace', size=256, relay_state=0, flush_ms=10000, max_bytes=65536):
+        if size < 2 or size & (size - 1):
+            raise ValueError("TraceRecorder size must be a power of two")
+        self.path = path
+        self.flush_ms = flush_ms
+        self.max_bytes = max_bytes
+        self.relay_state = relay_state
+        self._file_state = relay_state  # relay bitmask as of the last flushed record
+        self._ring = array('I', [0] * size)
+        self._mask = size - 1
+        self._head = 0
+        self._tail = 0
+        self._last = time.ticks_us()
+        self._pending = False
+        self._size = -1  # bytes in the current file; -1 until one is started
+        self.records = 0
+        self.dropped = 0
+        self._flag = uasyncio.ThreadSafeFlag()
+
+    def _put(self, word):
+        head = self._head
+        nxt = (head + 1) & self._mask
+        if nxt == self._tail:
+            self.dropped += 1
+            return
+        self._ring[head] = word
+        self._head = nxt
+        self.records += 1
+        if ((nxt - self._tail) & self._mask) > (self._mask >> 1):
+            self._flag.set()
+
+    def _delta(self, now, limit):
+        # Microseconds since the last record; writes gap records until the
+        # rest fits in `limit`.
+        delta = time.ticks_diff(now, self._last)
+        if delta < 0:
+            delta = 0
+        while delta > limit:
+            step = delta if delta < _GAP_MAX else _GAP_MAX
+            self._put(step << 2 | GAP)
+            delta -= step
+        self._last = now
+        return delta
+
+    def edge(self, input_id, level, now):
+        delta = self._delta(now, _EDGE_MAX)
+        self._put(delta << 6 | (1 if level else 0) << 5 | (input_id - 1) << 2 | EDGE)
+        self._pending = True
+
+    def relays(self, state):
+        irq = disable_irq()
+        delta = self._delta(time.ticks_us(), _RELAYS_MAX)
+        self._put(delta << 10 | state << 2 | RELAYS)
+        self.relay_state = state
+        enable_irq(irq)
+        self._pending = True
+
+    def idle(self):
+        # A gap record if nothing was recorded for _IDLE_US, so deltas
+        # never become ambiguous.  Producer side, like edge() and relays().
+        irq = disable_irq()
+        now = time.ticks_us()
+        if time.ticks_diff(now, self._last) > _IDLE_US:
+            self._delta(now, 0)
+        enable_irq(irq)
+
+    def count(self):
+        return (self._head - self._tail) & self._mask
+
+    def _start_file(self):
+        try:
+            os.remove(self.path + '.1')
+        except OSError:
+            pass
+        try:
+            os.rename(self.path, self.path + '.1')
+        except OSError:
+            pass
+        with open(self.path, 'wb') as file:
+            file.write(struct.pack(HEADER, MAGIC, VERSION, self._file_state))
+        self._size = HEADER_SIZE
+
+    def flush(self):
+        head = self._head
+        tail = self._tail
+        if head == tail:
+            return 0
+        if self._size < 0 or self._size >= self.max_bytes:
+            self._start_file()
+        ring = memoryview(self._ring)
+        with open(self.path, 'ab') as file:
+            if head > tail:
+                file.write(ring[tail:head])
+            else:
+                file.write(ring[tail:])
+                file.write(ring[:head])
+        n = (head - tail) & self._mask
+        while tail != head:
+            word = self._ring[tail]
+            if word & 3 == RELAYS:
+                self._file_state = (word >> 2) & 0xFF
+            tail = (tail + 1) & self._mask
+        self._tail = head
+        self._size += n * 4
+        self._pending = False
+        return n
+
+    async def run(self, call=None):
+        # call(fn) runs fn on the producer side (IOEngine.post_call when
+        # inputs and relays are on core 1); without it, idle() runs here.
+        while True:
+            try:
+                await uasyncio.wait_for_ms(self._flag.wait(), self.flush_ms)
+            except uasyncio.TimeoutError:
+                pass
+            if time.ticks_diff(time.ticks_us(), self._last) > _IDLE_US:
+                if call is None:
+                    self.idle()
+                else:
+                    try:
+                        call(self.idle)
+                    except OSError:
+                        pass  # busy; tried again on the next wake
+            # Idle gap records alone wait until the ring is half full.
+            if self._pending or self.count() > (self._mask >> 1):
+                self.flush()
+
+
+def decode(data):
+    # Returns (relay bitmask at the start, [(us, kind, id, value), ...]) with
+    # us counted from the start of the file; kind is EDGE (id is the input,
+    # value the pin level) or RELAYS (id 0, value the relay bitmask).
+    magic, version, state = struct.unpack_from(HEADER, data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an input trace")
+    records = []
+    us = 0
+    for offset in range(HEADER_SIZE, len(data) - 3, 4):
+        word = struct.unpack_from('<I', data, offset)[0]
+        kind = word & 3
+        if kind == EDGE:
+            us += word >> 6
+            records.append((us, EDGE, ((word >> 2) & 7) + 1, (word >> 5) & 1))
+        elif kind == RELAYS:
+            us += word >> 10
+            records.append((us, RELAYS, 0, (word >> 2) & 0xFF))
+        else:
+            us += word >> 2
+    return state, records
+
+
+def load(path):
+    with open(path, 'rb') as file:
+        return decode(file.read())
@@ -0,0 +1,49 @@
+# log.py: level-gated logging to the console
+#
+# Messages use %-style arguments that are only formatted when the level is
+# enabled, so a disabled debug() costs one call and one comparison.  Hot
+# paths can skip even that with `if log.level <= log.DEBUG:`.
+
+from micropython import const
+import time
+
+DEBUG = const(10)
+INFO = const(20)
+WARNING = const(30)
+ERROR = const(40)
+OFF = const(100)
+
+_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+level = INFO
+
+
+def set_level(new_level):
+    global level
+    level = new_level
+
+
+def _emit(lvl, msg, args):
+    if args:
+        msg = msg % args
+    print('%d %s %s' % (time.ticks_ms(), _NAMES[lvl], msg))
+
+
+def debug(msg, *args):
+    if level <= DEBUG:
+        _emit(DEBUG, msg, args)
+
+
+def info(msg, *args):
+    if level <= INFO:
+        _emit(INFO, msg, args)
+
+
+def warning(msg, *args):
+    if level <= WARNING:
+        _emit(WARNING, msg, args)
+
+
+def error(msg, *args):
+    if level <= ERROR:
+        _emit(ERROR, msg, args)
@@ -0,0 +1,55 @@
+# mailbox.py: lock-free queue of small ints between two cores or threads
+#
+# One producer and one consumer, each owning one index: the producer only
+# moves _head, the consumer only moves _tail, and a word is stored before
+# _head moves past it, so neither side ever sees a half-written entry and
+# no lock is needed.  put() stages words privately; commit() publishes
+# everything staged in one store, so a multi-word message shows up whole
+# or not at all.  Words must stay below 2**30 so that storing them never
+# allocates, which keeps put() and get() usable on a core that must not
+# collect garbage.
+
+from array import array
+
+
+class Mailbox:
+    def __init__(self, size=64):
+        if size < 2 or size & (size - 1):
+            raise ValueError("Mailbox size must be a power of two")
+        self._words = array('i', [0] * size)
+        self._mask = size - 1
+        self._head = 0  # published by commit(), read by the consumer
+        self._stage = 0  # producer's write position, ahead of _head while staging
+        self._tail = 0
+        self.overflows = 0
+
+    def free(self):
+        return self._mask - ((self._stage - self._tail) & self._mask)
+
+    def put(self, word):
+        stage = self._stage
+        nxt = (stage + 1) & self._mask
+        if nxt == self._tail:
+            self.overflows += 1
+            return False
+        self._words[stage] = word
+        self._stage = nxt
+        return True
+
+    def commit(self):
+        self._head = self._stage
+
+    def abort(self):
+        self._stage = self._head
+
+    def count(self):
+        return (self._head - self._tail) & self._mask
+
+    def get(self):
+        # Next published word, or -1 when there is none.
+        tail = self._tail
+        if tail == self._head:
+            return -1
+        word = self._words[tail]
+        self._tail = (tail + 1) & self._mask
+        return word
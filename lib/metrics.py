@@ -0,0 +1,89 @@
+# metrics.py: counters and fixed-bucket histograms in Prometheus text form
+#
+# Histogram.observe() only touches preallocated storage, so it can sit on
+# hot paths.  Values that already live elsewhere (queue high-water marks,
+# drop counters) are registered as callables and read at scrape time
+# instead of being copied on every update.  Registering a name again
+# replaces the previous entry.
+
+from array import array
+
+# Microsecond buckets used for the latency histograms.
+LATENCY_US = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+_registry = {}
+
+
+class Histogram:
+    def __init__(self, name, help, bounds=LATENCY_US):
+        self.name = name
+        self.help = help
+        self.bounds = bounds
+        self.counts = array('I', [0] * (len(bounds) + 1))
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        bounds = self.bounds
+        n = len(bounds)
+        i = 0
+        while i < n and value > bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, out):
+        name = self.name
+        out.append('# HELP %s %s\n# TYPE %s histogram\n' % (name, self.help, name))
+        total = 0
+        for i, bound in enumerate(self.bounds):
+            total += self.counts[i]
+            out.append('%s_bucket{le="%d"} %d\n' % (name, bound, total))
+        total += self.counts[-1]
+        out.append('%s_bucket{le="+Inf"} %d\n%s_sum %d\n%s_count %d\n' % (name, total, name, self.sum, name, total))
+
+
+class Value:
+    # A counter or gauge read from fn() at scrape time.  fn returns a
+    # number, or a list of (labels, number) such as ('relay="1"', 5).
+    def __init__(self, name, help, fn, kind):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+
+    def render(self, out):
+        name = self.name
+        out.append('# HELP %s %s\n# TYPE %s %s\n' % (name, self.help, name, self.kind))
+        value = self.fn()
+        if isinstance(value, list):
+            for labels, v in value:
+                out.append('%s{%s} %s\n' % (name, labels, v))
+        else:
+            out.append('%s %s\n' % (name, value))
+
+
+def histogram(name, help, bounds=LATENCY_US):
+    h = Histogram(name, help, bounds)
+    _registry[name] = h
+    return h
+
+
+def counter(name, help, fn):
+    _registry[name] = Value(name, help, fn, 'counter')
+
+
+def gauge(name, help, fn):
+    _registry[name] = Value(name, help, fn, 'gauge')
+
+
+def render():
+    # The exposition as a list of str chunks, to be written one by one.
+    out = []
+    for item in _registry.values():
+        try:
+            item.render(out)
+        except Exception as e:
+            out.append('# %s unavailable: %s\n' % (item.name, e))
+    return out
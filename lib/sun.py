@@ -0,0 +1,34 @@
+# sun.py: sunrise and sunset times
+#
+# NOAA's approximation (fractional year, equation of time, solar
+# declination) for the sun's centre at 90.833 degrees from the zenith, the
+# usual definition of sunrise and sunset.  It is within a minute or two at
+# mid latitudes, also in the single-precision floats of the rp2 port.
+
+import math
+
+from cron import civil_from_days, days_from_civil
+
+_RAD = math.pi / 180
+_COS_ZENITH = math.cos(90.833 * _RAD)
+
+
+def sun_times(days, latitude, longitude):
+    # (sunrise, sunset) in minutes from 00:00 UTC on `days` (days since
+    # 1970-01-01), None where the sun stays up or down all day.  Far from
+    # Greenwich either may fall outside 0-1439.
+    year = civil_from_days(days)[0]
+    first = days_from_civil(year, 1, 1)
+    gamma = 2 * math.pi * (days - first + 0.5) / (days_from_civil(year + 1, 1, 1) - first)
+    eqtime = 229.18 * (0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma)
+                       - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma)
+            - 0.006758 * math.cos(2 * gamma) + 0.000907 * math.sin(2 * gamma)
+            - 0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma))
+    lat = latitude * _RAD
+    cos_hour_angle = _COS_ZENITH / (math.cos(lat) * math.cos(decl)) - math.tan(lat) * math.tan(decl)
+    if not -1 <= cos_hour_angle <= 1:
+        return None
+    half_day = 4 * math.acos(cos_hour_angle) / _RAD
+    noon = 720 - 4 * longitude - eqtime
+    return round(noon - half_day), round(noon + half_day)
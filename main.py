@@ -1,134 +1,167 @@
+import bootprof
+import gc
 import uasyncio
-from WifiConnection import WifiConnection
+import log
+import metrics
 from DN33C08 import DN33C08
-from MQTTManager import MQTTManager
 from Settings import Settings
-import ujson
+from RelaySnapshot import RelaySnapshot
+bootprof.mark('core imports')
 
 dn33c08 = DN33C08()
+snapshot = RelaySnapshot(dn33c08)
+bootprof.mark('DN33C08()')
 mqtt_manager = None
+# The web side is imported and built by start_network() once Wi-Fi is up.
+assets = None
+events = None
+http = None
 
-async def handle_client(reader, writer):
-    with open('relays_overview.html') as file:
-        html = file.read()
-    request_line = await reader.readline()
-    while await reader.readline() != b"\r\n":
-        pass
-    request = str(request_line, 'utf-8').split()[1]
-    print('Request:', request)
-    try:
-        if request == '/favicon.ico':
-            writer.write(b'HTTP/1.0 404 Not Found\r\n\r\n')
-        elif request == '/relay_states':
-            writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n\r\n')
-            try:
-                json_data = dn33c08.generate_relay_json()
-                writer.write(ujson.dumps(json_data).encode())
-            except Exception as e:
-                import sys
-                print("Error in generate_relay_json:")
-                sys.print_exception(e)
-                writer.write(b'{"error": "Internal server error"}')
-        elif request.startswith('/toggle_relay'):
-            relay_num = int(request.split('/toggle_relay')[1])
-            if 1 <= relay_num <= 8:
-                # Find an input that controls this relay
-                for input_id, mapping in dn33c08.input_output_mappings.items():
-                    if mapping['output'] == relay_num:
-                        # Simulate an input activation
-                        await dn33c08.handle_input_activation(input_id)
-                        writer.write(b'HTTP/1.0 200 OK\r\n\r\n')
-                        print(f'Relay {relay_num} toggled via input {input_id}')
-                        break
-                else:
-                    writer.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
-                    print(f'No input found for relay {relay_num}')
-            else:
-                writer.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
-        elif request.startswith('/update_name'):
-            relay_num = int(request.split('/update_name')[1].split('?')[0])
-            new_name = request.split('name=')[1]
-            if 1 <= relay_num <= 8:
-                dn33c08.set_relay_name(relay_num, new_name)
-                writer.write(b'HTTP/1.0 200 OK\r\n\r\n')
-                print(f'Relay {relay_num} name updated to {new_name}')
-            else:
-                writer.write(b'HTTP/1.0 400 Bad Request\r\n\r\n')
-        else:
-            writer.write(b'HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n')
-            writer.write(html.encode())
-    except Exception as e:
-        print(f'Error handling request {request}: {e}')
-        writer.write(b'HTTP/1.0 500 Internal Server Error\r\n\r\n')
-    finally:
-        await writer.drain()
-        await writer.wait_closed()
-        print('Client Disconnected')
+if hasattr(gc, 'mem_free'):
+    metrics.gauge('heap_free_bytes', 'Free heap', gc.mem_free)
+    metrics.gauge('heap_alloc_bytes', 'Allocated heap', gc.mem_alloc)
+metrics.gauge('boot_phase_us', 'Time taken by each boot phase',
+              lambda: [('phase="%s"' % name, us) for name, us, heap, at_ms in bootprof.phases])
+
+async def serve_metrics(req):
+    req.writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n\r\n')
+    for chunk in metrics.render():
+        req.writer.write(chunk.encode())
 
 async def run_server(wifi):
     while True:
-        if wifi.wlan and wifi.wlan.isconnected():
-            server = await uasyncio.start_server(handle_client, "0.0.0.0", 80)
-            print(f"Server started on {Settings.ip}")
-            await server.wait_closed()
+        if wifi.is_up():
+            log.info('Server started on %s', Settings.ip)
+            await http.serve("0.0.0.0", 80)
         else:
-            print("No WiFi connection. Waiting...")
+            log.info('No WiFi connection. Waiting...')
             await uasyncio.sleep_ms(5000)
 
-async def initialize_mqtt():
+def start_mqtt():
     global mqtt_manager
+    from MQTTManager import MQTTManager
     mqtt_manager = MQTTManager(dn33c08, broker=Settings.mqtt_broker, topic_prefix=Settings.mqtt_topic_prefix)
-    try:
-        mqtt_manager.connect()
-        print("MQTT connected")
-    except Exception as e:
-        print(f"MQTT connection failed: {e}")
 
-async def mqtt_loop():
+async def sync_clock():
+    # The RTC starts at 2021-01-01 on every boot; the schedule waits for
+    # the real time, and NTP keeps the RTC from drifting.
+    import ntptime
+    ntptime.host = Settings.ntp_host
     while True:
-        if mqtt_manager:
-            try:
-                mqtt_manager.check_msg()
-                mqtt_manager.publish_states()
-            except Exception as e:
-                print(f"MQTT error: {e}")
-                # Try to reconnect
-                await initialize_mqtt()
-        await uasyncio.sleep(1)
+        try:
+            ntptime.settime()
+        except OSError as e:
+            log.warning('NTP sync with %s failed: %s', Settings.ntp_host, e)
+            await uasyncio.sleep(60)
+            continue
+        dn33c08.clock_changed()
+        log.info('Clock set from %s', Settings.ntp_host)
+        await uasyncio.sleep(6 * 3600)
 
-async def main():
-    dn33c08.update_settings()
+async def supervise(name, start):
+    # Runs the service start() returns, and again whenever it fails or
+    # ends, with a growing pause between attempts.  Input processing never
+    # waits on a service, so a fault in one only costs that service.
+    pause = 1
+    while True:
+        try:
+            await start()
+            log.warning('%s stopped, restarting', name)
+        except Exception as e:
+            log.error('%s failed, restarting: %r', name, e)
+        await uasyncio.sleep(pause)
+        pause = min(pause * 2, 60)
 
+async def start_network():
+    # Networking attaches once Wi-Fi is up; relays work without it.
+    global assets, events, http
+    from WifiConnection import WifiConnection
     wifi = WifiConnection(dn33c08)
-    
-    wifi_task = uasyncio.create_task(wifi.start_and_maintain_connection())
-
-    while not (wifi.wlan and wifi.wlan.isconnected()):
-        await uasyncio.sleep(1)
-    if Settings.mqtt:   
-        await initialize_mqtt()
+    bootprof.mark('Wi-Fi setup')
+    services = [uasyncio.create_task(supervise('Wi-Fi', wifi.start_and_maintain_connection))]
+    await wifi.wait_connected()
+    bootprof.mark('Wi-Fi connected')
+    from HttpServer import HttpServer
+    from StaticAssets import StaticAssets
+    from EventStream import EventStream
+    http = HttpServer()
+    assets = StaticAssets()
+    assets.add('/', 'relays_overview.html', 'text/html')
+    assets.register_routes(http)
+    events = EventStream(dn33c08)
+    events.register_routes(http)
+    dn33c08.register_routes(http)
+    http.route('GET', '/metrics', serve_metrics)
+    services.append(uasyncio.create_task(supervise('Event stream', events.run)))
+    services.append(uasyncio.create_task(supervise('HTTP server', lambda: run_server(wifi))))
+    bootprof.mark('HTTP setup')
+    if Settings.schedule:
+        services.append(uasyncio.create_task(supervise('NTP sync', sync_clock)))
+    if Settings.udp:
+        from UdpControl import UdpControl
+        udp = UdpControl(dn33c08, Settings.udp_port, Settings.udp_key)
+        services.append(uasyncio.create_task(supervise('UDP control', udp.run)))
+        bootprof.mark('UDP setup')
+    if Settings.mqtt:
+        start_mqtt()
+        services.append(uasyncio.create_task(supervise('MQTT', mqtt_manager.run)))
+        bootprof.mark('MQTT setup')
+    log.info(bootprof.report())
+    try:
+        await uasyncio.gather(*services)
+    finally:
+        for task in services:
+            task.cancel()
 
-    io_task = uasyncio.create_task(dn33c08.process_input_queue())
-    server_task = uasyncio.create_task(run_server(wifi))
-    
+async def start_trace():
+    # Records raw input edges and relay states to inputs.trace for
+    # bench/replay.py; the previous boot's trace is kept as inputs.trace.1.
+    from inputtrace import TraceRecorder
+    register = dn33c08.relay_register
+    trace = TraceRecorder('inputs.trace', relay_state=register.state)
+    dn33c08.trace = trace
+    register.trace = trace
+    metrics.counter('input_trace_dropped_total', 'Trace records lost to a full ring', lambda: trace.dropped)
+    engine = dn33c08.engine
     try:
-        if Settings.mqtt:
-            mqtt_task = uasyncio.create_task(mqtt_loop())
-            await uasyncio.gather(io_task, wifi_task, server_task, mqtt_task)
-        else:
-            await uasyncio.gather(io_task, wifi_task, server_task) # , mqtt_task)
+        await trace.run(engine.post_call if engine is not None else None)
+    finally:
+        trace.flush()
 
+def start_engine():
+    # Inputs, relays, timers and the display move to core 1; this core
+    # keeps the network services.
+    from IOEngine import IOEngine
+    engine = IOEngine(dn33c08)
+    engine.start()
+    bootprof.mark('I/O engine on core 1')
+    return engine
+
+async def main():
+    snapshot.restore()
+    bootprof.mark('snapshot restore')
+    if Settings.dual_core:
+        io_task = uasyncio.create_task(start_engine().pump())
+    else:
+        io_task = uasyncio.create_task(dn33c08.process_input_queue())
+    # Everything else is supervised; only the I/O task ending ends main().
+    tasks = [uasyncio.create_task(supervise('Scene requests', dn33c08.scenes.run)),
+             uasyncio.create_task(supervise('Schedule state', dn33c08.schedule.run)),
+             uasyncio.create_task(supervise('Relay snapshot', snapshot.run)),
+             uasyncio.create_task(supervise('Settings saver', Settings.run_saver)),
+             uasyncio.create_task(supervise('Network', start_network))]
+    if Settings.input_trace:
+        tasks.append(uasyncio.create_task(supervise('Input trace', start_trace)))
+    try:
+        await io_task
     except Exception as e:
         print(f"Error in main loop: {e}")
         import sys
         sys.print_exception(e)
     finally:
-        if Settings.mqtt:
-            tasks = [io_task, wifi_task, server_task, mqtt_task]
-        else:
-            tasks = [io_task, wifi_task, server_task]
-            for task in tasks:
-                task.cancel()
+        io_task.cancel()
+        for task in tasks:
+            task.cancel()
         await uasyncio.sleep_ms(100)
 
 if __name__ == "__main__":
@@ -0,0 +1,76 @@
+# sim: run the DN33C08 firmware unchanged under CPython
+#
+#     import sim
+#     sim.install()          # before importing any firmware module
+#     from DN33C08 import DN33C08
+#
+# install() registers host stand-ins for machine, network, ntptime,
+# uasyncio, usocket and micropython, adds the MicroPython-only helpers to
+# time and sys, puts time's wall clock on the simulated RTC, and puts the
+# firmware root and lib/ on sys.path the way the board does.
+
+import json
+import os
+import sys
+import time
+import traceback
+import types
+
+from sim import clock as _clock_module
+from sim.clock import clock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LIB = os.path.join(ROOT, 'lib')
+
+_installed = False
+
+
+def _print_exception(exc, file=sys.stdout):
+    traceback.print_exception(type(exc), exc, exc.__traceback__, file=file)
+
+
+def install(realtime=False, credentials=('sim-ssid', 'sim-password')):
+    global _installed
+    clock.set_realtime(realtime)
+    if _installed:
+        return
+    _installed = True
+
+    from sim import machine, micropython, network, ntptime, uasyncio, usocket
+    sys.modules['machine'] = machine
+    sys.modules['network'] = network
+    sys.modules['ntptime'] = ntptime
+    sys.modules['uasyncio'] = uasyncio
+    sys.modules['usocket'] = usocket
+    sys.modules['micropython'] = micropython
+    sys.modules['ujson'] = json
+    sys.modules['utime'] = time
+
+    for name in ('ticks_ms', 'ticks_us', 'ticks_cpu', 'ticks_add', 'ticks_diff', 'sleep_ms', 'sleep_us',
+                 'time', 'time_ns', 'gmtime', 'localtime', 'mktime'):
+        setattr(time, name, getattr(_clock_module, name))
+    sys.print_exception = _print_exception
+
+    for path in (LIB, ROOT):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    if not os.path.exists(os.path.join(ROOT, 'NetworkCredentials.py')):
+        module = types.ModuleType('NetworkCredentials')
+        module.NetworkCredentials = type('NetworkCredentials', (), {'ssid': credentials[0], 'password': credentials[1]})
+        sys.modules['NetworkCredentials'] = module
+
+
+def reset():
+    # Fresh board: drop pin state, timers, the RTC, WLAN state and firmware modules.
+    from sim import machine, network, ntptime
+    clock.reset()
+    ntptime.fail = False
+    machine.Pin.reset_board()
+    machine.output_hooks.clear()
+    network.WLAN.reset()
+    for name in list(sys.modules):
+        module = sys.modules[name]
+        path = getattr(module, '__file__', None) or ''
+        if os.path.dirname(path) in (ROOT, LIB):
+            del sys.modules[name]
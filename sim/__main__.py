@@ -0,0 +1,42 @@
+# Boot a firmware script on the simulated board:
+#
+#     python -m sim                      # runs main.py in virtual time
+#     python -m sim --realtime main.py
+#     python -m sim --for-ms 60000 DN33C08.py
+
+import os
+import runpy
+import sys
+
+import sim
+
+
+def main(argv):
+    realtime = '--realtime' in argv
+    for_ms = None
+    args = [a for a in argv if a != '--realtime']
+    if '--for-ms' in args:
+        i = args.index('--for-ms')
+        for_ms = int(args[i + 1])
+        del args[i:i + 2]
+    script = args[0] if args else 'main.py'
+
+    sim.install(realtime=realtime)
+    if for_ms is not None:
+        import uasyncio
+        _run = uasyncio.run
+
+        def run_for(coro):
+            async def bounded():
+                try:
+                    await uasyncio.wait_for_ms(coro, for_ms)
+                except uasyncio.TimeoutError:
+                    print(f"sim: stopped after {for_ms} ms")
+            return _run(bounded())
+
+        uasyncio.run = run_for
+    runpy.run_path(os.path.join(sim.ROOT, script), run_name='__main__')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,166 @@
+# broker.py: minimal MQTT 3.1.1 broker for running MQTTManager on the host
+#
+#     python -m sim.broker [--port 1883]
+#
+# QoS 0 only: CONNECT with will, PUBLISH with retain, SUBSCRIBE with + and
+# # wildcards, PINGREQ and DISCONNECT.  It runs on plain asyncio, so it
+# can share the simulator's event loop with the firmware; `log` keeps
+# every (topic, payload, retain) it received for inspection.
+
+import asyncio
+import sys
+
+
+def topic_matches(pattern, topic):
+    parts = topic.split('/')
+    for i, level in enumerate(pattern.split('/')):
+        if level == '#':
+            return True
+        if i >= len(parts) or (level != '+' and level != parts[i]):
+            return False
+    return len(pattern.split('/')) == len(parts)
+
+
+def _string(s):
+    s = s.encode() if isinstance(s, str) else s
+    return len(s).to_bytes(2, 'big') + s
+
+
+def _packet(header, body):
+    length = bytearray()
+    n = len(body)
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        length.append(byte | 0x80 if n else byte)
+        if not n:
+            break
+    return bytes([header]) + bytes(length) + body
+
+
+class _Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.client_id = ''
+        self.subscriptions = []
+        self.will = None
+
+
+class Broker:
+    def __init__(self):
+        self.retained = {}
+        self.log = []
+        self.clients = []
+        self.connects = 0
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        # Close the listener and drop every client without a DISCONNECT,
+        # as a broker restart would.
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for client in list(self.clients):
+            client.writer.close()
+
+    def publish(self, topic, payload, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.log.append((topic, payload, retain))
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        packet = _packet(0x30, _string(topic) + payload)
+        for client in self.clients:
+            if any(topic_matches(p, topic) for p in client.subscriptions):
+                client.writer.write(packet)
+
+    async def _read_packet(self, reader):
+        header = (await reader.readexactly(1))[0]
+        length = shift = 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return header, await reader.readexactly(length) if length else b''
+
+    async def _serve(self, reader, writer):
+        client = _Client(writer)
+        clean = False
+        try:
+            header, body = await self._read_packet(reader)
+            if header != 0x10:
+                return
+            flags = body[7]
+            pos = 10
+            n = int.from_bytes(body[pos:pos + 2], 'big')
+            client.client_id = body[pos + 2:pos + 2 + n].decode()
+            pos += 2 + n
+            if flags & 0x04:
+                n = int.from_bytes(body[pos:pos + 2], 'big')
+                topic = body[pos + 2:pos + 2 + n].decode()
+                pos += 2 + n
+                n = int.from_bytes(body[pos:pos + 2], 'big')
+                client.will = (topic, body[pos + 2:pos + 2 + n], bool(flags & 0x20))
+            writer.write(b'\x20\x02\x00\x00')
+            self.clients.append(client)
+            self.connects += 1
+            while True:
+                header, body = await self._read_packet(reader)
+                kind = header & 0xF0
+                if kind == 0x30:
+                    n = int.from_bytes(body[:2], 'big')
+                    start = 2 + n + (2 if header & 0x06 else 0)
+                    self.publish(body[2:2 + n].decode(), body[start:], bool(header & 0x01))
+                elif kind == 0x80:
+                    pos = 2
+                    granted = bytearray()
+                    new = []
+                    while pos < len(body):
+                        n = int.from_bytes(body[pos:pos + 2], 'big')
+                        new.append(body[pos + 2:pos + 2 + n].decode())
+                        pos += 3 + n
+                        granted.append(0)
+                    client.subscriptions.extend(new)
+                    writer.write(_packet(0x90, body[:2] + granted))
+                    for topic, payload in self.retained.items():
+                        if any(topic_matches(p, topic) for p in new):
+                            writer.write(_packet(0x31, _string(topic) + payload))
+                elif kind == 0xC0:
+                    writer.write(b'\xd0\x00')
+                elif kind == 0xE0:
+                    clean = True
+                    return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            if client in self.clients:
+                self.clients.remove(client)
+            if client.will and not clean:
+                self.publish(*client.will)
+            writer.close()
+
+
+def main(argv):
+    port = int(argv[argv.index('--port') + 1]) if '--port' in argv else 1883
+
+    async def serve():
+        broker = Broker()
+        print(f"broker: listening on port {await broker.start('0.0.0.0', port)}")
+        while True:
+            await asyncio.sleep(3600)
+
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
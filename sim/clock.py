@@ -0,0 +1,160 @@
+# clock.py: shared clock for the host simulator
+#
+# In virtual mode time only moves when something advances it: the simulated
+# uasyncio loop jumps straight to the next deadline when it would otherwise
+# sleep, and machine.Timer callbacks fire as the clock passes them.  In
+# realtime mode the clock follows time.perf_counter() and Timer callbacks are
+# fired by the loop whenever they fall due.  Other threads (standing in for
+# the second core) may sleep on the realtime clock, but Timer callbacks
+# only ever fire on the main thread.
+#
+# The wall clock (time.time(), time.localtime(), machine.RTC) runs on the
+# same ticks from the rp2 RTC's power-up reading, 2021-01-01 00:00:00,
+# until something sets it, as ntptime.settime() does on the board.
+
+import calendar
+import heapq
+import threading
+import time as _time
+
+# The module-level ticks_* functions wrap like the rp2 port's; the clock's
+# own methods return the unwrapped count.
+TICKS_PERIOD = 1 << 30
+_TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALF = TICKS_PERIOD // 2
+
+POWER_UP_TIME = 1609459200
+
+# The host's own wall clock, kept before install() replaces time.time.
+host_time = _time.time
+_host_gmtime = _time.gmtime
+
+
+class VirtualClock:
+    def __init__(self):
+        self.realtime = False
+        self._us = 0
+        self._origin = _time.perf_counter()
+        self._timers = []  # heap of (deadline_us, seq, timer, generation)
+        self._seq = 0
+        self._wall_us = POWER_UP_TIME * 1000000  # wall clock at ticks 0
+
+    def set_realtime(self, realtime):
+        now = self.ticks_us()
+        self.realtime = realtime
+        self._origin = _time.perf_counter() - now / 1000000
+        self._us = now
+
+    def ticks_us(self):
+        if self.realtime:
+            return int((_time.perf_counter() - self._origin) * 1000000)
+        return self._us
+
+    def ticks_ms(self):
+        return self.ticks_us() // 1000
+
+    def wall_us(self):
+        return self._wall_us + self.ticks_us()
+
+    def set_wall(self, seconds):
+        self._wall_us = int(seconds * 1000000) - self.ticks_us()
+
+    def schedule(self, timer, deadline_us, generation):
+        self._seq += 1
+        heapq.heappush(self._timers, (deadline_us, self._seq, timer, generation))
+
+    def next_deadline(self):
+        while self._timers:
+            deadline, _, timer, generation = self._timers[0]
+            if timer._generation == generation:
+                return deadline
+            heapq.heappop(self._timers)
+        return None
+
+    def run_due(self):
+        self._run_until(self.ticks_us())
+
+    def advance_us(self, us):
+        target = self.ticks_us() + us
+        self._run_until(target)
+        if not self.realtime and self._us < target:
+            self._us = target
+
+    def advance(self, ms):
+        self.advance_us(int(ms * 1000))
+
+    def _run_until(self, target_us):
+        while self._timers and self._timers[0][0] <= target_us:
+            deadline, _, timer, generation = heapq.heappop(self._timers)
+            if timer._generation != generation:
+                continue
+            if not self.realtime and deadline > self._us:
+                self._us = deadline
+            timer._fire()
+
+    def reset(self):
+        self._us = 0
+        self._origin = _time.perf_counter()
+        self._timers = []
+        self._wall_us = POWER_UP_TIME * 1000000
+
+
+clock = VirtualClock()
+
+
+def ticks_ms():
+    return clock.ticks_ms() & _TICKS_MAX
+
+
+def ticks_us():
+    return clock.ticks_us() & _TICKS_MAX
+
+
+def ticks_cpu():
+    return clock.ticks_us() & _TICKS_MAX
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def sleep_ms(ms):
+    if clock.realtime:
+        _time.sleep(ms / 1000)
+        if threading.current_thread() is threading.main_thread():
+            clock.run_due()
+    else:
+        clock.advance(ms)
+
+
+def sleep_us(us):
+    if clock.realtime:
+        _time.sleep(us / 1000000)
+        if threading.current_thread() is threading.main_thread():
+            clock.run_due()
+    else:
+        clock.advance_us(us)
+
+
+def time():
+    return clock.wall_us() // 1000000
+
+
+def time_ns():
+    return clock.wall_us() * 1000
+
+
+def gmtime(secs=None):
+    # MicroPython's 8-tuple: (year, month, mday, hour, minute, second, weekday from Monday = 0, yearday).
+    return tuple(_host_gmtime(time() if secs is None else secs)[:8])
+
+
+localtime = gmtime
+
+
+def mktime(t):
+    return calendar.timegm(tuple(t[:6]))
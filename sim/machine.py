@@ -0,0 +1,255 @@
+# machine.py: host stand-in for the rp2 machine module
+#
+# Pins are singletons per GPIO number, like on the rp2 port, so an IRQ
+# handler receives the same object that was configured.  Inputs are driven
+# from the outside with Pin.drive(); outputs report every write, changed or
+# not, to the callables in output_hooks as hook(pin_id, level).
+
+from sim.clock import clock, gmtime, mktime
+
+output_hooks = []
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+    LOW_POWER = 1
+    HIGH_POWER = 2
+
+    _board = {}
+
+    def __new__(cls, id, *args, **kwargs):
+        pin = cls._board.get(id)
+        if pin is None:
+            pin = object.__new__(cls)
+            pin._id = id
+            pin._mode = cls.IN
+            pin._pull = None
+            pin._level = 0
+            pin._external = None
+            pin._handler = None
+            pin._trigger = 0
+            cls._board[id] = pin
+        return pin
+
+    def __init__(self, id, mode=-1, pull=-1, value=None, **kwargs):
+        self.init(mode, pull, value)
+
+    def init(self, mode=-1, pull=-1, value=None, **kwargs):
+        if mode != -1:
+            self._mode = mode
+        if pull != -1:
+            self._pull = pull
+        if value is not None:
+            self._write(value)
+        elif self._mode == self.IN:
+            self._level = self._input_level()
+
+    def __repr__(self):
+        return f"Pin({self._id})"
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def _input_level(self):
+        if self._external is not None:
+            return self._external
+        if self._pull == self.PULL_UP:
+            return 1
+        return 0
+
+    def _write(self, value):
+        level = 1 if value else 0
+        self._level = level
+        for hook in output_hooks:
+            hook(self._id, level)
+
+    def value(self, value=None):
+        if value is None:
+            if self._mode == self.IN:
+                return self._input_level()
+            return self._level
+        self._write(value)
+
+    def on(self):
+        self._write(1)
+
+    def off(self):
+        self._write(0)
+
+    def high(self):
+        self._write(1)
+
+    def low(self):
+        self._write(0)
+
+    def toggle(self):
+        self._write(not self._level)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        self._handler = handler
+        self._trigger = trigger if handler is not None else 0
+        return self
+
+    def drive(self, level):
+        # Simulate an external source pulling the pin to `level`.
+        old = self._input_level()
+        self._external = 1 if level else 0
+        new = self._external
+        if old == new or self._handler is None:
+            return
+        if (new == 0 and self._trigger & self.IRQ_FALLING) or (new == 1 and self._trigger & self.IRQ_RISING):
+            self._handler(self)
+
+    def release(self):
+        # Stop driving the pin and fall back to its pull resistor.
+        self.drive(1 if self._pull == self.PULL_UP else 0)
+        self._external = None
+
+    @classmethod
+    def reset_board(cls):
+        cls._board = {}
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1, *, mode=PERIODIC, period=-1, freq=-1, tick_hz=1000, callback=None):
+        self._generation = 0
+        self._mode = mode
+        self._period_us = 0
+        self._callback = None
+        self._deadline = 0
+        if callback is not None:
+            self.init(mode=mode, period=period, freq=freq, tick_hz=tick_hz, callback=callback)
+
+    def init(self, *, mode=PERIODIC, period=-1, freq=-1, tick_hz=1000, callback=None):
+        self.deinit()
+        if freq > 0:
+            period_us = int(1000000 / freq)
+        else:
+            period_us = int(period * 1000000 / tick_hz)
+        self._mode = mode
+        self._period_us = max(period_us, 1)
+        self._callback = callback
+        self._arm(clock.ticks_us() + self._period_us)
+
+    def _arm(self, deadline):
+        self._deadline = deadline
+        clock.schedule(self, deadline, self._generation)
+
+    def deinit(self):
+        self._generation += 1
+
+    def _fire(self):
+        if self._mode == self.PERIODIC:
+            self._arm(self._deadline + self._period_us)
+        else:
+            self._generation += 1
+        if self._callback is not None:
+            self._callback(self)
+
+
+class RTC:
+    # The RP2040 RTC, on the simulator's wall clock.  datetime() tuples are
+    # (year, month, day, weekday, hours, minutes, seconds, subseconds).
+    def datetime(self, datetimetuple=None):
+        if datetimetuple is None:
+            year, month, day, hours, minutes, seconds, weekday, _ = gmtime()
+            return (year, month, day, weekday, hours, minutes, seconds, 0)
+        year, month, day, _, hours, minutes, seconds, _ = datetimetuple
+        clock.set_wall(mktime((year, month, day, hours, minutes, seconds)))
+
+
+class SPI:
+    # Records what was shifted out instead of toggling the pins.
+    def __init__(self, id, baudrate=1000000, *, polarity=0, phase=0, bits=8, firstbit=0, sck=None, mosi=None, miso=None):
+        self.id = id
+        self.baudrate = baudrate
+        self.bytes_written = 0
+        self.last = b''
+
+    def init(self, baudrate=1000000, **kwargs):
+        self.baudrate = baudrate
+
+    def write(self, buf):
+        self.bytes_written += len(buf)
+        self.last = bytes(buf)
+
+    def deinit(self):
+        pass
+
+
+class _Mem32:
+    # The SIO GPIO registers of the RP2040, backed by the simulated pins.
+    SIO_BASE = 0xd0000000
+    GPIO_IN = SIO_BASE + 0x04
+    GPIO_OUT = SIO_BASE + 0x10
+    GPIO_OUT_SET = SIO_BASE + 0x14
+    GPIO_OUT_CLR = SIO_BASE + 0x18
+    GPIO_OUT_XOR = SIO_BASE + 0x1c
+
+    def __getitem__(self, addr):
+        value = 0
+        for gpio, pin in Pin._board.items():
+            if addr == self.GPIO_IN:
+                level = pin.value() if pin._mode == Pin.IN else pin._level
+            elif addr == self.GPIO_OUT:
+                level = pin._level
+            else:
+                raise OSError(f"mem32: unmapped address {addr:#x}")
+            if level:
+                value |= 1 << gpio
+        return value
+
+    def __setitem__(self, addr, value):
+        if addr == self.GPIO_OUT:
+            for gpio, pin in list(Pin._board.items()):
+                pin._write((value >> gpio) & 1)
+            return
+        if addr not in (self.GPIO_OUT_SET, self.GPIO_OUT_CLR, self.GPIO_OUT_XOR):
+            raise OSError(f"mem32: unmapped address {addr:#x}")
+        for gpio in range(30):
+            if not (value >> gpio) & 1:
+                continue
+            pin = Pin(gpio)
+            if addr == self.GPIO_OUT_SET:
+                pin._write(1)
+            elif addr == self.GPIO_OUT_CLR:
+                pin._write(0)
+            else:
+                pin._write(not pin._level)
+
+
+mem32 = _Mem32()
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state):
+    pass
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def unique_id():
+    return b'\xe6\x61\x38\x33\xc0\x8e\xa2\x2c'
+
+
+def idle():
+    pass
+
+
+def reset():
+    raise SystemExit("machine.reset()")
@@ -0,0 +1,36 @@
+# micropython.py: host stand-in for the micropython module
+
+import asyncio
+
+
+def const(expr):
+    return expr
+
+
+def schedule(func, arg):
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        func(arg)
+        return
+    loop.call_soon(func, arg)
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def mem_info(verbose=False):
+    pass
+
+
+def opt_level(level=None):
+    return 0
+
+
+def heap_lock():
+    return 0
+
+
+def heap_unlock():
+    return 0
@@ -0,0 +1,107 @@
+# network.py: host stand-in for the network module of the Pico W
+#
+# The access point is simulated: connect() succeeds after WLAN.scan_ms plus
+# WLAN.connect_ms of virtual time (connect_ms alone when pinned to a BSSID)
+# as long as WLAN.ap_available is set and any pinned BSSID is WLAN.bssid,
+# otherwise the status ends in STAT_NO_AP_FOUND.  Tests and benchmarks flip
+# these class attributes to provoke outages.
+
+from sim.clock import clock
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+
+class WLAN:
+    ap_available = True
+    scan_ms = 1000
+    connect_ms = 500
+    bssid = b'\x10\x20\x30\x40\x50\x60'
+    dhcp_lease = ('192.168.1.100', '255.255.255.0', '192.168.1.1', '192.168.1.1')
+
+    _interfaces = {}
+
+    def __new__(cls, interface_id=STA_IF):
+        wlan = cls._interfaces.get(interface_id)
+        if wlan is None:
+            wlan = object.__new__(cls)
+            wlan._active = False
+            wlan._status = STAT_IDLE
+            wlan._connect_at = None
+            wlan._pinned = None
+            wlan._ifconfig = ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+            wlan._config = {'mac': b'\x28\xcd\xc1\x00\x00\x01', 'channel': 0, 'ssid': '', 'hostname': 'PicoW'}
+            cls._interfaces[interface_id] = wlan
+        return wlan
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+        self._active = bool(is_active)
+        if not self._active:
+            self._status = STAT_IDLE
+            self._connect_at = None
+
+    def connect(self, ssid=None, key=None, *, bssid=None):
+        if not self._active:
+            raise OSError("WLAN not active")
+        self._config['ssid'] = ssid
+        self._status = STAT_CONNECTING
+        self._connect_at = clock.ticks_ms() + self.connect_ms
+        self._pinned = bssid
+        if bssid is None:
+            self._connect_at += self.scan_ms
+
+    def disconnect(self):
+        self._status = STAT_IDLE
+        self._connect_at = None
+
+    def _update(self):
+        if self._status == STAT_GOT_IP and not self.ap_available:
+            self._status = STAT_NO_AP_FOUND
+        if self._status == STAT_CONNECTING and clock.ticks_ms() >= self._connect_at:
+            if self.ap_available and self._pinned in (None, self.bssid):
+                self._status = STAT_GOT_IP
+                self._ifconfig = self.dhcp_lease
+                self._config['channel'] = 6
+                self._config['bssid'] = self.bssid
+            else:
+                self._status = STAT_NO_AP_FOUND
+
+    def status(self, param=None):
+        self._update()
+        if param == 'rssi':
+            return -55
+        return self._status
+
+    def isconnected(self):
+        return self.status() == STAT_GOT_IP
+
+    def ifconfig(self, config=None):
+        if config is None:
+            return self._ifconfig
+        if config == 'dhcp':
+            self._ifconfig = self.dhcp_lease
+        else:
+            self._ifconfig = tuple(config)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config[args[0]]
+        self._config.update(kwargs)
+
+    def scan(self):
+        if not self.ap_available:
+            return []
+        return [(self._config['ssid'].encode(), self.bssid, 6, -55, 3, 0)]
+
+    @classmethod
+    def reset(cls):
+        cls._interfaces = {}
@@ -0,0 +1,21 @@
+# ntptime.py: host stand-in for MicroPython's ntptime module
+#
+# settime() sets the simulated RTC (sim.clock) to the host's UTC time, as a
+# successful query of `host` would on the board.  Set fail to make it raise
+# OSError(ETIMEDOUT) like an unreachable server.
+
+from sim.clock import clock, host_time
+
+host = 'pool.ntp.org'
+timeout = 1
+fail = False
+
+
+def time():
+    if fail:
+        raise OSError(110)
+    return int(host_time())
+
+
+def settime():
+    clock.set_wall(time())
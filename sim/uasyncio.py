@@ -0,0 +1,214 @@
+# uasyncio.py: host stand-in for MicroPython's uasyncio, built on asyncio
+#
+# The event loop takes its time from sim.clock.  In virtual mode, whenever
+# the loop would block it advances the clock to the next asyncio or
+# machine.Timer deadline instead of sleeping, so a simulated hour of relay
+# timers runs in milliseconds.  Streams follow MicroPython semantics, where
+# wait_closed() also closes the connection.
+
+import asyncio
+import math
+import selectors
+import threading
+
+from asyncio import (CancelledError, Event, Lock, Task, TimeoutError,
+                     create_task, current_task, gather, sleep, wait_for)
+
+from sim.clock import clock
+
+
+def sleep_ms(ms):
+    return asyncio.sleep(ms / 1000)
+
+
+def wait_for_ms(aw, ms):
+    return asyncio.wait_for(aw, ms / 1000)
+
+
+class _SimSelector(selectors.DefaultSelector):
+    def select(self, timeout=None):
+        clock.run_due()
+        deadline = clock.next_deadline()
+        if deadline is not None:
+            until_timer = max(0, deadline - clock.ticks_us()) / 1000000
+            timeout = until_timer if timeout is None else min(timeout, until_timer)
+        if clock.realtime:
+            events = super().select(timeout)
+            clock.run_due()
+            return events
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # Nothing scheduled at all; only another thread can wake us.
+            return super().select(None)
+        clock.advance_us(math.ceil(timeout * 1000000))
+        return []
+
+
+class _SimLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        super().__init__(_SimSelector())
+
+    def time(self):
+        return clock.ticks_us() / 1000000
+
+
+def new_event_loop():
+    loop = _SimLoop()
+    asyncio.set_event_loop(loop)
+    return loop
+
+
+def get_event_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return new_event_loop()
+
+
+def run(coro):
+    loop = new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+        asyncio.set_event_loop(None)
+
+
+class ThreadSafeFlag:
+    def __init__(self):
+        self._flag = False
+        self._event = None
+        self._loop = None
+
+    def set(self):
+        self._flag = True
+        loop = self._loop
+        if loop is None:
+            return
+        if threading.get_ident() == loop._thread_id:
+            self._event.set()
+        else:
+            loop.call_soon_threadsafe(self._event.set)
+
+    def clear(self):
+        self._flag = False
+
+    async def wait(self):
+        if self._event is None:
+            self._loop = asyncio.get_running_loop()
+            self._event = asyncio.Event()
+        while not self._flag:
+            self._event.clear()
+            await self._event.wait()
+        self._flag = False
+
+
+class Stream:
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+
+    def get_extra_info(self, name):
+        return self._writer.get_extra_info(name)
+
+    async def read(self, n=-1):
+        return await self._reader.read(n)
+
+    async def readexactly(self, n):
+        return await self._reader.readexactly(n)
+
+    async def readline(self):
+        return await self._reader.readline()
+
+    def write(self, buf):
+        self._writer.write(buf)
+
+    async def drain(self):
+        try:
+            await self._writer.drain()
+        except ConnectionError:
+            pass
+
+    def close(self):
+        self._writer.close()
+
+    async def wait_closed(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    awrite = None  # set below
+
+
+async def _awrite(self, buf, off=0, sz=-1):
+    if sz == -1:
+        sz = len(buf) - off
+    self.write(buf[off:off + sz])
+    await self.drain()
+
+
+Stream.awrite = _awrite
+StreamReader = Stream
+StreamWriter = Stream
+
+
+class _NullStream:
+    # Connection to a host off the simulated board: accepts writes, reads EOF.
+    def get_extra_info(self, name):
+        return None
+
+    async def read(self, n=-1):
+        return b''
+
+    async def readexactly(self, n):
+        raise EOFError
+
+    async def readline(self):
+        return b''
+
+    def write(self, buf):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+    async def awrite(self, buf, off=0, sz=-1):
+        pass
+
+
+async def open_connection(host, port):
+    # Only loopback is real.  Anything else (the Wi-Fi probe, a broker on
+    # the LAN) connects while the simulated station has an IP and is
+    # unreachable otherwise, so virtual time never races the real network.
+    if host not in ('127.0.0.1', 'localhost'):
+        from sim import network
+        if not network.WLAN(network.STA_IF).isconnected():
+            raise OSError(113, 'EHOSTUNREACH')
+        stream = _NullStream()
+        return stream, stream
+    reader, writer = await asyncio.open_connection(host, port)
+    stream = Stream(reader, writer)
+    return stream, stream
+
+
+async def start_server(cb, host, port, backlog=5):
+    async def _client(reader, writer):
+        stream = Stream(reader, writer)
+        await cb(stream, stream)
+
+    return await asyncio.start_server(_client, host, port, backlog=backlog)
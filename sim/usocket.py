@@ -0,0 +1,32 @@
+# usocket.py: host stand-in for MicroPython's usocket
+#
+# CPython sockets plus the lwIP port's socket option 20 at SOL_SOCKET:
+# setsockopt(SOL_SOCKET, 20, handler) has the event loop call
+# handler(sock) whenever the socket is readable, and None removes it.
+
+import asyncio
+import socket as _socket
+from socket import *  # noqa: F401,F403
+
+_SO_REGISTER_HANDLER = 20
+
+
+class socket(_socket.socket):
+    _handler_loop = None
+
+    def setsockopt(self, level, optname, value):
+        if level == SOL_SOCKET and optname == _SO_REGISTER_HANDLER:
+            if self._handler_loop is not None:
+                self._handler_loop.remove_reader(self)
+                self._handler_loop = None
+            if value is not None:
+                self._handler_loop = asyncio.get_event_loop()
+                self._handler_loop.add_reader(self, value, self)
+            return
+        super().setsockopt(level, optname, value)
+
+    def close(self):
+        if self._handler_loop is not None and not self._handler_loop.is_closed():
+            self._handler_loop.remove_reader(self)
+        self._handler_loop = None
+        super().close()
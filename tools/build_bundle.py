@@ -0,0 +1,92 @@
+# build_bundle.py: precompile the firmware into a deployable bundle
+#
+#     python tools/build_bundle.py [--out build/bundle] [--mpy-cross PATH] [--manifest]
+#
+# Compiles every firmware module with mpy-cross into <out>/, lib/ modules
+# into <out>/lib/, and copies main.py (MicroPython only runs main.py from
+# source), and the web assets alongside, each with a .gz variant freshly
+# compressed from it (a .gz left next to the source is ignored).  Copy the
+# contents of <out> to the board's filesystem, e.g. with
+# `mpremote cp -r build/bundle/. :`, after removing the old .py files.
+#
+# mpy-cross must match the firmware's bytecode version; install it with
+# `pip install mpy-cross==<firmware version>` or pass --mpy-cross.
+# --manifest also writes <out>/manifest.py for freezing the same modules
+# into a custom firmware build (FROZEN_MANIFEST=...).
+
+import os
+import shutil
+import subprocess
+import sys
+
+from compress_assets import compress
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY = 'main.py'
+# Board-side configuration the user edits; shipped as source.
+SOURCE_ONLY = ('NetworkCredentials.py', 'config.py')
+ASSETS = ('relays_overview.html',)
+
+
+def firmware_modules():
+    modules = []
+    for name in sorted(os.listdir(ROOT)):
+        if name.endswith('.py') and name != ENTRY and name not in SOURCE_ONLY:
+            modules.append(name)
+    lib = [os.path.join('lib', name) for name in sorted(os.listdir(os.path.join(ROOT, 'lib')))
+           if name.endswith('.py')]
+    return modules + lib
+
+
+def find_mpy_cross(explicit):
+    if explicit:
+        return [explicit]
+    if shutil.which('mpy-cross'):
+        return ['mpy-cross']
+    try:
+        import mpy_cross
+    except ImportError:
+        sys.exit('mpy-cross not found: pip install mpy-cross, or pass --mpy-cross PATH')
+    return [mpy_cross.mpy_cross]
+
+
+def build(out, mpy_cross, manifest):
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    os.makedirs(os.path.join(out, 'lib'))
+    total_src = total_mpy = 0
+    modules = firmware_modules()
+    for module in modules:
+        src = os.path.join(ROOT, module)
+        dst = os.path.join(out, module[:-3] + '.mpy')
+        subprocess.run(mpy_cross + ['-o', dst, src], check=True)
+        total_src += os.path.getsize(src)
+        total_mpy += os.path.getsize(dst)
+        print(f'{module}: {os.path.getsize(src)} -> {os.path.getsize(dst)} bytes')
+    copied = [ENTRY] + [name for name in SOURCE_ONLY if os.path.exists(os.path.join(ROOT, name))]
+    copied += ASSETS
+    for name in copied:
+        shutil.copy(os.path.join(ROOT, name), os.path.join(out, name))
+    for asset in ASSETS:
+        raw, packed = compress(os.path.join(ROOT, asset), os.path.join(out, asset + '.gz'))
+        print(f'{asset}: {raw} -> {packed} bytes gzipped')
+    if manifest:
+        with open(os.path.join(out, 'manifest.py'), 'w') as file:
+            file.write('include("$(PORT_DIR)/boards/manifest.py")\n')
+            top = [m for m in modules if not m.startswith('lib')]
+            file.write(f'freeze({ROOT!r}, {tuple(top)!r})\n')
+            lib = [os.path.basename(m) for m in modules if m.startswith('lib')]
+            file.write(f'freeze({os.path.join(ROOT, "lib")!r}, {tuple(lib)!r})\n')
+    print(f'{len(modules)} modules: {total_src} bytes of source -> {total_mpy} bytes of .mpy in {out}')
+
+
+def main(argv):
+    out = os.path.join(ROOT, 'build', 'bundle')
+    if '--out' in argv:
+        out = os.path.abspath(argv[argv.index('--out') + 1])
+    explicit = argv[argv.index('--mpy-cross') + 1] if '--mpy-cross' in argv else None
+    build(out, find_mpy_cross(explicit), '--manifest' in argv)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,35 @@
+# compress_assets.py: build the gzip variants served by StaticAssets
+#
+#     python tools/compress_assets.py [file ...]
+#
+# Writes <file>.gz next to each asset (relays_overview.html by default).
+# Upload the .gz files to the board together with the originals.
+
+import gzip
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASSETS = ('relays_overview.html',)
+
+
+def compress(path, out=None):
+    # Writes out (<path>.gz by default); returns the sizes before and after.
+    with open(path, 'rb') as file:
+        raw = file.read()
+    # mtime=0 keeps the output, and so the ETag, stable across builds.
+    packed = gzip.compress(raw, compresslevel=9, mtime=0)
+    with open(out or path + '.gz', 'wb') as file:
+        file.write(packed)
+    return len(raw), len(packed)
+
+
+def main(argv):
+    paths = argv or [os.path.join(ROOT, name) for name in ASSETS]
+    for path in paths:
+        raw, packed = compress(path)
+        print(f'{os.path.relpath(path, ROOT)}: {raw} -> {packed} bytes')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
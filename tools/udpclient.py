@@ -0,0 +1,188 @@
+# udpclient.py: host client for the board's UDP control protocol
+#
+#     python tools/udpclient.py HOST [--port 5555] [--key KEY] query
+#     python tools/udpclient.py HOST set|clear|toggle RELAY [RELAY ...]
+#     python tools/udpclient.py HOST pulse RELAY MS
+#     python tools/udpclient.py HOST watch
+#
+# Speaks the datagram format described in UdpControl.py.  Requests are
+# retried with the same sequence number until a reply arrives, which the
+# board answers from its cache instead of applying twice.  With a key, a
+# request the board finds stale (another client using the key moved the
+# sequence on) is sent again after the board's last number.  watch
+# subscribes and prints every relay change, renewing the lease as it goes.
+#
+# As a library:
+#
+#     client = UdpClient('192.168.1.253', key='secret')
+#     status, state, version = client.command(toggle=0b1)
+
+import hashlib
+import hmac
+import random
+import socket
+import struct
+import sys
+import time
+
+MAGIC = b'DN'
+VERSION = 1
+T_COMMAND = 1
+T_QUERY = 2
+T_SUBSCRIBE = 3
+T_UNSUBSCRIBE = 4
+T_REPLY = 0x81
+T_NOTIFY = 0x82
+S_STALE = 3
+STATUS = {0: 'ok', 1: 'bad request', 2: 'busy', 3: 'stale'}
+
+_HEADER = '<2sBBH'
+_COMMAND = '<BBBBI'
+_STATUS = '<BBI'
+_MAC_SIZE = 8
+
+
+class UdpClient:
+    def __init__(self, host, port=5555, key=None, timeout=0.5, retries=3):
+        self.addr = (host, port)
+        self.key = key.encode() if isinstance(key, str) else key
+        self.timeout = timeout
+        self.retries = retries
+        self.seq = random.getrandbits(16)
+        self.notifications = []  # (seq, changed, state, version) seen while waiting for replies
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def close(self):
+        self.sock.close()
+
+    def _seal(self, message):
+        if self.key:
+            message += hmac.new(self.key, message, hashlib.sha256).digest()[:_MAC_SIZE]
+        return message
+
+    def _open(self, data):
+        # (type, seq, a, b, version) or None for anything that does not verify.
+        if self.key:
+            data, mac = data[:-_MAC_SIZE], data[-_MAC_SIZE:]
+            if not hmac.compare_digest(hmac.new(self.key, data, hashlib.sha256).digest()[:_MAC_SIZE], mac):
+                return None
+        if len(data) != 12:
+            return None
+        magic, version, kind, seq = struct.unpack_from(_HEADER, data)
+        if magic != MAGIC or version != VERSION:
+            return None
+        return (kind, seq) + struct.unpack_from(_STATUS, data, 6)
+
+    def request(self, kind, payload=b''):
+        # Returns (status, relay state, register version).
+        status, state, version = self._request(kind, payload)
+        if status == S_STALE:
+            self.seq = version & 0xFFFF
+            status, state, version = self._request(kind, payload)
+        return status, state, version
+
+    def _request(self, kind, payload):
+        self.seq = (self.seq + 1) & 0xFFFF
+        message = self._seal(struct.pack(_HEADER, MAGIC, VERSION, kind, self.seq) + payload)
+        for _ in range(self.retries + 1):
+            self.sock.sendto(message, self.addr)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.sock.settimeout(remaining)
+                try:
+                    data, _ = self.sock.recvfrom(64)
+                except socket.timeout:
+                    break
+                reply = self._open(data)
+                if reply is None:
+                    continue
+                if reply[0] == T_NOTIFY:
+                    self.notifications.append(reply[1:])
+                elif reply[0] == T_REPLY and reply[1] == self.seq:
+                    return reply[2:]
+        raise TimeoutError('no reply from %s:%d' % self.addr)
+
+    def command(self, set=0, clear=0, toggle=0, pulse=0, pulse_ms=0):
+        return self.request(T_COMMAND, struct.pack(_COMMAND, set, clear, toggle, pulse, pulse_ms))
+
+    def query(self):
+        return self.request(T_QUERY)
+
+    def subscribe(self):
+        return self.request(T_SUBSCRIBE)
+
+    def unsubscribe(self):
+        return self.request(T_UNSUBSCRIBE)
+
+    def wait_notification(self, timeout):
+        # Next (seq, changed, state, version) notification, or None.
+        if self.notifications:
+            return self.notifications.pop(0)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            self.sock.settimeout(remaining)
+            try:
+                data, _ = self.sock.recvfrom(64)
+            except socket.timeout:
+                return None
+            message = self._open(data)
+            if message is not None and message[0] == T_NOTIFY:
+                return message[1:]
+
+
+def _mask(relays):
+    mask = 0
+    for relay in relays:
+        mask |= 1 << (int(relay) - 1)
+    return mask
+
+
+def _states(state):
+    return ' '.join('%d:%s' % (r + 1, 'on' if state >> r & 1 else 'off') for r in range(8))
+
+
+def main(argv):
+    args = list(argv)
+    options = {}
+    for name in ('--port', '--key'):
+        if name in args:
+            i = args.index(name)
+            options[name] = args[i + 1]
+            del args[i:i + 2]
+    if len(args) < 2:
+        print('usage: udpclient.py HOST [--port N] [--key KEY] query|set|clear|toggle|pulse|watch [ARGS]')
+        return 2
+    host, op, rest = args[0], args[1], args[2:]
+    client = UdpClient(host, int(options.get('--port', 5555)), options.get('--key'))
+    if op == 'query':
+        status, state, version = client.query()
+    elif op in ('set', 'clear', 'toggle'):
+        status, state, version = client.command(**{op: _mask(rest)})
+    elif op == 'pulse':
+        status, state, version = client.command(pulse=_mask(rest[:1]), pulse_ms=int(rest[1]))
+    elif op == 'watch':
+        client.subscribe()
+        renew = time.monotonic() + 30
+        while True:
+            message = client.wait_notification(max(0, renew - time.monotonic()))
+            if message is None:
+                client.subscribe()
+                renew = time.monotonic() + 30
+                continue
+            seq, changed, state, version = message
+            print('v%d changed %s  %s' % (version, bin(changed), _states(state)))
+    else:
+        print('Unknown operation: %s' % op)
+        return 2
+    print('%s, v%d  %s' % (STATUS.get(status, status), version, _states(state)))
+    return 0 if status == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))